@@ -1,14 +1,32 @@
 import streamlit as st
 import pandas as pd
-import requests
-from datetime import datetime, timedelta
-from io import BytesIO
-from msal import ConfidentialClientApplication
+from datetime import datetime
 import logging
-import json
+import os
 import uuid
 import time
-from dateutil.relativedelta import relativedelta
+import random
+
+from bonificacao.armazenamento import ArmazenamentoLocal
+from bonificacao.arquivo_envios import hash_conteudo, nome_arquivo_envio
+from bonificacao.autenticacao import obter_provedor
+from bonificacao.cache_leituras import abas_em_cache, ler_aba_em_cache, obter_cache, validar_em_cache
+from bonificacao.cache_local import CacheConsolidado
+from bonificacao.compactacao import concatenar
+from bonificacao.consolidador import (ARQUIVO_CONSOLIDADO, PASTA_CONSOLIDADO, PASTA_ENVIOS_BACKUPS,
+                                      ConsolidadorSharePoint, preparar_dados_novos)
+from bonificacao.deltas import INTERVALO_COMPACTACAO_SEGUNDOS, CompactadorDeltas
+from bonificacao.esquema import COLUNAS_OBRIGATORIAS
+from bonificacao.fila import FilaConsolidacao
+from bonificacao.lote import ler_e_validar_arquivos
+from bonificacao.excel import gerar_xlsx, ler_planilha
+from bonificacao.graph import ConflitoEtag, cliente_padrao
+from bonificacao.historico import fim_do_minuto
+from bonificacao.impressoes import comparar_particoes, separar_inalteradas
+from bonificacao.instrumentacao import DIRETORIO_METRICAS, TIPO_GRAPH, etapa, execucao_medida, obter_registro
+from bonificacao.motor import chaves_lojas_meses, mascara_lojas_meses
+from bonificacao.resumo import origem_particoes
+from bonificacao.validacao import avaliar_planilha, linhas_excel
 
 # ===========================
 # CONFIGURAÇÕES DE VERSÃO
@@ -30,43 +48,57 @@ logger = logging.getLogger(__name__)
 CREDENCIAIS_OK = False
 CREDENCIAL_FALTANDO = ""
 
-try:
-    CLIENT_ID = st.secrets["CLIENT_ID"]
-    CLIENT_SECRET = st.secrets["CLIENT_SECRET"]
-    TENANT_ID = st.secrets["TENANT_ID"]
-    EMAIL_ONEDRIVE = st.secrets["EMAIL_ONEDRIVE"]
-    SITE_ID = st.secrets["SITE_ID"]
-    DRIVE_ID = st.secrets["DRIVE_ID"]
-    CREDENCIAIS_OK = True
-    logger.info("Credenciais carregadas com sucesso")
-except KeyError as e:
-    CREDENCIAL_FALTANDO = str(e)
-    logger.error(f"Credencial faltando: {e}")
+# Drive em um diretório local com a mesma estrutura de pastas, sem SharePoint
+# nem credenciais (ensaios e medições; bonificacao/armazenamento.py)
+DRIVE_LOCAL = os.environ.get("BONIFICACAO_DRIVE_LOCAL")
 
-# ===========================
-# ESTRUTURA DE COLUNAS ESPERADA
-# ===========================
-COLUNAS_OBRIGATORIAS = [
-    'GRUPO', 'CONCESSIONÁRIA', 'LOJA', 'FUNÇÃO', 'NOME', 'DATA', 
-    'FORMA PAG', 'CARTÃO / PIX',
-    'TMO_DUTO', 'R$_DUTO', 'EXTRA_DUTO', 'TOTAL_DUTO',
-    'TMO_FREIO', 'R$_FREIO', 'EXTRA_FREIO', 'TOTAL_FREIO',
-    'TMO_SANIT', 'R$_SANIT', 'EXTRA_SANIT', 'TOTAL_SANIT',
-    'TMO_VERNIZ', 'R$_VERNIZ', 'EXTRA_VERNIZ', 'TOTAL_VERNIZ',
-    'TMO_CX EVAP', 'R$_CX EVAP', 'EXTRA_CX EVAP', 'TOTAL_CX EVAP',
-    'TMO_PROTEC', 'R$_PROTEC', 'EXTRA_PROTEC', 'TOTAL_PROTEC',
-    'TMO_VC GREEN', 'R$_VC GREEN', 'EXTRA_VC GREEN', 'TOTAL_VC GREEN',
-    'TMO_NITROGÊNIO', 'R$_NITROGÊNIO', 'EXTRA_NITROGÊNIO', 'TOTAL_NITROGÊNIO',
-    'TMO_TOTAL', 'R$_TOTAL', 'STATUS', 'PAGO', 'A PAGAR', 'PIX'
-]
+if DRIVE_LOCAL:
+    SITE_ID = DRIVE_ID = "local"
+    CREDENCIAIS_OK = True
+    logger.info(f"Drive local em {DRIVE_LOCAL}: credenciais do Graph não utilizadas")
+else:
+    try:
+        CLIENT_ID = st.secrets["CLIENT_ID"]
+        CLIENT_SECRET = st.secrets["CLIENT_SECRET"]
+        TENANT_ID = st.secrets["TENANT_ID"]
+        EMAIL_ONEDRIVE = st.secrets["EMAIL_ONEDRIVE"]
+        SITE_ID = st.secrets["SITE_ID"]
+        DRIVE_ID = st.secrets["DRIVE_ID"]
+        CREDENCIAIS_OK = True
+        logger.info("Credenciais carregadas com sucesso")
+    except KeyError as e:
+        CREDENCIAL_FALTANDO = str(e)
+        logger.error(f"Credencial faltando: {e}")
 
 # ===========================
 # CONFIGURAÇÃO DE PASTAS
 # ===========================
-PASTA_CONSOLIDADO = "Documentos Compartilhados/LimparAuto/FontedeDados"
-PASTA_ENVIOS_BACKUPS = "Documentos Compartilhados/PlanilhasEnviadas_Backups/Bonificacao"
-ARQUIVO_LOCK = "sistema_lock_bonificacao.json"
-TIMEOUT_LOCK_MINUTOS = 10
+# Pastas, consolidado e lock no drive: constantes em bonificacao/consolidador.py,
+# compartilhadas com a linha de comando (python -m bonificacao.cli)
+
+# Cache local do consolidado (bytes + DataFrame), validado pelo eTag do drive
+CACHE_CONSOLIDADO = CacheConsolidado()
+
+# "xlsx": o consolidado xlsx é a fonte da verdade e é regravado a cada envio
+# "particoes": Parquet por LOJA/MES_ANO em PASTA_CONSOLIDADO/particoes é a
+#              fonte da verdade; o xlsx passa a ser uma exportação derivada
+MODO_ARMAZENAMENTO = "xlsx"
+
+# "lock": arquivo de lock no drive serializa as consolidações
+# "otimista": sem lock; o consolidado é gravado com If-Match no eTag lido e,
+#             se outro envio o alterou antes, é relido e a substituição reaplicada
+#             (vale para MODO_ARMAZENAMENTO = "xlsx"; partições usam sempre o lock)
+MODO_CONCORRENCIA = "lock"
+MAX_TENTATIVAS_CONFLITO = 5
+
+# "fila": envios entram na fila do processo e são consolidados em lote
+#         (uma leitura, um merge e uma gravação para todos os pendentes)
+# "direto": cada envio faz sua própria consolidação, etapa por etapa
+# "delta": cada envio é gravado como um delta imutável em PASTA_CONSOLIDADO/deltas
+#          (uma gravação pequena) e uma thread compacta os deltas no consolidado
+#          a cada INTERVALO_COMPACTACAO_SEGUNDOS ou ao acumular LIMITE_DELTAS_PENDENTES
+#          (bonificacao/deltas.py)
+MODO_ENVIO = "fila"
 
 # ===========================
 # ESTILOS CSS
@@ -158,37 +190,26 @@ def aplicar_estilos_css():
 def obter_token():
     """
     Obtém token de acesso do Microsoft Graph API
-    Usa session_state para cache ao invés de st.cache_data
+    O token é compartilhado por todas as sessões do processo e renovado
+    antes do expires_in (ver bonificacao/autenticacao.py)
     """
-    if 'token_cache' not in st.session_state or \
-       'token_timestamp' not in st.session_state or \
-       (datetime.now() - st.session_state.token_timestamp).seconds > 3000:
-        
-        try:
-            app = ConfidentialClientApplication(
-                CLIENT_ID,
-                authority=f"https://login.microsoftonline.com/{TENANT_ID}",
-                client_credential=CLIENT_SECRET
-            )
-            result = app.acquire_token_for_client(
-                scopes=["https://graph.microsoft.com/.default"]
-            )
-            
-            if "access_token" not in result:
-                error_desc = result.get("error_description", "Token não obtido")
-                logger.error(f"Falha na autenticação: {error_desc}")
-                return None
-            
-            st.session_state.token_cache = result["access_token"]
-            st.session_state.token_timestamp = datetime.now()
-            logger.info("Token obtido com sucesso")
-            return result["access_token"]
-            
-        except Exception as e:
-            logger.error(f"Erro de autenticação: {e}")
-            return None
-    
-    return st.session_state.token_cache
+    if DRIVE_LOCAL:
+        return "local"
+    try:
+        return obter_provedor(CLIENT_ID, TENANT_ID, CLIENT_SECRET).obter_token()
+    except Exception as e:
+        logger.error(f"Erro de autenticação: {e}")
+        return None
+
+# Operações no drive (lock, consolidado, backups, cópias ENVIO, partições e deltas), sem st.*
+CONSOLIDADOR = ConsolidadorSharePoint(
+    SITE_ID, DRIVE_ID, obter_token,
+    modo_concorrencia=MODO_CONCORRENCIA,
+    max_tentativas_conflito=MAX_TENTATIVAS_CONFLITO,
+    cache=CACHE_CONSOLIDADO,
+    versao=APP_VERSION,
+    armazenamento=ArmazenamentoLocal(DRIVE_LOCAL) if DRIVE_LOCAL else None
+) if CREDENCIAIS_OK else None
 
 # ===========================
 # SISTEMA DE LOCK
@@ -199,92 +220,9 @@ def gerar_id_sessao():
         st.session_state.session_id = str(uuid.uuid4())[:8]
     return st.session_state.session_id
 
-def verificar_lock_existente(token):
-    """Verifica se existe um lock ativo no sistema"""
-    try:
-        url = f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}/drives/{DRIVE_ID}/root:/{PASTA_CONSOLIDADO}/{ARQUIVO_LOCK}:/content"
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            lock_data = response.json()
-            timestamp_lock = datetime.fromisoformat(lock_data['timestamp'])
-            agora = datetime.now()
-            
-            if agora - timestamp_lock > timedelta(minutes=TIMEOUT_LOCK_MINUTOS):
-                logger.info("Lock expirado - removendo automaticamente")
-                remover_lock(token, force=True)
-                return False, None
-            
-            return True, lock_data
-        
-        return False, None
-            
-    except Exception as e:
-        logger.error(f"Erro ao verificar lock: {e}")
-        return False, None
-
-def criar_lock(token, operacao="Consolidação por loja e mês"):
-    """Cria um lock para bloquear outras operações"""
-    try:
-        session_id = gerar_id_sessao()
-        
-        lock_data = {
-            "timestamp": datetime.now().isoformat(),
-            "session_id": session_id,
-            "operacao": operacao,
-            "status": "EM_ANDAMENTO",
-            "app_version": APP_VERSION
-        }
-        
-        url = f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}/drives/{DRIVE_ID}/root:/{PASTA_CONSOLIDADO}/{ARQUIVO_LOCK}:/content"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
-        content = json.dumps(lock_data).encode('utf-8')
-        response = requests.put(url, headers=headers, data=content, timeout=10)
-        
-        if response.status_code in [200, 201]:
-            logger.info(f"Lock criado: {session_id}")
-            return True
-        
-        logger.error(f"Falha ao criar lock: {response.status_code}")
-        return False
-        
-    except Exception as e:
-        logger.error(f"Erro ao criar lock: {e}")
-        return False
-
-def remover_lock(token, session_id=None, force=False):
-    """Remove o lock do sistema"""
-    try:
-        if not force:
-            ocupado, lock_data = verificar_lock_existente(token)
-            if ocupado and lock_data:
-                if session_id and lock_data.get("session_id") != session_id:
-                    logger.warning("Tentativa de remover lock de outra sessão")
-                    return False
-        
-        url = f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}/drives/{DRIVE_ID}/root:/{PASTA_CONSOLIDADO}/{ARQUIVO_LOCK}"
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.delete(url, headers=headers, timeout=10)
-        
-        if response.status_code in [204, 404]:
-            logger.info("Lock removido com sucesso")
-            return True
-        
-        logger.error(f"Falha ao remover lock: {response.status_code}")
-        return False
-        
-    except Exception as e:
-        logger.error(f"Erro ao remover lock: {e}")
-        return False
-
 def exibir_status_sistema(token):
     """Exibe o status atual do sistema e retorna se está ocupado"""
-    ocupado, lock_data = verificar_lock_existente(token)
+    ocupado, lock_data = CONSOLIDADOR.verificar_lock_existente(token)
     
     if ocupado and lock_data:
         st.markdown('<div class="status-card error">', unsafe_allow_html=True)
@@ -310,389 +248,1009 @@ def exibir_status_sistema(token):
         return False
 
 # ===========================
-# VALIDAÇÃO DE DATAS
+# VALIDAÇÃO COMPLETA
 # ===========================
-def validar_datas(df):
+def validar_dados_enviados(df, token, hash_envio=None, aba=None):
     """
-    Valida as datas da planilha
-    Retorna: (sucesso, erros, avisos, info)
+    Validação completa dos dados enviados (ver bonificacao/validacao.py)
+    Com hash_envio e aba o resultado vem do cache de leituras nas reexecuções
     """
-    erros = []
-    avisos = []
-    info = {}
+    if hash_envio is None:
+        erros_totais, avisos_totais, info_datas, ocorrencias = avaliar_planilha(df)
+    else:
+        erros_totais, avisos_totais, info_datas, ocorrencias = validar_em_cache(df, hash_envio, aba)
     
-    # Verifica se tem coluna DATA
-    if 'DATA' not in df.columns:
-        erros.append("Coluna DATA não encontrada na planilha")
-        return False, erros, avisos, info
+    # Guardar info de datas e linhas com problema no session_state
+    st.session_state.info_datas = info_datas
+    st.session_state.ocorrencias_validacao = ocorrencias
     
-    # Converter para datetime se necessário
-    try:
-        df['DATA'] = pd.to_datetime(df['DATA'], errors='coerce')
-    except Exception as e:
-        erros.append(f"Erro ao converter coluna DATA: {str(e)}")
-        return False, erros, avisos, info
-    
-    # Verificar datas nulas
-    datas_nulas = df['DATA'].isna().sum()
-    if datas_nulas > 0:
-        erros.append(f"Encontradas {datas_nulas} linhas com DATA vazia ou inválida")
-    
-    # Verificar se há datas válidas
-    if df['DATA'].notna().sum() == 0:
-        erros.append("Nenhuma data válida encontrada na planilha")
-        return False, erros, avisos, info
-    
-    # Data atual e limites
-    data_atual = datetime.now()
-    mes_atual = data_atual.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    mes_anterior = (mes_atual - relativedelta(months=1))
-    mes_proximo = (mes_atual + relativedelta(months=1))
-    limite_futuro = (mes_atual + relativedelta(months=2))  # Aceita até 2 meses no futuro
-    limite_passado = (mes_atual - relativedelta(months=6))  # Aceita até 6 meses no passado
-    
-    # Filtrar apenas datas válidas para análise
-    datas_validas = df[df['DATA'].notna()]['DATA']
-    
-    # Verificar datas muito futuras
-    datas_futuras = datas_validas[datas_validas > limite_futuro]
-    if len(datas_futuras) > 0:
-        datas_exemplo = datas_futuras.head(5).dt.strftime('%d/%m/%Y').tolist()
-        erros.append(f"⚠️ Encontradas {len(datas_futuras)} datas muito futuras (mais de 2 meses). Exemplos: {', '.join(datas_exemplo)}")
-    
-    # Verificar datas muito antigas
-    datas_antigas = datas_validas[datas_validas < limite_passado]
-    if len(datas_antigas) > 0:
-        datas_exemplo = datas_antigas.head(5).dt.strftime('%d/%m/%Y').tolist()
-        avisos.append(f"⚠️ Encontradas {len(datas_antigas)} datas antigas (mais de 6 meses atrás). Exemplos: {', '.join(datas_exemplo)}")
-    
-    # Identificar meses presentes nos dados
-    df['MES_ANO'] = df['DATA'].dt.to_period('M')
-    meses_unicos = df[df['DATA'].notna()]['MES_ANO'].unique()
-    
-    info['meses_presentes'] = sorted([str(m) for m in meses_unicos])
-    info['total_meses'] = len(meses_unicos)
-    info['data_minima'] = datas_validas.min()
-    info['data_maxima'] = datas_validas.max()
-    info['mes_atual'] = str(mes_atual.strftime('%Y-%m'))
-    
-    # Avisos sobre meses
-    if len(meses_unicos) > 1:
-        avisos.append(f"📅 Dados contêm {len(meses_unicos)} meses diferentes: {', '.join(info['meses_presentes'])}")
-    
-    # Verificar se tem dados do mês atual ou anterior
-    tem_mes_atual = any(df['MES_ANO'] == mes_atual.strftime('%Y-%m'))
-    tem_mes_anterior = any(df['MES_ANO'] == mes_anterior.strftime('%Y-%m'))
-    
-    if tem_mes_atual:
-        avisos.append(f"✅ Dados contêm informações do mês atual ({mes_atual.strftime('%m/%Y')})")
-    if tem_mes_anterior:
-        avisos.append(f"✅ Dados contêm informações do mês anterior ({mes_anterior.strftime('%m/%Y')})")
-    
-    # Remover coluna auxiliar antes de retornar
-    df.drop('MES_ANO', axis=1, inplace=True, errors='ignore')
-    
-    sucesso = len(erros) == 0
-    return sucesso, erros, avisos, info
+    return erros_totais, avisos_totais
 
-# ===========================
-# VALIDAÇÃO DE ESTRUTURA
-# ===========================
-def validar_estrutura_colunas(df, token):
-    """Valida a estrutura de colunas do DataFrame"""
-    erros = []
-    avisos = []
-    info = {}
-    
-    colunas_usuario = [col for col in df.columns if col != 'DATA_ULTIMO_ENVIO']
-    colunas_faltando = [col for col in COLUNAS_OBRIGATORIAS if col not in df.columns]
-    colunas_novas = [col for col in colunas_usuario if col not in COLUNAS_OBRIGATORIAS]
-    
-    info['colunas_usuario'] = colunas_usuario
-    info['colunas_faltando'] = colunas_faltando
-    info['colunas_novas'] = colunas_novas
+def exibir_ocorrencias_validacao(df, ocorrencias):
+    """Relatório por regra com as linhas do Excel que a violam"""
+    if ocorrencias is None or ocorrencias.empty:
+        return
     
-    if colunas_faltando:
-        erros.append(f"❌ Colunas obrigatórias ausentes: {', '.join(colunas_faltando)}")
-    
-    if colunas_novas:
-        avisos.append(f"ℹ️ Novas colunas detectadas: {', '.join(colunas_novas)}")
-    
-    return erros, avisos, info
+    with st.expander(f"🔎 Linhas com problema ({int(ocorrencias['quantidade'].sum())} ocorrências)"):
+        resumo = ocorrencias[['regra', 'nivel', 'quantidade']].rename(
+            columns={'regra': 'Regra', 'nivel': 'Nível', 'quantidade': 'Linhas'}
+        )
+        st.dataframe(resumo, use_container_width=True, hide_index=True)
+        
+        regra = st.selectbox("Ver linhas da regra", ocorrencias['regra'].tolist(), key="regra_ocorrencias")
+        linhas = ocorrencias.loc[ocorrencias['regra'] == regra, 'linhas'].iloc[0]
+        detalhe = df.iloc[linhas[:500]].copy()
+        detalhe.insert(0, 'LINHA_EXCEL', linhas_excel(linhas[:500]))
+        st.dataframe(detalhe, use_container_width=True, hide_index=True)
+        if len(linhas) > 500:
+            st.caption(f"Mostrando 500 de {len(linhas)} linhas")
 
 # ===========================
-# VALIDAÇÃO COMPLETA
+# ETAPAS COMUNS DA CONSOLIDAÇÃO
 # ===========================
-def validar_dados_enviados(df, token):
-    """Validação completa dos dados enviados"""
-    erros_totais = []
-    avisos_totais = []
-    
-    # 1. Validar estrutura de colunas
-    erros_estrutura, avisos_estrutura, info_estrutura = validar_estrutura_colunas(df, token)
-    erros_totais.extend(erros_estrutura)
-    avisos_totais.extend(avisos_estrutura)
-    
-    # 2. Validar datas
-    sucesso_datas, erros_datas, avisos_datas, info_datas = validar_datas(df)
-    erros_totais.extend(erros_datas)
-    avisos_totais.extend(avisos_datas)
-    
-    # Guardar info de datas no session_state
-    if 'info_datas' not in st.session_state:
-        st.session_state.info_datas = {}
-    st.session_state.info_datas = info_datas
+def exibir_combinacoes_atualizadas(df_novo_processado):
+    """Mostra quantas combinações de loja/mês serão atualizadas"""
+    lojas_meses_novos = df_novo_processado[['LOJA', 'MES_ANO']].drop_duplicates()
     
-    # 3. Validar LOJA
-    if 'LOJA' in df.columns:
-        lojas_nulas = df['LOJA'].isna().sum()
-        if lojas_nulas > 0:
-            erros_totais.append(f"❌ Encontradas {lojas_nulas} linhas sem LOJA definida")
-        
-        lojas_unicas = df['LOJA'].dropna().unique()
-        avisos_totais.append(f"📍 Dados contêm {len(lojas_unicas)} lojas diferentes")
-    else:
-        erros_totais.append("❌ Coluna LOJA não encontrada")
+    total_combinacoes = len(lojas_meses_novos)
+    st.info(f"📊 Serão atualizados dados de {total_combinacoes} combinações de loja/mês")
     
-    return erros_totais, avisos_totais
+    # Exibir detalhes
+    with st.expander("📋 Detalhes das atualizações", expanded=True):
+        summary = df_novo_processado.groupby(['LOJA', 'MES_ANO'], observed=True).size().reset_index(name='Quantidade')
+        st.dataframe(summary, use_container_width=True)
 
-# ===========================
-# DOWNLOAD DE ARQUIVO
-# ===========================
-def download_arquivo_sharepoint(token, nome_arquivo):
-    """Faz download de um arquivo do SharePoint"""
+def registrar_envio_consolidado(conteudo_original, item):
+    """Marca o conteúdo como já consolidado para as próximas execuções da sessão"""
+    st.session_state.setdefault("envios_verificados", {})[hash_conteudo(conteudo_original)] = item
+
+def salvar_copia_envio(token, conteudo_original, nome_arquivo_original):
+    """Salva uma cópia do arquivo enviado na pasta de backups"""
+    item = CONSOLIDADOR.enviar_copia_envio(token, conteudo_original, nome_arquivo_original)
+    if item is not None:
+        registrar_envio_consolidado(conteudo_original, item)
+        st.success(f"✅ Cópia salva: {nome_arquivo_envio(hash_conteudo(conteudo_original), nome_arquivo_original)}")
+
+def origem_consolidado_atual(token):
+    """Versão atual dos dados para o índice de resumo (None: eTag do xlsx)"""
+    if MODO_ARMAZENAMENTO != "particoes":
+        return None
     try:
-        url = f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}/drives/{DRIVE_ID}/root:/{PASTA_CONSOLIDADO}/{nome_arquivo}:/content"
-        headers = {"Authorization": f"Bearer {token}"}
-        response = requests.get(url, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            return BytesIO(response.content)
-        elif response.status_code == 404:
-            logger.warning(f"Arquivo não encontrado: {nome_arquivo}")
-            return None
-        else:
-            logger.error(f"Erro ao baixar arquivo: {response.status_code}")
-            return None
-            
+        return origem_particoes(CONSOLIDADOR.armazenamento_particionado(token).carregar_manifesto())
     except Exception as e:
-        logger.error(f"Erro no download: {e}")
+        logger.warning(f"Manifesto das partições indisponível: {e}")
         return None
 
+def verificar_envio_duplicado(token, conteudo_original, nome_arquivo_original, df):
+    """
+    Verifica se este mesmo conteúdo já foi consolidado (cópia ENVIO existente) e
+    se as lojas/meses de df continuam no consolidado como ele deixou
+    Retorna (metadados da cópia ou None, inalterado); a cópia consultada fica guardada na sessão
+    """
+    hash_hex = hash_conteudo(conteudo_original)
+    verificados = st.session_state.setdefault("envios_verificados", {})
+    if hash_hex in verificados:
+        item = verificados[hash_hex]
+    else:
+        try:
+            item = CONSOLIDADOR.envio_existente(token, conteudo_original, nome_arquivo_original)
+        except Exception as e:
+            logger.warning(f"Não foi possível verificar envio duplicado: {e}")
+            return None, False
+        verificados[hash_hex] = item
+    
+    if item is None:
+        return None, False
+    # Um envio posterior pode ter substituído essas lojas/meses desde então
+    return item, CONSOLIDADOR.envio_inalterado(token, df, origem_consolidado_atual(token))
+
+def exibir_resumo_consolidacao(registros_novos, registros_removidos, registros_preservados, total_final,
+                               registros_inalterados=0):
+    """Exibe o resumo final da consolidação"""
+    st.markdown("---")
+    st.markdown("### 📊 Resumo da Consolidação")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Registros Novos", registros_novos)
+    with col2:
+        st.metric("Registros Removidos", registros_removidos)
+    with col3:
+        st.metric("Registros Preservados", registros_preservados)
+    with col4:
+        st.metric("Total Final", total_final)
+    if registros_inalterados:
+        st.caption(f"{registros_inalterados} registros reenviados sem alteração foram mantidos como estavam "
+                   "(incluídos nos preservados)")
+
+def concluir_sem_alteracoes(token, conteudo_original, nome_arquivo_original, total_final, registros_enviados):
+    """Envio em que nenhuma loja/mês muda: só a cópia do envio é salva, o consolidado fica como está"""
+    st.info("ℹ️ Nenhuma loja/mês deste arquivo mudou em relação ao consolidado. Nada foi regravado.")
+    salvar_copia_envio(token, conteudo_original, nome_arquivo_original)
+    exibir_resumo_consolidacao(0, 0, total_final, total_final, registros_inalterados=registros_enviados)
+
 # ===========================
-# UPLOAD DE ARQUIVO
+# CONSOLIDAÇÃO INTELIGENTE
 # ===========================
-def upload_arquivo_sharepoint(token, nome_arquivo, conteudo, pasta):
-    """Faz upload de um arquivo para o SharePoint"""
+@execucao_medida("Consolidação por loja e mês", origem="direto")
+def processar_consolidacao_inteligente(df_novo, nome_arquivo_original, token, conteudo_original):
+    """
+    Processa a consolidação inteligente:
+    - Identifica lojas e meses nos novos dados
+    - Remove registros da mesma loja E mês do consolidado
+    - Adiciona os novos registros
+    - Preserva todos os outros dados
+    No modo otimista não há lock: se o consolidado mudar entre a leitura e a
+    gravação, ele é relido e a substituição é reaplicada
+    """
+    session_id = gerar_id_sessao()
+    usar_lock = MODO_CONCORRENCIA == "lock"
+    
+    # Reenvio sem mudança reconhecido pelo índice de resumo: nem lock nem download
+    total_atual = CONSOLIDADOR.sem_alteracoes(token, [preparar_dados_novos(df_novo)])
+    if total_atual is not None:
+        concluir_sem_alteracoes(token, conteudo_original, nome_arquivo_original, total_atual, len(df_novo))
+        return True
+    
     try:
-        url = f"https://graph.microsoft.com/v1.0/sites/{SITE_ID}/drives/{DRIVE_ID}/root:/{pasta}/{nome_arquivo}:/content"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        }
+        # Criar lock
+        if usar_lock:
+            st.info("🔒 Bloqueando sistema para consolidação...")
+            if not CONSOLIDADOR.criar_lock(token, "Consolidação por loja e mês", session_id):
+                st.error("❌ Não foi possível bloquear o sistema. Tente novamente.")
+                return False
         
-        response = requests.put(url, headers=headers, data=conteudo, timeout=60)
+        progress_bar = st.progress(0)
+        status_text = st.empty()
         
-        if response.status_code in [200, 201]:
-            logger.info(f"Arquivo enviado: {nome_arquivo}")
-            return True
+        for tentativa in range(1, MAX_TENTATIVAS_CONFLITO + 1):
+            # 1. Download do arquivo consolidado
+            status_text.info("📥 Baixando arquivo consolidado...")
+            progress_bar.progress(10)
+            
+            arquivo_consolidado, df_consolidado, veio_do_cache, etag_lido = CONSOLIDADOR.carregar_consolidado(token)
+            
+            if arquivo_consolidado is None:
+                status_text.warning("⚠️ Arquivo consolidado não existe. Criando novo arquivo...")
+            elif veio_do_cache:
+                status_text.success(f"✅ Arquivo consolidado carregado do cache local (sem alterações): {len(df_consolidado)} registros")
+            else:
+                status_text.success(f"✅ Arquivo consolidado carregado: {len(df_consolidado)} registros")
+            
+            # Gravação condicional: só sobrescreve a versão lida (ou cria, se não existia)
+            condicao = {}
+            if not usar_lock:
+                if arquivo_consolidado is not None and not etag_lido:
+                    st.warning("⚠️ Versão do consolidado indisponível, lendo novamente...")
+                    time.sleep(tentativa)
+                    continue
+                condicao = {"if_match": etag_lido} if arquivo_consolidado is not None else {"somente_criar": True}
+            
+            progress_bar.progress(20)
+            
+            # 2. Preparar dados novos
+            status_text.info("🔄 Preparando novos dados...")
+            df_novo_processado = preparar_dados_novos(df_novo)
+            
+            progress_bar.progress(30)
+            
+            # 3. Identificar lojas e meses nos novos dados
+            status_text.info("🔍 Identificando lojas e meses a serem atualizados...")
+            if tentativa == 1:
+                exibir_combinacoes_atualizadas(df_novo_processado)
+            
+            # Lojas/meses com o mesmo conteúdo do consolidado ficam como estão
+            (df_novo_processado,), (registros_inalterados,) = separar_inalteradas(df_consolidado,
+                                                                                 [df_novo_processado])
+            if len(df_novo_processado) == 0:
+                if usar_lock:
+                    CONSOLIDADOR.remover_lock(token, session_id)
+                progress_bar.progress(100)
+                status_text.success("✅ Consolidado mantido, sem alterações")
+                concluir_sem_alteracoes(token, conteudo_original, nome_arquivo_original, len(df_consolidado),
+                                        registros_inalterados)
+                return True
+            if registros_inalterados:
+                st.info(f"ℹ️ {registros_inalterados} registros de lojas/meses sem alteração mantidos como estão")
+            
+            progress_bar.progress(40)
+            
+            with etapa("merge") as span_merge:
+                # 4. Remover registros antigos das mesmas lojas/meses
+                registros_removidos = 0
+                registros_preservados = 0
+                manter = None
+                if len(df_consolidado) > 0:
+                    status_text.info("🗑️ Removendo registros antigos das mesmas lojas/meses...")
+                
+                    df_consolidado['DATA'] = pd.to_datetime(df_consolidado['DATA'])
+                
+                    # Anti-join por hash nas chaves LOJA + MES_ANO dos novos dados
+                    # (MES_ANO do consolidado é calculado só para a máscara, sem nova coluna)
+                    chaves_novas = chaves_lojas_meses(df_novo_processado)
+                    manter = ~mascara_lojas_meses(df_consolidado, chaves_novas)
+                    registros_preservados = int(manter.sum())
+                    registros_removidos = len(df_consolidado) - registros_preservados
+                
+                    st.success(f"✅ {registros_removidos} registros antigos removidos")
+                    st.info(f"📊 {registros_preservados} registros preservados de outros meses/lojas")
+                else:
+                    st.info("ℹ️ Não há dados consolidados anteriores")
+            
+                progress_bar.progress(60)
+            
+                # 5. Combinar dados
+                status_text.info("🔄 Combinando dados...")
+            
+                # Remover coluna auxiliar MES_ANO antes de consolidar
+                df_novo_processado.drop('MES_ANO', axis=1, inplace=True, errors='ignore')
+            
+                if registros_preservados > 0:
+                    # Montado coluna a coluna a partir das linhas mantidas, sem cópia filtrada
+                    df_final = concatenar([df_consolidado, df_novo_processado], [manter, None])
+                else:
+                    df_final = df_novo_processado
+            
+                st.success(f"✅ Consolidação concluída: {len(df_final)} registros totais")
+                span_merge.registrar(linhas=len(df_final))
+            
+            progress_bar.progress(70)
+            
+            # 6-8. Backup, consolidado e cópia do envio em paralelo
+            # Os uploads rodam em threads e se sobrepõem à serialização; a
+            # interface só é atualizada aqui, conforme cada etapa termina
+            status_text.info("💾 Salvando backup, consolidado e cópia do envio...")
+            
+            nome_copia = nome_arquivo_envio(hash_conteudo(conteudo_original), nome_arquivo_original)
+            pipeline, nome_backup = CONSOLIDADOR.montar_pipeline_gravacao(
+                token, arquivo_consolidado, df_final, [(conteudo_original, nome_arquivo_original)], condicao,
+                etag_lido, chaves_lojas_meses(df_novo_processado)
+            )
+            
+            progresso = {"atual": 70}
+            incrementos = {"backup": 5, "consolidado": 10, "delta": 5, "envio_0": 5}
+            
+            def ao_concluir(nome, resultado, erro):
+                if nome == "backup":
+                    if erro is None:
+                        st.info(f"📸 Snapshot completo do consolidado criado: {nome_backup}")
+                    else:
+                        st.warning("⚠️ Não foi possível criar o snapshot do consolidado, mas continuando...")
+                elif nome == "delta":
+                    if erro is None:
+                        st.success(f"✅ Backup criado: {resultado}")
+                    else:
+                        st.warning("⚠️ Não foi possível criar backup, mas continuando...")
+                elif nome == "consolidado" and erro is None:
+                    st.success("✅ Arquivo consolidado atualizado com sucesso!")
+                elif nome == "envio_0" and erro is None:
+                    registrar_envio_consolidado(conteudo_original, resultado)
+                    st.success(f"✅ Cópia salva: {nome_copia}")
+                
+                if nome in incrementos:
+                    progresso["atual"] += incrementos[nome]
+                    progress_bar.progress(progresso["atual"])
+            
+            resultados, erros = pipeline.executar(ao_concluir)
+            
+            if isinstance(erros.get("consolidado"), ConflitoEtag):
+                st.warning(f"🔁 O consolidado foi alterado por outro envio. Relendo e reaplicando (tentativa {tentativa + 1})...")
+                logger.info(f"Conflito de eTag na tentativa {tentativa}: {erros['consolidado']}")
+                time.sleep(random.uniform(0, tentativa))
+                continue
+            break
         else:
-            logger.error(f"Erro no upload: {response.status_code} - {response.text}")
+            status_text.error("❌ O consolidado foi alterado repetidamente por outros envios. Tente novamente.")
             return False
-            
+        
+        if "consolidado" in erros:
+            status_text.error("❌ Erro ao salvar arquivo consolidado")
+            if usar_lock:
+                CONSOLIDADOR.remover_lock(token, session_id, force=True)
+            return False
+        
+        CONSOLIDADOR.atualizar_cache_consolidado(resultados["consolidado"], resultados["xlsx_consolidado"], df_final)
+        CONSOLIDADOR.atualizar_resumo(token, [df_novo_processado], etag_lido,
+                                      (resultados["consolidado"] or {}).get("eTag"), lambda: df_final)
+        progress_bar.progress(95)
+        
+        # 9. Remover lock
+        if usar_lock:
+            status_text.info("🔓 Liberando sistema...")
+            CONSOLIDADOR.remover_lock(token, session_id)
+        
+        progress_bar.progress(100)
+        status_text.success("✅ Processo concluído com sucesso!")
+        
+        # Exibir resumo final
+        exibir_resumo_consolidacao(
+            len(df_novo_processado),
+            registros_removidos,
+            registros_preservados,
+            len(df_final),
+            registros_inalterados
+        )
+        
+        return True
+        
     except Exception as e:
-        logger.error(f"Erro no upload: {e}")
+        logger.error(f"Erro na consolidação: {e}")
+        if usar_lock:
+            CONSOLIDADOR.remover_lock(token, session_id, force=True)
+        status_text.error(f"❌ Erro durante o processo: {str(e)}")
+        progress_bar.empty()
+        if usar_lock:
+            st.error("Sistema liberado automaticamente após erro")
         return False
 
-# ===========================
-# CONSOLIDAÇÃO INTELIGENTE
-# ===========================
-def processar_consolidacao_inteligente(df_novo, nome_arquivo_original, token):
+def processar_consolidacao_particionada(df_novo, nome_arquivo_original, token, conteudo_original):
     """
-    Processa a consolidação inteligente:
-    - Identifica lojas e meses nos novos dados
-    - Remove registros da mesma loja E mês do consolidado
-    - Adiciona os novos registros
-    - Preserva todos os outros dados
+    Consolidação sobre o armazenamento particionado:
+    - Lê apenas o manifesto e as partições das lojas/meses enviados
+    - Guarda as partições substituídas na pasta de backups
+    - Grava uma partição Parquet por loja/mês enviado
+    - Não reescreve o xlsx (exportação derivada, regerada sob demanda)
     """
     session_id = gerar_id_sessao()
+    progress_bar = st.progress(0)
+    status_text = st.empty()
     
     try:
         # Criar lock
         st.info("🔒 Bloqueando sistema para consolidação...")
-        if not criar_lock(token, "Consolidação por loja e mês"):
+        if not CONSOLIDADOR.criar_lock(token, "Consolidação por loja e mês", session_id):
             st.error("❌ Não foi possível bloquear o sistema. Tente novamente.")
             return False
         
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        
-        # 1. Download do arquivo consolidado
-        status_text.info("📥 Baixando arquivo consolidado...")
+        # 1. Carregar manifesto das partições
+        status_text.info("📥 Carregando índice de partições...")
         progress_bar.progress(10)
         
-        arquivo_consolidado = download_arquivo_sharepoint(token, "bonificacao_consolidada.xlsx")
-        
-        if arquivo_consolidado is None:
-            status_text.warning("⚠️ Arquivo consolidado não existe. Criando novo arquivo...")
-            df_consolidado = pd.DataFrame()
-        else:
-            df_consolidado = pd.read_excel(arquivo_consolidado, sheet_name="Dados")
-            df_consolidado.columns = df_consolidado.columns.str.strip().str.upper()
-            status_text.success(f"✅ Arquivo consolidado carregado: {len(df_consolidado)} registros")
+        armazenamento = CONSOLIDADOR.armazenamento_particionado(token)
+        if armazenamento.carregar_manifesto() is None:
+            # Migração única a partir do xlsx existente
+            status_text.warning("⚠️ Partições não encontradas. Migrando o consolidado atual...")
+            arquivo_consolidado = CONSOLIDADOR.baixar_arquivo(token, ARQUIVO_CONSOLIDADO)
+            if arquivo_consolidado is None:
+                df_consolidado = pd.DataFrame()
+            else:
+                df_consolidado = ler_planilha(arquivo_consolidado, "Dados")
+                df_consolidado['DATA'] = pd.to_datetime(df_consolidado['DATA'])
+            armazenamento.inicializar(df_consolidado)
+            st.info(f"📦 Consolidado migrado para {len(armazenamento.manifesto['particoes'])} partições")
         
+        status_text.success(f"✅ Índice carregado: {armazenamento.total_linhas()} registros")
         progress_bar.progress(20)
         
         # 2. Preparar dados novos
         status_text.info("🔄 Preparando novos dados...")
-        df_novo_processado = df_novo.copy()
-        
-        # Adicionar DATA_ULTIMO_ENVIO
-        df_novo_processado['DATA_ULTIMO_ENVIO'] = datetime.now()
-        
-        # Garantir que DATA está em datetime
-        df_novo_processado['DATA'] = pd.to_datetime(df_novo_processado['DATA'])
-        
-        # Criar coluna MES_ANO para identificação
-        df_novo_processado['MES_ANO'] = df_novo_processado['DATA'].dt.to_period('M').astype(str)
+        df_novo_processado = preparar_dados_novos(df_novo)
         
         progress_bar.progress(30)
         
         # 3. Identificar lojas e meses nos novos dados
         status_text.info("🔍 Identificando lojas e meses a serem atualizados...")
-        
-        lojas_meses_novos = df_novo_processado[['LOJA', 'MES_ANO']].drop_duplicates()
-        
-        total_combinacoes = len(lojas_meses_novos)
-        st.info(f"📊 Serão atualizados dados de {total_combinacoes} combinações de loja/mês")
-        
-        # Exibir detalhes
-        with st.expander("📋 Detalhes das atualizações", expanded=True):
-            summary = df_novo_processado.groupby(['LOJA', 'MES_ANO']).size().reset_index(name='Quantidade')
-            st.dataframe(summary, use_container_width=True)
+        exibir_combinacoes_atualizadas(df_novo_processado)
+        chaves_novas = chaves_lojas_meses(df_novo_processado)
+        
+        # Partições com o mesmo conteúdo não são copiadas para o backup nem regravadas
+        (df_novo_processado,), (registros_inalterados,) = separar_inalteradas(
+            armazenamento.ler_particoes(chaves_novas), [df_novo_processado]
+        )
+        if len(df_novo_processado) == 0:
+            CONSOLIDADOR.remover_lock(token, session_id)
+            progress_bar.progress(100)
+            status_text.success("✅ Partições mantidas, sem alterações")
+            concluir_sem_alteracoes(token, conteudo_original, nome_arquivo_original, armazenamento.total_linhas(),
+                                    registros_inalterados)
+            return True
+        if registros_inalterados:
+            chaves_novas = chaves_lojas_meses(df_novo_processado)
+            st.info(f"ℹ️ {registros_inalterados} registros de lojas/meses sem alteração mantidos como estão")
         
         progress_bar.progress(40)
         
-        # 4. Remover registros antigos das mesmas lojas/meses
-        if len(df_consolidado) > 0:
-            status_text.info("🗑️ Removendo registros antigos das mesmas lojas/meses...")
-            
-            # Garantir que consolidado também tem MES_ANO
-            df_consolidado['DATA'] = pd.to_datetime(df_consolidado['DATA'])
-            df_consolidado['MES_ANO'] = df_consolidado['DATA'].dt.to_period('M').astype(str)
-            
-            registros_antes = len(df_consolidado)
-            
-            # Criar condição para manter apenas registros que NÃO estão sendo atualizados
-            condicao_manter = True
-            for _, row in lojas_meses_novos.iterrows():
-                loja = row['LOJA']
-                mes_ano = row['MES_ANO']
-                condicao_manter = condicao_manter & ~((df_consolidado['LOJA'] == loja) & (df_consolidado['MES_ANO'] == mes_ano))
-            
-            df_consolidado_filtrado = df_consolidado[condicao_manter].copy()
-            registros_removidos = registros_antes - len(df_consolidado_filtrado)
-            
-            st.success(f"✅ {registros_removidos} registros antigos removidos")
-            st.info(f"📊 {len(df_consolidado_filtrado)} registros preservados de outros meses/lojas")
-        else:
-            df_consolidado_filtrado = pd.DataFrame()
-            st.info("ℹ️ Não há dados consolidados anteriores")
-        
-        progress_bar.progress(60)
+        # 4. Backup das partições que serão substituídas
+        status_text.info("💾 Criando backup das partições substituídas...")
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        pasta_backup = f"{PASTA_ENVIOS_BACKUPS}/BACKUP_particoes_{timestamp}"
         
-        # 5. Combinar dados
-        status_text.info("🔄 Combinando dados...")
+        anteriores = armazenamento.conteudo_particoes(chaves_novas)
+        falhas_backup = 0
+        for arquivo, conteudo in anteriores:
+            if not CONSOLIDADOR.upload_arquivo(token, arquivo, conteudo, pasta_backup, content_type="application/octet-stream"):
+                falhas_backup += 1
         
-        # Remover coluna auxiliar MES_ANO antes de consolidar
-        df_novo_processado.drop('MES_ANO', axis=1, inplace=True, errors='ignore')
-        if len(df_consolidado_filtrado) > 0:
-            df_consolidado_filtrado.drop('MES_ANO', axis=1, inplace=True, errors='ignore')
+        if falhas_backup:
+            st.warning("⚠️ Não foi possível criar backup de todas as partições, mas continuando...")
+        elif anteriores:
+            st.success(f"✅ Backup de {len(anteriores)} partições criado")
         
-        if len(df_consolidado_filtrado) > 0:
-            df_final = pd.concat([df_consolidado_filtrado, df_novo_processado], ignore_index=True)
-        else:
-            df_final = df_novo_processado
+        progress_bar.progress(60)
         
-        st.success(f"✅ Consolidação concluída: {len(df_final)} registros totais")
+        # 5. Gravar partições novas (o manifesto é gravado por último)
+        status_text.info("💾 Gravando partições atualizadas...")
+        origem_anterior = origem_particoes(armazenamento.manifesto)
+        registros_removidos, registros_preservados, particoes_gravadas = armazenamento.substituir(
+            df_novo_processado.drop('MES_ANO', axis=1)
+        )
+        CONSOLIDADOR.atualizar_resumo(token, [df_novo_processado], origem_anterior,
+                                      origem_particoes(armazenamento.manifesto), armazenamento.ler_particoes)
         
-        progress_bar.progress(70)
+        st.success(f"✅ {registros_removidos} registros antigos substituídos em {particoes_gravadas} partições")
+        st.info(f"📊 {registros_preservados} registros preservados de outros meses/lojas")
         
-        # 6. Criar backup do arquivo anterior (se existir)
-        if arquivo_consolidado is not None:
-            status_text.info("💾 Criando backup do arquivo anterior...")
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            nome_backup = f"BACKUP_bonificacao_{timestamp}.xlsx"
-            
-            if upload_arquivo_sharepoint(token, nome_backup, arquivo_consolidado.getvalue(), PASTA_ENVIOS_BACKUPS):
-                st.success(f"✅ Backup criado: {nome_backup}")
-            else:
-                st.warning("⚠️ Não foi possível criar backup, mas continuando...")
+        progress_bar.progress(85)
         
-        progress_bar.progress(80)
+        # 6. Salvar cópia do arquivo enviado
+        status_text.info("💾 Salvando cópia do arquivo enviado...")
+        salvar_copia_envio(token, conteudo_original, nome_arquivo_original)
         
-        # 7. Salvar arquivo consolidado atualizado
-        status_text.info("💾 Salvando arquivo consolidado atualizado...")
+        progress_bar.progress(95)
         
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df_final.to_excel(writer, sheet_name='Dados', index=False)
-        output.seek(0)
+        # 7. Remover lock
+        status_text.info("🔓 Liberando sistema...")
+        CONSOLIDADOR.remover_lock(token, session_id)
         
-        if not upload_arquivo_sharepoint(token, "bonificacao_consolidada.xlsx", output.getvalue(), PASTA_CONSOLIDADO):
-            status_text.error("❌ Erro ao salvar arquivo consolidado")
-            remover_lock(token, session_id, force=True)
-            return False
+        progress_bar.progress(100)
+        status_text.success("✅ Processo concluído com sucesso!")
+        st.info("ℹ️ A planilha consolidada xlsx será atualizada na próxima exportação")
         
-        st.success("✅ Arquivo consolidado atualizado com sucesso!")
+        exibir_resumo_consolidacao(
+            len(df_novo_processado),
+            registros_removidos,
+            registros_preservados,
+            armazenamento.total_linhas(),
+            registros_inalterados
+        )
         
-        progress_bar.progress(90)
+        return True
         
-        # 8. Salvar cópia do arquivo enviado
-        status_text.info("💾 Salvando cópia do arquivo enviado...")
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nome_copia = f"ENVIO_{timestamp}_{nome_arquivo_original}"
+    except Exception as e:
+        logger.error(f"Erro na consolidação particionada: {e}")
+        CONSOLIDADOR.remover_lock(token, session_id, force=True)
+        status_text.error(f"❌ Erro durante o processo: {str(e)}")
+        progress_bar.empty()
+        st.error("Sistema liberado automaticamente após erro")
+        return False
+
+def exibir_exportacao_particoes(token):
+    """Mostra na sidebar o estado da exportação xlsx e permite regerá-la"""
+    with st.sidebar.expander("📦 Armazenamento particionado"):
+        try:
+            armazenamento = CONSOLIDADOR.armazenamento_particionado(token)
+            if armazenamento.carregar_manifesto() is None:
+                st.info("Partições serão criadas na primeira consolidação")
+                return
+        except Exception as e:
+            st.error(f"❌ Erro ao ler partições: {str(e)}")
+            return
         
-        output_copia = BytesIO()
-        with pd.ExcelWriter(output_copia, engine='openpyxl') as writer:
-            df_novo.to_excel(writer, sheet_name='Dados', index=False)
-        output_copia.seek(0)
+        st.metric("Partições", len(armazenamento.manifesto['particoes']))
+        if armazenamento.desatualizado():
+            st.warning("⚠️ xlsx desatualizado em relação às partições")
+        else:
+            st.success("✅ xlsx em dia")
         
-        if upload_arquivo_sharepoint(token, nome_copia, output_copia.getvalue(), PASTA_ENVIOS_BACKUPS):
-            st.success(f"✅ Cópia salva: {nome_copia}")
+        if st.button("📤 Regerar planilha consolidada", use_container_width=True):
+            with st.spinner("Exportando partições para xlsx..."):
+                if CONSOLIDADOR.exportar_xlsx_particoes(token, armazenamento):
+                    st.success("✅ Planilha consolidada regerada")
+                else:
+                    st.error("❌ Falha ao exportar a planilha")
+
+def exibir_historico_consolidado(token):
+    """
+    Mostra na sidebar os snapshots e deltas do histórico e permite baixar o
+    consolidado como estava em um horário (aplicar a restauração: bonificacao.restauracao)
+    """
+    with st.sidebar.expander("⏪ Histórico do consolidado"):
+        try:
+            historico = CONSOLIDADOR.historico(token)
+            entradas = historico.entradas()
+        except Exception as e:
+            st.error(f"❌ Erro ao ler o histórico: {str(e)}")
+            return
+        if not entradas:
+            st.info("O histórico começa na próxima consolidação")
+            return
+
+        st.metric("Snapshots", sum(1 for e in entradas if e['tipo'] == 'snapshot'))
+        st.metric("Deltas", sum(1 for e in entradas if e['tipo'] == 'delta'))
+        st.markdown(f"**Mais antigo:** {entradas[0]['horario'].strftime('%d/%m/%Y %H:%M:%S')}")
+
+        agora = datetime.now()
+        dia = st.date_input("Data", value=agora.date(), key="historico_data")
+        hora = st.time_input("Hora", value=agora.time().replace(second=0, microsecond=0), key="historico_hora",
+                             step=60)
+        if st.button("🔁 Reconstruir consolidado", use_container_width=True):
+            ate = fim_do_minuto(datetime.combine(dia, hora))
+            with st.spinner("Reconstruindo a partir do histórico..."):
+                try:
+                    df, usadas = historico.reconstruir(ate)
+                    st.session_state.consolidado_restaurado = (ate, len(df), len(usadas), gerar_xlsx(df))
+                except ValueError as e:
+                    st.session_state.consolidado_restaurado = None
+                    st.warning(f"⚠️ {str(e)}")
+                except Exception as e:
+                    logger.error(f"Erro ao reconstruir o consolidado: {e}")
+                    st.session_state.consolidado_restaurado = None
+                    st.error(f"❌ Erro ao reconstruir: {str(e)}")
+        if st.session_state.get("consolidado_restaurado"):
+            ate, registros, usadas, conteudo = st.session_state.consolidado_restaurado
+            st.caption(f"{registros} registros em {ate.strftime('%d/%m/%Y %H:%M')}, a partir de {usadas} backup(s)")
+            st.download_button("💾 Baixar consolidado reconstruído", conteudo,
+                               file_name=f"bonificacao_consolidada_{ate.strftime('%Y%m%d_%H%M')}.xlsx",
+                               use_container_width=True)
+
+def exibir_latencia_graph():
+    """Mostra na sidebar a latência por endpoint do cliente Graph compartilhado"""
+    estatisticas = cliente_padrao().estatisticas()
+    if not estatisticas:
+        return
+    
+    with st.sidebar.expander("⏱️ Latência do Graph"):
+        tabela = pd.DataFrame([
+            {
+                "Endpoint": nome,
+                "Chamadas": m['chamadas'],
+                "Erros": m['erros'],
+                "Média (ms)": round(m['media_ms']),
+                "p95 (ms)": round(m['p95_ms']),
+            }
+            for nome, m in estatisticas.items()
+        ])
+        st.dataframe(tabela, hide_index=True, use_container_width=True)
+
+def exibir_etapas_execucoes():
+    """Mostra na sidebar o tempo de cada etapa das últimas consolidações do servidor"""
+    execucoes = obter_registro().recentes()
+    if not execucoes:
+        return
+    
+    with st.sidebar.expander("⏱️ Etapas das consolidações"):
+        indice = st.selectbox(
+            "Execução", range(len(execucoes)), key="execucao_etapas",
+            format_func=lambda i: (f"{execucoes[i].inicio.strftime('%d/%m %H:%M:%S')} · {execucoes[i].origem} · "
+                                   f"{execucoes[i].duracao:.1f}s{'' if execucoes[i].status == 'ok' else ' ❌'}")
+        )
+        execucao = execucoes[indice]
+        st.caption(execucao.operacao)
+        if execucao.erro:
+            st.error(execucao.erro)
+        
+        chamadas = {}
+        for span in execucao.spans:
+            if span.tipo == TIPO_GRAPH:
+                chamadas[span.pai] = chamadas.get(span.pai, 0) + 1
+        
+        tabela = pd.DataFrame([
+            {
+                "Etapa": f"↳ {span.nome}" if span.pai else span.nome,
+                "Início (s)": round(span.inicio, 2),
+                "Duração (s)": round(span.duracao, 2),
+                "%": round(100 * span.duracao / execucao.duracao) if execucao.duracao else 0,
+                "MB": round(span.atributos["bytes"] / 1024 / 1024, 2) if span.atributos.get("bytes") else None,
+                "Linhas": span.atributos.get("linhas"),
+                "Chamadas": chamadas.get(span.nome, 0),
+                "RSS pico (MB)": round(span.atributos["pico_rss_mb"]) if span.atributos.get("pico_rss_mb") else None,
+                "Erro": span.erro,
+            }
+            for span in execucao.etapas()
+        ])
+        st.dataframe(tabela, hide_index=True, use_container_width=True)
+        st.caption(f"Total: {execucao.duracao:.2f}s · JSON e Prometheus em {DIRETORIO_METRICAS}")
+
+def exibir_cache_leituras():
+    """Mostra na sidebar o uso do cache de planilhas lidas"""
+    cache = obter_cache()
+    if not len(cache):
+        return
+    
+    with st.sidebar.expander("🗂️ Cache de leituras"):
+        st.markdown(f"**Entradas:** {len(cache)}")
+        st.markdown(f"**Memória:** {cache.memoria_usada() / 1024 / 1024:.1f} de {cache.memoria_maxima / 1024 / 1024:.0f} MB")
+        st.markdown(f"**Acertos / falhas:** {cache.estatisticas['acertos']} / {cache.estatisticas['falhas']}")
+
+def dados_atuais_lojas_meses(token, chaves):
+    """Linhas atuais das lojas/meses em chaves: partições, ou consolidado (com os deltas pendentes no modo delta)"""
+    if MODO_ARMAZENAMENTO == "particoes":
+        armazenamento = CONSOLIDADOR.armazenamento_particionado(token)
+        if armazenamento.carregar_manifesto() is not None:
+            return armazenamento.ler_particoes(chaves)
+    
+    def carregar_consolidado():
+        return CONSOLIDADOR.carregar_consolidado(token)[1]
+    
+    if MODO_ENVIO == "delta":
+        df_atual, _ = CONSOLIDADOR.registro_deltas(token).estado_atual(carregar_consolidado)
+    else:
+        df_atual = carregar_consolidado()
+    return df_atual[mascara_lojas_meses(df_atual, chaves)] if len(df_atual) else df_atual
+
+def exibir_diferencas(token, df, chave_envio):
+    """
+    Prévia do que a consolidação muda em cada loja/mês do arquivo (bonificacao/impressoes.py)
+    A comparação fica na sessão enquanto o mesmo arquivo e aba estiverem carregados
+    """
+    with st.expander("🧮 Diferenças em relação ao consolidado"):
+        comparacao = st.session_state.get("diferencas_envio")
+        if comparacao is None or comparacao[0] != chave_envio:
+            try:
+                with st.spinner("Comparando com o consolidado atual..."):
+                    df_novo = preparar_dados_novos(df)
+                    df_atual = dados_atuais_lojas_meses(token, chaves_lojas_meses(df_novo))
+                    comparacao = (chave_envio, comparar_particoes(df_atual, df_novo), datetime.now())
+            except Exception as e:
+                logger.warning(f"Erro ao comparar com o consolidado: {e}")
+                st.error(f"❌ Não foi possível comparar com o consolidado: {str(e)}")
+                return
+            st.session_state.diferencas_envio = comparacao
+        _, tabela, comparado_em = comparacao
+        
+        situacoes = tabela["Situação"].value_counts()
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Lojas/meses novas", int(situacoes.get("nova", 0)))
+        with col2:
+            st.metric("Lojas/meses alteradas", int(situacoes.get("alterada", 0)))
+        with col3:
+            st.metric("Sem alteração", int(situacoes.get("sem alteração", 0)))
         
-        progress_bar.progress(95)
+        if len(tabela) and situacoes.get("sem alteração", 0) == len(tabela):
+            st.info("ℹ️ Nenhuma loja/mês muda: a consolidação só vai arquivar a cópia do envio")
+        st.dataframe(tabela, hide_index=True, use_container_width=True)
+        st.caption(f"Alteradas: mesmo NOME, FUNÇÃO e DATA com outro conteúdo · "
+                   f"comparado às {comparado_em.strftime('%H:%M:%S')}")
+
+def exibir_cobertura(token):
+    """
+    Cobertura por loja e mês a partir do índice de resumo (bonificacao/resumo.py)
+    Não baixa o consolidado; o índice só é baixado de novo quando muda
+    """
+    with st.expander("📊 Cobertura por loja e mês"):
+        try:
+            resumo = CONSOLIDADOR.carregar_resumo(token)
+        except Exception as e:
+            st.error(f"❌ Erro ao ler o índice de resumo: {str(e)}")
+            return
         
-        # 9. Remover lock
-        status_text.info("🔓 Liberando sistema...")
-        remover_lock(token, session_id)
+        if resumo is None or resumo[0].empty:
+            st.info("O índice de resumo será criado na próxima consolidação")
+            return
+        tabela, origem, atualizado_em = resumo
         
-        progress_bar.progress(100)
-        status_text.success("✅ Processo concluído com sucesso!")
+        if MODO_ARMAZENAMENTO == "xlsx" and origem != CONSOLIDADOR.etag_consolidado(token):
+            st.warning("⚠️ O consolidado mudou desde a última atualização do índice; "
+                       "ele será reconstruído na próxima consolidação")
         
-        # Exibir resumo final
-        st.markdown("---")
-        st.markdown("### 📊 Resumo da Consolidação")
+        mes = st.selectbox("Mês", sorted(tabela["MES_ANO"].unique(), reverse=True), key="mes_cobertura")
+        do_mes = tabela[tabela["MES_ANO"] == mes].sort_values("LOJA", key=lambda lojas: lojas.astype(str))
+        lojas = sorted(tabela["LOJA"].astype(str).unique())
+        faltando = sorted(set(lojas) - set(do_mes["LOJA"].astype(str)))
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Registros Novos", len(df_novo))
+            st.metric("Lojas com envio", f"{len(do_mes)} de {len(lojas)}")
         with col2:
-            st.metric("Registros Removidos", registros_removidos if 'registros_removidos' in locals() else 0)
+            st.metric("Registros", f"{int(do_mes['LINHAS'].sum()):,}".replace(",", "."))
         with col3:
-            st.metric("Registros Preservados", len(df_consolidado_filtrado) if len(df_consolidado_filtrado) > 0 else 0)
+            st.metric("R$ Total", f"{do_mes['R$_TOTAL'].sum():,.2f}")
         with col4:
-            st.metric("Total Final", len(df_final))
-        
-        return True
-        
+            st.metric("A Pagar", f"{do_mes['A PAGAR'].sum():,.2f}")
+        
+        st.dataframe(
+            do_mes[["LOJA", "LINHAS", "R$_TOTAL", "PAGO", "A PAGAR", "ULTIMO_ENVIO"]],
+            hide_index=True, use_container_width=True,
+            column_config={"ULTIMO_ENVIO": st.column_config.DatetimeColumn("Último envio", format="DD/MM/YYYY HH:mm")}
+        )
+        if faltando:
+            st.warning(f"⚠️ {len(faltando)} loja(s) sem envio em {mes}: {', '.join(faltando[:30])}"
+                       f"{'...' if len(faltando) > 30 else ''}")
+        
+        if st.toggle("Linhas por loja e mês", key="cobertura_completa"):
+            st.dataframe(tabela.pivot_table(index="LOJA", columns="MES_ANO", values="LINHAS", aggfunc="sum"),
+                         use_container_width=True)
+        st.caption(f"Índice atualizado em {atualizado_em.replace('T', ' ')}")
+
+# ===========================
+# FILA DE CONSOLIDAÇÃO (GRAVAÇÃO EM GRUPO)
+# ===========================
+@st.cache_resource
+def obter_fila_consolidacao():
+    """Fila única do processo, compartilhada por todas as sessões"""
+    return FilaConsolidacao(lambda envios: CONSOLIDADOR.consolidar_envios(envios, origem="fila"))
+
+def processar_envio_fila(df_novo, nome_arquivo_original, token, conteudo_original):
+    """Enfileira o envio, aguarda o lote em que ele foi consolidado e exibe o resultado"""
+    fila = obter_fila_consolidacao()
+    
+    df_novo_processado = preparar_dados_novos(df_novo)
+    exibir_combinacoes_atualizadas(df_novo_processado)
+    
+    a_frente = fila.pendentes()
+    futuro = fila.enviar({"df": df_novo, "nome": nome_arquivo_original, "conteudo": conteudo_original})
+    if a_frente:
+        st.info(f"⏳ {a_frente} envio(s) sendo consolidados antes deste; ele entrará no próximo lote")
+    
+    try:
+        with st.spinner("💾 Consolidando (backup, consolidado e cópia do envio)..."):
+            resultado = futuro.result()
     except Exception as e:
-        logger.error(f"Erro na consolidação: {e}")
-        remover_lock(token, session_id, force=True)
-        status_text.error(f"❌ Erro durante o processo: {str(e)}")
-        progress_bar.empty()
-        st.error("Sistema liberado automaticamente após erro")
+        logger.error(f"Erro na consolidação em lote: {e}")
+        st.error(f"❌ Erro durante o processo: {str(e)}")
         return False
+    
+    if not resultado["sucesso"]:
+        st.error(f"❌ {resultado['erro']}")
+        return False
+    
+    if resultado["envios_no_lote"] > 1:
+        st.info(f"📦 Consolidado junto com outros {resultado['envios_no_lote'] - 1} envio(s) em uma única gravação")
+    if resultado["snapshot"]:
+        st.info(f"📸 Snapshot completo do consolidado criado: {resultado['snapshot']}")
+    if resultado["backup"]:
+        st.success(f"✅ Backup criado: {resultado['backup']}")
+    if resultado["novos"]:
+        st.success(f"✅ {resultado['removidos']} registros antigos substituídos")
+        st.success("✅ Arquivo consolidado atualizado com sucesso!")
+    else:
+        st.info("ℹ️ Nenhuma loja/mês deste arquivo mudou em relação ao consolidado. Nada foi regravado.")
+    if resultado["copia_envio"] is not None:
+        registrar_envio_consolidado(conteudo_original, resultado["copia_envio"])
+        st.success(f"✅ Cópia salva: {nome_arquivo_envio(hash_conteudo(conteudo_original), nome_arquivo_original)}")
+    
+    exibir_resumo_consolidacao(
+        resultado["novos"],
+        resultado["removidos"],
+        resultado["preservados"],
+        resultado["total_final"],
+        resultado.get("inalterados", 0)
+    )
+    return True
+
+# ===========================
+# LOG DE DELTAS (COMPACTAÇÃO EM SEGUNDO PLANO)
+# ===========================
+@st.cache_resource
+def obter_compactador_deltas():
+    """Compactador único do processo, compartilhado por todas as sessões"""
+    return CompactadorDeltas(CONSOLIDADOR.compactar_deltas)
+
+def registrar_envio_delta(token, df_novo_processado, conteudo_original, nome_arquivo_original):
+    """
+    Grava o envio (já com DATA_ULTIMO_ENVIO) como delta e salva a cópia ENVIO
+    Retorna a cópia ENVIO gravada (ou None); levanta exceção se o delta não foi gravado
+    """
+    CONSOLIDADOR.registro_deltas(token).registrar(df_novo_processado)
+    obter_compactador_deltas().avisar_envio()
+    return CONSOLIDADOR.enviar_copia_envio(token, conteudo_original, nome_arquivo_original)
+
+@execucao_medida("Envio como delta", origem="delta")
+def processar_envio_delta(df_novo, nome_arquivo_original, token, conteudo_original):
+    """Registra o envio como delta; o consolidado é atualizado pela próxima compactação"""
+    df_novo_processado = preparar_dados_novos(df_novo)
+    exibir_combinacoes_atualizadas(df_novo_processado)
+    
+    try:
+        with st.spinner("💾 Registrando envio..."):
+            copia = registrar_envio_delta(token, df_novo_processado, conteudo_original, nome_arquivo_original)
+    except Exception as e:
+        logger.error(f"Erro ao registrar delta: {e}")
+        st.error(f"❌ Erro durante o processo: {str(e)}")
+        return False
+    
+    st.success(f"✅ Envio registrado: {len(df_novo)} registros")
+    if copia is not None:
+        registrar_envio_consolidado(conteudo_original, copia)
+        st.success(f"✅ Cópia salva: {nome_arquivo_envio(hash_conteudo(conteudo_original), nome_arquivo_original)}")
+    st.info(f"🕒 Os dados entram no arquivo consolidado na próxima compactação "
+            f"(em até {INTERVALO_COMPACTACAO_SEGUNDOS // 60} minutos)")
+    return True
+
+def registrar_lote_deltas(aprovados, token):
+    """Registra cada arquivo validado como um delta, na ordem da lista"""
+    linhas = []
+    registrados = 0
+    with st.spinner(f"💾 Registrando {len(aprovados)} arquivos..."):
+        for nome, conteudo, df in aprovados:
+            try:
+                copia = registrar_envio_delta(token, preparar_dados_novos(df), conteudo, nome)
+            except Exception as e:
+                logger.error(f"Erro ao registrar delta de {nome}: {e}")
+                linhas.append({"Arquivo": nome, "Registros": len(df), "Situação": f"❌ {e}"})
+                continue
+            if copia is not None:
+                registrar_envio_consolidado(conteudo, copia)
+            registrados += 1
+            linhas.append({"Arquivo": nome, "Registros": len(df), "Situação": "✅ Registrado"})
+    st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
+    
+    if not registrados:
+        st.error("❌ Nenhum arquivo foi registrado")
+        return False
+    st.info(f"🕒 Os dados entram no arquivo consolidado na próxima compactação "
+            f"(em até {INTERVALO_COMPACTACAO_SEGUNDOS // 60} minutos)")
+    return registrados == len(aprovados)
+
+def exibir_deltas_pendentes(token):
+    """Mostra na sidebar os envios ainda não compactados no consolidado"""
+    compactador = obter_compactador_deltas()
+    with st.sidebar.expander("🧾 Envios pendentes"):
+        try:
+            pendentes, _, atrasados, _ = CONSOLIDADOR.registro_deltas(token).situacao()
+        except Exception as e:
+            st.error(f"❌ Erro ao ler os deltas: {str(e)}")
+            return
+        
+        st.metric("Aguardando compactação", len(pendentes))
+        if compactador.estatisticas["ultima"] is not None:
+            st.markdown(f"**Última compactação:** {compactador.estatisticas['ultima'].strftime('%d/%m/%Y %H:%M:%S')}")
+        if compactador.estatisticas["ultimo_erro"]:
+            st.warning(f"⚠️ Última falha: {compactador.estatisticas['ultimo_erro']}")
+        if atrasados:
+            st.warning(f"⚠️ {len(atrasados)} envio(s) gravado(s) depois de uma compactação mais recente "
+                       "não foram aplicados; reenvie esses arquivos")
+        
+        if pendentes and st.button("🗜️ Compactar agora", use_container_width=True):
+            compactador.compactar_agora()
+            st.success("✅ Compactação iniciada")
+        
+        if st.button("📥 Gerar planilha com os pendentes", use_container_width=True):
+            with st.spinner("Aplicando envios pendentes ao consolidado..."):
+                df_atual, _ = CONSOLIDADOR.registro_deltas(token).estado_atual(lambda: CONSOLIDADOR.carregar_consolidado(token)[1])
+                st.session_state.planilha_estado_atual = gerar_xlsx(df_atual)
+        if st.session_state.get("planilha_estado_atual"):
+            st.download_button("💾 Baixar planilha atualizada", st.session_state.planilha_estado_atual,
+                               file_name=ARQUIVO_CONSOLIDADO, use_container_width=True)
+
+# ===========================
+# UPLOAD EM LOTE (VÁRIOS ARQUIVOS)
+# ===========================
+def processar_lote_arquivos(aprovados, token):
+    """
+    Consolida vários arquivos validados em uma única passada
+    (uma leitura, um backup e uma gravação do consolidado)
+    aprovados: lista de (nome, conteudo, df)
+    """
+    if MODO_ENVIO == "delta":
+        return registrar_lote_deltas(aprovados, token)
+    
+    envios = [{"df": df, "nome": nome, "conteudo": conteudo} for nome, conteudo, df in aprovados]
+    
+    try:
+        with st.spinner(f"💾 Consolidando {len(envios)} arquivos em uma única gravação..."):
+            if MODO_ENVIO == "fila":
+                futuros = obter_fila_consolidacao().enviar_varios(envios)
+                resultados = [futuro.result() for futuro in futuros]
+            else:
+                resultados = CONSOLIDADOR.consolidar_envios(envios)
+    except Exception as e:
+        logger.error(f"Erro na consolidação em lote: {e}")
+        st.error(f"❌ Erro durante o processo: {str(e)}")
+        return False
+    
+    linhas = []
+    for envio, resultado in zip(envios, resultados):
+        if resultado["sucesso"] and resultado["copia_envio"] is not None:
+            registrar_envio_consolidado(envio["conteudo"], resultado["copia_envio"])
+        linhas.append({
+            "Arquivo": envio["nome"],
+            "Registros Novos": resultado.get("novos", 0),
+            "Registros Removidos": resultado.get("removidos", 0),
+            "Sem Alteração": resultado.get("inalterados", 0),
+            "Situação": "✅ Consolidado" if resultado["sucesso"] else f"❌ {resultado['erro']}",
+        })
+    st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
+    
+    consolidados = [r for r in resultados if r["sucesso"]]
+    if not consolidados:
+        st.error("❌ Nenhum arquivo foi consolidado")
+        return False
+    
+    if consolidados[0]["snapshot"]:
+        st.info(f"📸 Snapshot completo do consolidado criado: {consolidados[0]['snapshot']}")
+    if consolidados[0]["backup"]:
+        st.success(f"✅ Backup criado: {consolidados[0]['backup']}")
+    if any(r["novos"] for r in consolidados):
+        st.success("✅ Arquivo consolidado atualizado com sucesso!")
+    else:
+        st.info("ℹ️ Nenhuma loja/mês destes arquivos mudou em relação ao consolidado. Nada foi regravado.")
+    
+    total_final = consolidados[-1]["total_final"]
+    exibir_resumo_consolidacao(
+        sum(r["novos"] for r in consolidados),
+        sum(r["removidos"] for r in consolidados),
+        total_final - sum(r["mantidos"] for r in consolidados),
+        total_final,
+        sum(r.get("inalterados", 0) for r in consolidados)
+    )
+    return len(consolidados) == len(resultados)
+
+def exibir_upload_lote(token):
+    """Upload de vários arquivos: leitura e validação em paralelo e consolidação única"""
+    arquivos = st.file_uploader(
+        "Escolha os arquivos Excel",
+        type=["xlsx", "xls"],
+        accept_multiple_files=True,
+        help="Cada arquivo deve ter a aba 'Dados' com as colunas obrigatórias"
+    )
+    if not arquivos:
+        return
+    
+    conteudos = [(arquivo.name, arquivo.getvalue()) for arquivo in arquivos]
+    
+    barra = st.progress(0.0, text=f"📖 Lendo e validando {len(conteudos)} arquivos...")
+    validacoes = ler_e_validar_arquivos(conteudos, progresso=lambda nome, lidos, total: barra.progress(
+        lidos / total, text=f"📖 {lidos} de {total} arquivos validados ({nome})"))
+    barra.empty()
+    
+    st.markdown("### 🔍 Validação dos Arquivos")
+    
+    aprovados = []
+    linhas = []
+    hashes_vistos = set()
+    # Lojas/meses dos arquivos que vão para o lote: um arquivo já consolidado que
+    # divide alguma delas com um anterior volta ao lote, para continuar valendo por último
+    chaves_lote = set()
+    for (nome, conteudo), validacao in zip(conteudos, validacoes):
+        df = validacao["df"]
+        
+        if validacao["hash"] in hashes_vistos:
+            situacao = "🔁 Repetido neste lote"
+        elif validacao["erros"]:
+            situacao = "❌ Com erros"
+        else:
+            envio_existente, inalterado = verificar_envio_duplicado(token, conteudo, nome, df)
+            chaves = set(chaves_lojas_meses(df))
+            if inalterado and chaves.isdisjoint(chaves_lote):
+                situacao = "♻️ Já consolidado"
+            else:
+                if envio_existente is None:
+                    situacao = "✅ Válido"
+                elif inalterado:
+                    situacao = "✅ Válido (já consolidado, reaplicado depois de um arquivo anterior com as mesmas lojas/meses)"
+                else:
+                    situacao = "✅ Válido (já enviado antes, o consolidado mudou)"
+                aprovados.append((nome, conteudo, df))
+                chaves_lote |= chaves
+        hashes_vistos.add(validacao["hash"])
+        
+        linhas.append({
+            "Arquivo": nome,
+            "Linhas": len(df) if df is not None else 0,
+            "Lojas": df["LOJA"].dropna().nunique() if df is not None and "LOJA" in df.columns else 0,
+            "Meses": ", ".join(validacao["info_datas"].get("meses_presentes", [])),
+            "Situação": situacao,
+        })
+    
+    st.dataframe(pd.DataFrame(linhas), use_container_width=True, hide_index=True)
+    
+    for validacao in validacoes:
+        if validacao["erros"]:
+            with st.expander(f"❌ {validacao['nome']}: {len(validacao['erros'])} problema(s)"):
+                for erro in validacao["erros"]:
+                    st.error(f"• {erro}")
+                ocorrencias = validacao["ocorrencias"]
+                if ocorrencias is not None and not ocorrencias.empty:
+                    st.dataframe(pd.DataFrame({
+                        "Regra": ocorrencias["regra"],
+                        "Linhas": ocorrencias["quantidade"],
+                        "Primeiras linhas no Excel": [
+                            ", ".join(str(linha) for linha in linhas_excel(linhas[:10])) for linhas in ocorrencias["linhas"]
+                        ],
+                    }), use_container_width=True, hide_index=True)
+    
+    if not aprovados:
+        st.warning("⚠️ Nenhum arquivo válido para consolidar")
+        return
+    
+    st.divider()
+    if st.button(f"🔄 Consolidar {len(aprovados)} arquivo(s) válido(s)", type="primary", use_container_width=True):
+        st.warning("⏳ Consolidação iniciada! NÃO feche esta página!")
+        if processar_lote_arquivos(aprovados, token):
+            st.balloons()
+            st.success("🎉 Processo concluído com sucesso!")
 
 # ===========================
 # INTERFACE PRINCIPAL
@@ -747,9 +1305,11 @@ DRIVE_ID""")
     
     st.sidebar.success("✅ Conectado")
 
-    # Status do sistema
-    st.markdown("## 🔍 Status do Sistema")
-    sistema_ocupado = exibir_status_sistema(token)
+    # Status do sistema (no modo otimista não há lock a consultar)
+    sistema_ocupado = False
+    if MODO_CONCORRENCIA == "lock" or MODO_ARMAZENAMENTO == "particoes":
+        st.markdown("## 🔍 Status do Sistema")
+        sistema_ocupado = exibir_status_sistema(token)
     
     if sistema_ocupado:
         st.divider()
@@ -802,8 +1362,12 @@ DRIVE_ID""")
     # Informações do sistema
     with st.sidebar.expander("ℹ️ Informações"):
         st.markdown(f"**Modo:** Consolidação Inteligente")
-        st.markdown(f"**Consolidado:** bonificacao_consolidada.xlsx")
+        st.markdown(f"**Consolidado:** {ARQUIVO_CONSOLIDADO}")
         st.markdown(f"**Pasta:** {PASTA_CONSOLIDADO}")
+        st.markdown(f"**Drive:** {f'local ({DRIVE_LOCAL})' if DRIVE_LOCAL else 'SharePoint'}")
+        st.markdown(f"**Armazenamento:** {MODO_ARMAZENAMENTO}")
+        st.markdown(f"**Concorrência:** {MODO_CONCORRENCIA}")
+        st.markdown(f"**Envio:** {MODO_ENVIO}")
         
         with st.expander("📋 Colunas Obrigatórias"):
             st.markdown('<div class="column-list">', unsafe_allow_html=True)
@@ -811,11 +1375,31 @@ DRIVE_ID""")
                 st.text(f"• {col}")
             st.markdown('</div>', unsafe_allow_html=True)
 
+    if MODO_ARMAZENAMENTO == "particoes":
+        exibir_exportacao_particoes(token)
+    else:
+        exibir_historico_consolidado(token)
+    
+    if MODO_ENVIO == "delta":
+        exibir_deltas_pendentes(token)
+    
+    exibir_latencia_graph()
+    exibir_etapas_execucoes()
+    exibir_cache_leituras()
+
+    exibir_cobertura(token)
+
     # Upload de arquivo
     st.markdown("## 📤 Upload de Planilha Excel")
     
     st.info("📋 A planilha deve ter uma aba 'Dados' com todas as colunas obrigatórias")
 
+    # Vários arquivos de uma vez (consolidados em uma única gravação do xlsx)
+    if MODO_ARMAZENAMENTO == "xlsx" and st.toggle("📚 Enviar vários arquivos de uma vez"):
+        exibir_upload_lote(token)
+        exibir_rodape()
+        return
+
     uploaded_file = st.file_uploader(
         "Escolha um arquivo Excel", 
         type=["xlsx", "xls"],
@@ -823,13 +1407,19 @@ DRIVE_ID""")
     )
 
     df = None
+    conteudo_original = None
+    hash_envio = None
+    sheet = None
     if uploaded_file:
+        conteudo_original = uploaded_file.getvalue()
+        hash_envio = hash_conteudo(conteudo_original)
+        
         try:
             st.success(f"📁 Arquivo carregado: {uploaded_file.name}")
             
             with st.spinner("📖 Lendo arquivo..."):
-                xls = pd.ExcelFile(uploaded_file)
-                sheets = xls.sheet_names
+                # Leitura memorizada pelo hash do conteúdo: reexecuções não abrem o Excel de novo
+                sheets = abas_em_cache(conteudo_original, hash_envio)
                 
                 if "Dados" in sheets:
                     sheet = "Dados"
@@ -839,11 +1429,23 @@ DRIVE_ID""")
                     if sheet != "Dados":
                         st.warning("⚠️ Recomendamos usar uma aba chamada 'Dados'")
                 
-                df = pd.read_excel(uploaded_file, sheet_name=sheet)
-                df.columns = df.columns.str.strip().str.upper()
+                df = ler_aba_em_cache(conteudo_original, hash_envio, sheet)
                 
                 st.success(f"✅ Dados carregados: {len(df)} linhas, {len(df.columns)} colunas")
                 
+                # Envio repetido (pelo hash): só dispensado se as lojas/meses continuam como ele deixou
+                envio_existente, inalterado = verificar_envio_duplicado(token, conteudo_original,
+                                                                       uploaded_file.name, df)
+                if envio_existente is not None:
+                    consolidado_em = envio_existente.get("lastModifiedDateTime", "")[:19].replace("T", " ")
+                    if inalterado:
+                        st.info(f"♻️ Este arquivo já foi consolidado anteriormente ({consolidado_em}). Nenhuma alteração necessária.")
+                        if not st.checkbox("Consolidar novamente mesmo assim"):
+                            st.stop()
+                    else:
+                        st.info(f"♻️ Este arquivo já foi enviado antes ({consolidado_em}), mas o consolidado mudou "
+                                "desde então. Ele será consolidado novamente.")
+                
                 # Preview dos dados
                 with st.expander("👀 Preview dos Dados", expanded=True):
                     st.dataframe(df.head(10), use_container_width=True)
@@ -869,13 +1471,15 @@ DRIVE_ID""")
         st.markdown("### 🔍 Validação dos Dados")
         
         with st.spinner("🔄 Validando dados e estrutura..."):
-            erros, avisos = validar_dados_enviados(df, token)
+            erros, avisos = validar_dados_enviados(df, token, hash_envio, sheet)
         
         if erros:
             st.error("❌ **Problemas encontrados:**")
             for erro in erros:
                 st.error(f"• {erro}")
             
+            exibir_ocorrencias_validacao(df, st.session_state.get('ocorrencias_validacao'))
+            
             # Mostrar comparação de colunas se houver erro de estrutura
             st.markdown("---")
             st.markdown("### 📋 Comparação de Estrutura")
@@ -908,6 +1512,8 @@ DRIVE_ID""")
             st.markdown("### ℹ️ Informações Adicionais")
             for aviso in avisos:
                 st.info(aviso)
+            
+            exibir_ocorrencias_validacao(df, st.session_state.get('ocorrencias_validacao'))
         
         # Mostrar informações sobre os meses que serão atualizados
         if 'info_datas' in st.session_state and st.session_state.info_datas:
@@ -929,6 +1535,8 @@ DRIVE_ID""")
             if 'meses_presentes' in info_datas:
                 st.info(f"**Meses identificados:** {', '.join(info_datas['meses_presentes'])}")
         
+        exibir_diferencas(token, df, (hash_envio, sheet))
+        
         st.divider()
         
         # Botões de ação
@@ -938,7 +1546,14 @@ DRIVE_ID""")
             if st.button("🔄 Consolidar Dados (Inteligente)", type="primary", use_container_width=True):
                 st.warning("⏳ Consolidação iniciada! NÃO feche esta página!")
                 
-                sucesso = processar_consolidacao_inteligente(df, uploaded_file.name, token)
+                if MODO_ARMAZENAMENTO == "particoes":
+                    sucesso = processar_consolidacao_particionada(df, uploaded_file.name, token, conteudo_original)
+                elif MODO_ENVIO == "fila":
+                    sucesso = processar_envio_fila(df, uploaded_file.name, token, conteudo_original)
+                elif MODO_ENVIO == "delta":
+                    sucesso = processar_envio_delta(df, uploaded_file.name, token, conteudo_original)
+                else:
+                    sucesso = processar_consolidacao_inteligente(df, uploaded_file.name, token, conteudo_original)
                 
                 if sucesso:
                     st.balloons()
@@ -948,7 +1563,10 @@ DRIVE_ID""")
             if st.button("🔄 Limpar Tela", type="secondary", use_container_width=True):
                 st.rerun()
 
-    # Footer
+    exibir_rodape()
+
+def exibir_rodape():
+    """Rodapé da página"""
     st.markdown("---")
     st.markdown(f"""
     <div style="text-align: center; padding: 1rem; color: #666;">
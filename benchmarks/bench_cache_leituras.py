@@ -0,0 +1,64 @@
+"""
+Benchmark do cache de leituras: reexecuções da tela do Streamlit com o
+mesmo upload (escolha de aba, botão Consolidar), sem cache e com o
+CacheLeituras.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_cache_leituras
+    python -m benchmarks.bench_cache_leituras --linhas 10000 100000 --reexecucoes 5
+"""
+import argparse
+import time
+from io import BytesIO
+
+from benchmarks.dados_sinteticos import gerar_planilha
+from bonificacao.arquivo_envios import hash_conteudo
+from bonificacao.cache_leituras import CacheLeituras, abas_em_cache, ler_aba_em_cache, validar_em_cache
+from bonificacao.esquema import ABA_DADOS
+from bonificacao.excel import abrir_planilha, gerar_xlsx, ler_aba
+from bonificacao.validacao import avaliar_planilha
+
+
+def reexecucao_sem_cache(conteudo):
+    """O que cada reexecução fazia: abrir, ler e validar o upload inteiro"""
+    with abrir_planilha(BytesIO(conteudo)) as planilha:
+        df = ler_aba(planilha, ABA_DADOS)
+    return avaliar_planilha(df)
+
+
+def reexecucao_com_cache(conteudo, cache):
+    hash_envio = hash_conteudo(conteudo)
+    abas_em_cache(conteudo, hash_envio, cache)
+    df = ler_aba_em_cache(conteudo, hash_envio, ABA_DADOS, cache)
+    return validar_em_cache(df, hash_envio, ABA_DADOS, cache)
+
+
+def medir(funcao, reexecucoes):
+    inicio = time.perf_counter()
+    funcao()
+    primeira = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    for _ in range(reexecucoes):
+        funcao()
+    return primeira, (time.perf_counter() - inicio) / max(reexecucoes, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 50_000])
+    parser.add_argument('--reexecucoes', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'linhas':>8} {'sem cache (s)':>14} {'1ª com cache (s)':>17} {'reexecução (s)':>15} {'memória (MB)':>13}")
+    for linhas in args.linhas:
+        conteudo = gerar_xlsx(gerar_planilha(linhas))
+        cache = CacheLeituras()
+
+        _, t_sem_cache = medir(lambda: reexecucao_sem_cache(conteudo), args.reexecucoes)
+        primeira, t_com_cache = medir(lambda: reexecucao_com_cache(conteudo, cache), args.reexecucoes)
+        print(f"{linhas:>8} {t_sem_cache:>14.3f} {primeira:>17.3f} {t_com_cache:>15.4f} "
+              f"{cache.memoria_usada() / 1024 / 1024:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
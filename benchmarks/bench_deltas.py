@@ -0,0 +1,132 @@
+"""
+Benchmark do log de deltas: latência de cada envio gravando só o delta
+(RegistroDeltas) contra a consolidação completa (baixar, ler, substituir,
+serializar e regravar o consolidado), no Graph simulado.
+
+Depois dos envios, confere que estado_atual (consolidado + pendentes) e o
+consolidado compactado têm as mesmas linhas que a consolidação completa.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_deltas
+    python -m benchmarks.bench_deltas --linhas 50000 --envios 20
+"""
+import argparse
+import time
+from datetime import datetime
+from io import BytesIO
+
+from benchmarks.bench_fila_consolidacao import gerar_envios
+from benchmarks.dados_sinteticos import gerar_planilha
+from bonificacao.deltas import PASTA_DELTAS, RegistroDeltas
+from bonificacao.excel import gerar_xlsx, ler_planilha
+from bonificacao.graph import ClienteGraph, listar_pasta, url_item_drive
+from bonificacao.graph_simulado import SimuladorGraph
+from bonificacao.motor import consolidar, consolidar_lote
+
+PASTA = "FontedeDados"
+ARQUIVO_CONSOLIDADO = "bonificacao_consolidada.xlsx"
+
+
+class DriveSimulado:
+    """Leitura, gravação, listagem e remoção relativas a PASTA, pelo HTTP do simulador"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.cliente = ClienteGraph()
+
+    def url(self, caminho):
+        return url_item_drive("site", "drive", f"{PASTA}/{caminho}", base_url=self.base_url)
+
+    def ler_bytes(self, caminho):
+        response = self.cliente.get(f"{self.url(caminho)}:/content")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+    def gravar_bytes(self, caminho, conteudo):
+        return self.cliente.put(f"{self.url(caminho)}:/content", data=conteudo).status_code in (200, 201)
+
+    def listar(self):
+        return [item['name'] for item in listar_pasta(self.url(PASTA_DELTAS), token=None, cliente=self.cliente)
+                if 'folder' not in item]
+
+    def remover(self, caminho):
+        self.cliente.delete(self.url(caminho))
+
+    def ler_consolidado(self):
+        return ler_planilha(BytesIO(self.ler_bytes(ARQUIVO_CONSOLIDADO)), "Dados")
+
+
+def preparar(df):
+    df = df.copy()
+    df['DATA_ULTIMO_ENVIO'] = datetime.now()
+    return df
+
+
+def envio_completo(drive, df_novo):
+    """O que cada envio fazia: o consolidado inteiro é lido e regravado"""
+    df_final, _, _ = consolidar(drive.ler_consolidado(), df_novo)
+    drive.gravar_bytes(ARQUIVO_CONSOLIDADO, gerar_xlsx(df_final))
+
+
+def medir_envios(funcao, envios):
+    tempos = []
+    for df_novo in envios:
+        inicio = time.perf_counter()
+        funcao(df_novo)
+        tempos.append(time.perf_counter() - inicio)
+    return sum(tempos) / len(tempos), max(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, default=10_000, help="linhas do consolidado inicial")
+    parser.add_argument('--envios', type=int, default=5)
+    parser.add_argument('--linhas-envio', type=int, default=200)
+    args = parser.parse_args()
+
+    xlsx_inicial = gerar_xlsx(gerar_planilha(args.linhas, lojas=300, meses=12))
+    envios = [preparar(df) for df in gerar_envios(args.envios, args.linhas_envio)]
+
+    with SimuladorGraph() as simulador:
+        drive = DriveSimulado(f"{simulador.url_servidor}/v1.0")
+
+        drive.gravar_bytes(ARQUIVO_CONSOLIDADO, xlsx_inicial)
+        t_completo, max_completo = medir_envios(lambda df: envio_completo(drive, df), envios)
+        df_completo = drive.ler_consolidado()
+
+        drive.gravar_bytes(ARQUIVO_CONSOLIDADO, xlsx_inicial)
+        registro = RegistroDeltas(drive.listar, drive.ler_bytes, drive.gravar_bytes, drive.remover, idade_minima=0)
+        t_delta, max_delta = medir_envios(registro.registrar, envios)
+
+        inicio = time.perf_counter()
+        df_atual, aplicados = registro.estado_atual(drive.ler_consolidado)
+        t_leitura = time.perf_counter() - inicio
+
+        def aplicar(frames):
+            df_final, _ = consolidar_lote(drive.ler_consolidado(), frames)
+            drive.gravar_bytes(ARQUIVO_CONSOLIDADO, gerar_xlsx(df_final))
+
+        inicio = time.perf_counter()
+        compactados = registro.compactar(aplicar)
+        t_compactacao = time.perf_counter() - inicio
+        df_compactado = drive.ler_consolidado()
+        restantes = registro.pendentes()
+
+    print(f"consolidado: {args.linhas} linhas; {args.envios} envios de {args.linhas_envio} linhas")
+    print(f"{'envio':>10} {'média (s)':>10} {'máximo (s)':>11}")
+    print(f"{'completo':>10} {t_completo:>10.3f} {max_completo:>11.3f}")
+    print(f"{'delta':>10} {t_delta:>10.3f} {max_delta:>11.3f}")
+    print(f"ganho por envio: {t_completo / t_delta:.0f}x")
+    print(f"estado_atual com {len(aplicados)} pendentes: {t_leitura:.2f}s")
+    print(f"compactação de {len(compactados)} deltas (uma gravação): {t_compactacao:.2f}s")
+
+    linhas = {len(df_completo), len(df_atual), len(df_compactado)}
+    if len(linhas) != 1 or restantes:
+        raise SystemExit(f"Divergência: completo {len(df_completo)}, estado_atual {len(df_atual)}, "
+                         f"compactado {len(df_compactado)}, pendentes {len(restantes)}")
+
+
+if __name__ == '__main__':
+    main()
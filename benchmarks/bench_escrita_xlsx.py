@@ -0,0 +1,56 @@
+"""
+Benchmark da escrita do consolidado: pd.ExcelWriter(openpyxl) contra o
+escritor em streaming de bonificacao.excel.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_escrita_xlsx
+    python -m benchmarks.bench_escrita_xlsx --linhas 10000 100000 200000
+"""
+import argparse
+import time
+import tracemalloc
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.dados_sinteticos import gerar_planilha
+from bonificacao.excel import gerar_xlsx
+
+
+def escrever_pandas(df):
+    """Escrita anterior (modelo de objetos completo do openpyxl)"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, sheet_name='Dados', index=False)
+    return output.getvalue()
+
+
+def medir(funcao, df):
+    """Retorna (segundos, pico de memória alocada em MB, tamanho em MB)"""
+    inicio = time.perf_counter()
+    conteudo = funcao(df)
+    segundos = time.perf_counter() - inicio
+
+    tracemalloc.start()
+    funcao(df)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return segundos, pico / 2**20, len(conteudo) / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 50_000])
+    args = parser.parse_args()
+
+    print(f"{'linhas':>8} {'escritor':>10} {'tempo (s)':>10} {'pico (MB)':>10} {'arquivo (MB)':>13}")
+    for linhas in args.linhas:
+        df = gerar_planilha(linhas)
+        for nome, funcao in (('pandas', escrever_pandas), ('streaming', gerar_xlsx)):
+            segundos, pico, tamanho = medir(funcao, df)
+            print(f"{linhas:>8} {nome:>10} {segundos:>10.2f} {pico:>10.1f} {tamanho:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark da fila de consolidação: N lojas enviando ao mesmo tempo,
+consolidação um a um (lock) contra gravação em grupo (FilaConsolidacao).
+
+Cada gravação serializa o consolidado inteiro com gerar_xlsx e espera
+--latencia segundos, representando download e upload no Graph.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_fila_consolidacao
+    python -m benchmarks.bench_fila_consolidacao --envios 5 20 50 --linhas 50000 --latencia 1.0
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.dados_sinteticos import gerar_planilha
+from bonificacao.excel import gerar_xlsx
+from bonificacao.fila import FilaConsolidacao
+from bonificacao.motor import consolidar, consolidar_lote
+
+
+def gerar_envios(quantidade, linhas_por_envio):
+    """Um envio por loja, com um mês de dados"""
+    envios = []
+    for posicao in range(quantidade):
+        df = gerar_planilha(linhas_por_envio, lojas=1, meses=1, seed=100 + posicao)
+        df['LOJA'] = f"LOJA {posicao:04d}"
+        envios.append(df)
+    return envios
+
+
+def gravar(df_final, latencia):
+    gerar_xlsx(df_final)
+    time.sleep(latencia)
+
+
+def consolidar_um_a_um(df_consolidado, envios, latencia):
+    """Cada envio lê, substitui e grava o consolidado inteiro"""
+    for df_novo in envios:
+        time.sleep(latencia)
+        df_consolidado, _, _ = consolidar(df_consolidado, df_novo)
+        gravar(df_consolidado, latencia)
+    return df_consolidado, len(envios)
+
+
+def consolidar_em_fila(df_consolidado, envios, latencia):
+    """Todos enviam ao mesmo tempo; a fila agrupa os pendentes em lotes"""
+    estado = {'df': df_consolidado}
+
+    def processar_lote(lote):
+        time.sleep(latencia)
+        estado['df'], contagens = consolidar_lote(estado['df'], lote)
+        gravar(estado['df'], latencia)
+        return contagens
+
+    fila = FilaConsolidacao(processar_lote, espera_agrupamento=0.05)
+    futuros = []
+    lock = threading.Lock()
+
+    def enviar(df_novo):
+        futuro = fila.enviar(df_novo)
+        with lock:
+            futuros.append(futuro)
+
+    threads = [threading.Thread(target=enviar, args=(df,)) for df in envios]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for futuro in futuros:
+        futuro.result()
+    return estado['df'], fila.estatisticas['lotes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--envios', type=int, nargs='+', default=[5, 20])
+    parser.add_argument('--linhas', type=int, default=10_000, help="linhas do consolidado inicial")
+    parser.add_argument('--linhas-envio', type=int, default=200)
+    parser.add_argument('--latencia', type=float, default=0.5, help="segundos por download/upload simulado")
+    args = parser.parse_args()
+
+    df_consolidado = gerar_planilha(args.linhas, lojas=300, meses=12)
+
+    print(f"{'envios':>7} {'gravações':>10} {'um a um (s)':>12} {'lotes':>6} {'fila (s)':>9} {'ganho':>7}")
+    for quantidade in args.envios:
+        envios = gerar_envios(quantidade, args.linhas_envio)
+
+        inicio = time.perf_counter()
+        df_serial, gravacoes = consolidar_um_a_um(df_consolidado, envios, args.latencia)
+        t_serial = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        df_fila, lotes = consolidar_em_fila(df_consolidado, envios, args.latencia)
+        t_fila = time.perf_counter() - inicio
+
+        if len(df_serial) != len(df_fila):
+            raise SystemExit(f"Divergência: um a um {len(df_serial)} linhas, fila {len(df_fila)} linhas")
+        print(f"{quantidade:>7} {gravacoes:>10} {t_serial:>12.2f} {lotes:>6} {t_fila:>9.2f} {t_serial / t_fila:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark da leitura do consolidado: pd.read_excel com openpyxl (leitura
+anterior) contra bonificacao.excel.ler_planilha (motor rápido + tipos do
+esquema).
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_leitura_xlsx
+    python -m benchmarks.bench_leitura_xlsx --linhas 50000 200000
+"""
+import argparse
+import time
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.dados_sinteticos import gerar_planilha
+from bonificacao.excel import MOTOR_LEITURA, gerar_xlsx, ler_planilha
+
+
+def ler_anterior(conteudo):
+    """Leitura anterior: openpyxl e tipos inferidos"""
+    df = pd.read_excel(BytesIO(conteudo), sheet_name='Dados', engine='openpyxl')
+    df.columns = df.columns.str.strip().str.upper()
+    return df
+
+
+def ler_nova(conteudo):
+    return ler_planilha(BytesIO(conteudo), 'Dados')
+
+
+def cronometrar(funcao, conteudo):
+    inicio = time.perf_counter()
+    df = funcao(conteudo)
+    return time.perf_counter() - inicio, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 50_000])
+    args = parser.parse_args()
+
+    print(f"Motor de leitura: {MOTOR_LEITURA or 'padrão do pandas'}")
+    print(f"{'linhas':>8} {'anterior (s)':>13} {'nova (s)':>9} {'ganho':>7} {'memória ant. (MB)':>18} {'memória nova (MB)':>18}")
+    for linhas in args.linhas:
+        conteudo = gerar_xlsx(gerar_planilha(linhas))
+
+        t_anterior, df_anterior = cronometrar(ler_anterior, conteudo)
+        t_nova, df_nova = cronometrar(ler_nova, conteudo)
+
+        if len(df_anterior) != len(df_nova):
+            raise SystemExit("Leituras divergentes")
+
+        mem_anterior = df_anterior.memory_usage(deep=True).sum() / 2**20
+        mem_nova = df_nova.memory_usage(deep=True).sum() / 2**20
+        print(f"{linhas:>8} {t_anterior:>13.2f} {t_nova:>9.2f} {t_anterior / t_nova:>6.1f}x {mem_anterior:>18.1f} {mem_nova:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark de memória da consolidação: consolidado lido e combinado como
+antes (object e float64, cópia filtrada + pd.concat) contra a
+representação compacta (bonificacao.compactacao) com o resultado montado
+coluna a coluna.
+
+Cada variante roda em um processo separado, que lê o consolidado do xlsx,
+aplica um envio e serializa o resultado, com o pico de RSS de cada etapa
+medido por benchmarks/medicao.py.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_memoria_consolidacao
+    python -m benchmarks.bench_memoria_consolidacao --linhas 100000 500000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.dados_sinteticos import gerar_planilha
+from benchmarks.medicao import medir_etapa, status_mb
+from bonificacao.compactacao import memoria_mb
+from bonificacao.esquema import aplicar_tipos
+from bonificacao.excel import abrir_planilha, gerar_xlsx, ler_aba, ler_planilha
+from bonificacao.motor import calcular_mes_ano, chaves_lojas_meses, consolidar, remover_lojas_meses
+
+VARIANTES = ('anterior', 'compacta')
+
+
+def ler_consolidado(caminho, variante):
+    with open(caminho, 'rb') as arquivo:
+        conteudo = arquivo.read()
+    if variante == 'compacta':
+        return ler_planilha(BytesIO(conteudo))
+    # Leitura anterior: só os tipos do esquema, sem compactar
+    with abrir_planilha(BytesIO(conteudo)) as planilha:
+        return aplicar_tipos(ler_aba(planilha, tipar=False))
+
+
+def combinar_anterior(df_consolidado, df_novo):
+    """Combinação anterior: MES_ANO no consolidado, cópia filtrada, pd.concat e drop"""
+    df_consolidado['MES_ANO'] = calcular_mes_ano(df_consolidado['DATA'])
+    df_filtrado, _ = remover_lojas_meses(df_consolidado, chaves_lojas_meses(df_novo))
+    df_filtrado = df_filtrado.drop(columns='MES_ANO')
+    return pd.concat([df_filtrado, df_novo.drop(columns='MES_ANO')], ignore_index=True)
+
+
+def combinar_compacta(df_consolidado, df_novo):
+    df_final, _, _ = consolidar(df_consolidado, df_novo.drop(columns='MES_ANO'))
+    return df_final
+
+
+def executar_variante(caminho, variante, linhas_envio):
+    """Roda dentro do processo filho e imprime as medidas em JSON"""
+    df_consolidado = ler_consolidado(caminho, variante)
+    pico_leitura = status_mb('VmHWM')
+
+    df_novo = gerar_planilha(linhas_envio, lojas=5, meses=2, seed=7)
+    df_novo['DATA_ULTIMO_ENVIO'] = datetime.now()
+    df_novo['MES_ANO'] = calcular_mes_ano(df_novo['DATA'])
+
+    combinar = combinar_compacta if variante == 'compacta' else combinar_anterior
+    df_final, acrescimo_merge, t_merge = medir_etapa(lambda: combinar(df_consolidado, df_novo))
+    memoria_consolidado = memoria_mb(df_consolidado)
+    del df_consolidado
+    _, acrescimo_escrita, t_escrita = medir_etapa(lambda: gerar_xlsx(df_final))
+
+    print(json.dumps({
+        'memoria_consolidado_mb': memoria_consolidado,
+        'memoria_final_mb': memoria_mb(df_final),
+        'pico_leitura_mb': pico_leitura,
+        'acrescimo_merge_mb': acrescimo_merge,
+        'acrescimo_escrita_mb': acrescimo_escrita,
+        'merge_s': t_merge,
+        'escrita_s': t_escrita,
+    }))
+
+
+def medir_em_processo(caminho, variante, linhas_envio):
+    saida = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.bench_memoria_consolidacao',
+         '--variante', variante, '--arquivo', caminho, '--linhas-envio', str(linhas_envio)],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def formatar(valor):
+    return f"{valor:.0f}" if valor is not None else "n/d"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[50_000, 200_000])
+    parser.add_argument('--linhas-envio', type=int, default=2_000)
+    parser.add_argument('--variante', choices=VARIANTES, help=argparse.SUPPRESS)
+    parser.add_argument('--arquivo', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variante:
+        executar_variante(args.arquivo, args.variante, args.linhas_envio)
+        return
+
+    print(f"{'linhas':>8} {'variante':>9} {'frame (MB)':>11} {'pico leitura (MB)':>18} "
+          f"{'merge (+MB)':>12} {'merge (s)':>10} {'escrita (+MB)':>14} {'escrita (s)':>12}")
+    for linhas in args.linhas:
+        with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as arquivo:
+            arquivo.write(gerar_xlsx(gerar_planilha(linhas, lojas=300, meses=12)))
+        try:
+            for variante in VARIANTES:
+                m = medir_em_processo(arquivo.name, variante, args.linhas_envio)
+                print(f"{linhas:>8} {variante:>9} {m['memoria_consolidado_mb']:>11.1f} "
+                      f"{formatar(m['pico_leitura_mb']):>18} {formatar(m['acrescimo_merge_mb']):>12} "
+                      f"{m['merge_s']:>10.2f} {formatar(m['acrescimo_escrita_mb']):>14} {m['escrita_s']:>12.2f}")
+        finally:
+            os.remove(arquivo.name)
+
+
+if __name__ == '__main__':
+    main()
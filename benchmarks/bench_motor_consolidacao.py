@@ -0,0 +1,102 @@
+"""
+Benchmark da substituição por loja/mês: laço iterrows (versão anterior)
+contra o anti-join por hash de bonificacao.motor.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_motor_consolidacao
+    python -m benchmarks.bench_motor_consolidacao --lojas 50 300 1000 --linhas 100000 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from bonificacao.motor import calcular_mes_ano, chaves_lojas_meses, remover_lojas_meses
+
+
+def gerar_consolidado(linhas, lojas, meses, seed=0):
+    """Gera um consolidado sintético com LOJA, DATA e MES_ANO"""
+    rng = np.random.default_rng(seed)
+    inicio = pd.Timestamp('2022-01-01')
+    datas = inicio + pd.to_timedelta(rng.integers(0, meses * 30, linhas), unit='D')
+    df = pd.DataFrame({
+        'LOJA': [f"LOJA {n:04d}" for n in rng.integers(0, lojas, linhas)],
+        'DATA': datas,
+        'TOTAL_DUTO': rng.random(linhas) * 100,
+    })
+    df['MES_ANO'] = calcular_mes_ano(df['DATA'])
+    return df
+
+
+def gerar_envio(df_consolidado, lojas_envio, meses_envio=3, linhas_por_loja_mes=20, seed=1):
+    """Gera um envio que atualiza os últimos meses de algumas lojas"""
+    rng = np.random.default_rng(seed)
+    lojas = df_consolidado['LOJA'].drop_duplicates().to_numpy()
+    lojas = rng.choice(lojas, size=min(lojas_envio, len(lojas)), replace=False)
+    meses = sorted(df_consolidado['MES_ANO'].unique())[-meses_envio:]
+    registros = [
+        {'LOJA': loja, 'MES_ANO': mes, 'DATA': pd.Period(mes).to_timestamp()}
+        for loja in lojas for mes in meses for _ in range(linhas_por_loja_mes)
+    ]
+    return pd.DataFrame(registros)
+
+
+def remover_legado(df_consolidado, df_novo):
+    """Reprodução do laço iterrows anterior, para comparação"""
+    lojas_meses_novos = df_novo[['LOJA', 'MES_ANO']].drop_duplicates()
+    registros_antes = len(df_consolidado)
+    condicao_manter = True
+    for _, row in lojas_meses_novos.iterrows():
+        loja = row['LOJA']
+        mes_ano = row['MES_ANO']
+        condicao_manter = condicao_manter & ~((df_consolidado['LOJA'] == loja) & (df_consolidado['MES_ANO'] == mes_ano))
+    df_filtrado = df_consolidado[condicao_manter].copy()
+    return df_filtrado, registros_antes - len(df_filtrado)
+
+
+def remover_anti_join(df_consolidado, df_novo):
+    return remover_lojas_meses(df_consolidado, chaves_lojas_meses(df_novo))
+
+
+def cronometrar(funcao, *args, repeticoes=3):
+    """Retorna o melhor tempo (s) e o resultado da última execução"""
+    melhor = float('inf')
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(*args)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lojas', type=int, nargs='+', default=[10, 50, 300])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--meses', type=int, default=36, help="meses de histórico no consolidado")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--sem-legado', action='store_true', help="não executa o laço anterior")
+    args = parser.parse_args()
+
+    print(f"{'linhas':>10} {'lojas':>6} {'pares':>6} {'removidos':>10} {'legado (s)':>11} {'anti-join (s)':>14} {'ganho':>7}")
+    for linhas in args.linhas:
+        for lojas in args.lojas:
+            df_consolidado = gerar_consolidado(linhas, lojas=max(lojas, 1), meses=args.meses)
+            df_novo = gerar_envio(df_consolidado, lojas_envio=lojas)
+            pares = len(df_novo[['LOJA', 'MES_ANO']].drop_duplicates())
+
+            t_novo, (_, removidos) = cronometrar(remover_anti_join, df_consolidado, df_novo, repeticoes=args.repeticoes)
+
+            if args.sem_legado:
+                print(f"{linhas:>10} {lojas:>6} {pares:>6} {removidos:>10} {'-':>11} {t_novo:>14.4f} {'-':>7}")
+                continue
+
+            t_legado, (_, removidos_legado) = cronometrar(remover_legado, df_consolidado, df_novo, repeticoes=1)
+            if removidos_legado != removidos:
+                raise SystemExit(f"Divergência: legado removeu {removidos_legado}, anti-join removeu {removidos}")
+            print(f"{linhas:>10} {lojas:>6} {pares:>6} {removidos:>10} {t_legado:>11.4f} {t_novo:>14.4f} {t_legado / t_novo:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
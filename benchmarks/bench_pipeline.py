@@ -0,0 +1,297 @@
+"""
+Benchmark de ponta a ponta da consolidação: um envio aplicado a
+consolidados de vários tamanhos, etapa por etapa, com o Graph simulado ou
+um drive em diretório local (--drive local).
+
+Cada cenário (linhas do consolidado x lojas) roda em um processo separado,
+com dados de benchmarks/dados_sinteticos.gerar_bonificacao. Etapas:
+    leitura              ler_planilha do xlsx enviado
+    validacao            avaliar_planilha do envio
+    download             consolidado baixado do drive
+    leitura_consolidado  ler_planilha do consolidado
+    merge                consolidar (substituição por loja/mês)
+    serializacao         gerar_xlsx do resultado
+    upload               envio do xlsx ao drive (no simulador, em sessão acima de 4 MB)
+    ponta_a_ponta        gravar_lote do ConsolidadorSharePoint: lock, leitura,
+                         merge, backup (delta das lojas/meses substituídas,
+                         snapshot na primeira), gravação e cópia ENVIO, como no app
+                         (cada execução com PAGO alterado, para haver o que gravar)
+    ponta_a_ponta_cache  o mesmo com o consolidado no cache local
+    ponta_a_ponta_sem_alteracao
+                         o último envio de novo: as impressões não mudam e só a
+                         cópia ENVIO é gravada
+Para cada etapa são medidos o tempo e o acréscimo de pico de RSS
+(benchmarks/medicao.py); com --repeticoes vale o menor tempo e o maior pico.
+
+O drive local (bonificacao/armazenamento.py) aceita latência por operação e
+banda limitada (--latencia-ms, --banda-mb-s), para ver quanto do tempo de
+ponta a ponta vem da rede e quanto do processamento.
+
+Os resultados vão para um JSON (--saida) com a versão do código, o
+ambiente e os cenários. --comparar lista as etapas mais lentas que em um
+resultado anterior e termina com código 1 se houver regressão.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_pipeline
+    python -m benchmarks.bench_pipeline --linhas 10000 100000 1000000 --lojas 50 1000
+    python -m benchmarks.bench_pipeline --saida novo.json --comparar anterior.json
+    python -m benchmarks.bench_pipeline --drive local --latencia-ms 80 --banda-mb-s 10
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from benchmarks.dados_sinteticos import gerar_bonificacao
+from benchmarks.medicao import medir_etapa, status_mb
+
+ETAPAS = ('leitura', 'validacao', 'download', 'leitura_consolidado', 'merge', 'serializacao', 'upload',
+          'ponta_a_ponta', 'ponta_a_ponta_cache', 'ponta_a_ponta_sem_alteracao')
+MESES = 12
+TOLERANCIA = 0.2
+RUIDO_SEGUNDOS = 0.05
+ARQUIVO_APP = 'app_upload_bonificacao_consolidado.py'
+
+
+# ===========================
+# CENÁRIO (PROCESSO FILHO)
+# ===========================
+def gerar_cenario(linhas, lojas, lojas_envio, datas_sujas):
+    """Consolidado com linhas aproximadas e um envio do último mês para lojas_envio lojas já existentes"""
+    linhas_por_loja = max(linhas // (lojas * MESES), 1)
+    df_consolidado = gerar_bonificacao(lojas, MESES, linhas_por_loja)
+    ultimo_mes = pd.Timestamp(df_consolidado['DATA'].max()).replace(day=1)
+    df_envio = gerar_bonificacao(min(lojas_envio, lojas), 1, linhas_por_loja, datas_sujas, inicio=ultimo_mes,
+                                 seed=1)
+    return df_consolidado, df_envio
+
+
+def limpar_envio(df):
+    """O envio corrigido: DATA convertida e sem as linhas de data inválida, como o usuário reenviaria"""
+    df = df.copy()
+    df['DATA'] = pd.to_datetime(df['DATA'], errors='coerce')
+    return df[df['DATA'].notna()].reset_index(drop=True)
+
+
+@contextmanager
+def abrir_consolidador(drive, latencia_ms, banda_mb_s, cache):
+    """ConsolidadorSharePoint sobre o Graph simulado ou sobre um diretório temporário"""
+    from bonificacao.armazenamento import ArmazenamentoLocal
+    from bonificacao.consolidador import ConsolidadorSharePoint
+    from bonificacao.graph_simulado import SimuladorGraph
+
+    if drive == 'local':
+        with tempfile.TemporaryDirectory() as raiz:
+            armazenamento = ArmazenamentoLocal(raiz, latencia=latencia_ms / 1000,
+                                               banda=banda_mb_s * 1024 * 1024 if banda_mb_s else None)
+            yield ConsolidadorSharePoint("site", "drive", lambda: "benchmark", cache=cache, versao="benchmark",
+                                         armazenamento=armazenamento)
+        return
+    with SimuladorGraph() as simulador:
+        yield ConsolidadorSharePoint("site", "drive", lambda: "benchmark", base_url=f"{simulador.url_servidor}/v1.0",
+                                     cache=cache, versao="benchmark")
+
+
+def executar_cenario(linhas, lojas, lojas_envio, datas_sujas, drive='simulado', latencia_ms=0, banda_mb_s=None):
+    """Roda dentro do processo filho e imprime as medidas em JSON"""
+    from bonificacao.cache_local import CacheConsolidado
+    from bonificacao.consolidador import preparar_dados_novos
+    from bonificacao.excel import gerar_xlsx, ler_planilha
+    from bonificacao.motor import consolidar
+    from bonificacao.validacao import avaliar_planilha
+
+    df_consolidado, df_envio = gerar_cenario(linhas, lojas, lojas_envio, datas_sujas)
+    xlsx_consolidado = gerar_xlsx(df_consolidado)
+    xlsx_envio = gerar_xlsx(df_envio)
+    resultado = {'linhas': len(df_consolidado), 'linhas_envio': len(df_envio),
+                 'tamanho_consolidado_mb': len(xlsx_consolidado) / 1024 / 1024, 'etapas': {}}
+    del df_consolidado, df_envio
+
+    def medir(etapa, funcao):
+        retorno, memoria, segundos = medir_etapa(funcao)
+        resultado['etapas'][etapa] = {'segundos': segundos, 'memoria_mb': memoria}
+        return retorno
+
+    with tempfile.TemporaryDirectory() as diretorio_cache, abrir_consolidador(
+            drive, latencia_ms, banda_mb_s, CacheConsolidado(diretorio_cache)) as consolidador:
+        token = consolidador.obter_token()
+        consolidador.upload_arquivo(token, consolidador.arquivo_consolidado, xlsx_consolidado,
+                                    consolidador.pasta_consolidado)
+        del xlsx_consolidado
+
+        df_envio = medir('leitura', lambda: ler_planilha(BytesIO(xlsx_envio), "Dados"))
+        erros, _, _, _ = medir('validacao', lambda: avaliar_planilha(df_envio))
+        resultado['erros_validacao'] = erros
+        df_novo = preparar_dados_novos(limpar_envio(df_envio))
+
+        arquivo = medir('download', lambda: consolidador.baixar_arquivo(token, consolidador.arquivo_consolidado))
+        df_atual = medir('leitura_consolidado', lambda: ler_planilha(arquivo, "Dados"))
+        df_final, _, _ = medir('merge', lambda: consolidar(df_atual, df_novo.drop(columns='MES_ANO')))
+        del df_atual, arquivo
+        xlsx_final = medir('serializacao', lambda: gerar_xlsx(df_final))
+        resultado['linhas_final'] = len(df_final)
+        del df_final
+        medir('upload', lambda: consolidador.upload_arquivo(token, consolidador.arquivo_consolidado, xlsx_final,
+                                                            consolidador.pasta_consolidado))
+        del xlsx_final
+
+        # O consolidado já tem este envio: sem mudar PAGO as lojas/meses seriam puladas
+        for deslocamento, etapa in enumerate(('ponta_a_ponta', 'ponta_a_ponta_cache'), start=1):
+            df_alterado = df_novo.assign(PAGO=df_novo['PAGO'] + deslocamento)
+            medir(etapa, lambda: consolidador.gravar_lote(token, [df_alterado], [(xlsx_envio, "envio.xlsx")],
+                                                          origem="benchmark"))
+        medir('ponta_a_ponta_sem_alteracao', lambda: consolidador.gravar_lote(
+            token, [df_alterado], [(xlsx_envio, "envio.xlsx")], origem="benchmark"))
+
+    resultado['rss_final_mb'] = status_mb('VmRSS')
+    print(json.dumps(resultado))
+
+
+def medir_em_processo(linhas, lojas, args):
+    comando = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--cenario', str(linhas), str(lojas),
+               '--lojas-envio', str(args.lojas_envio), '--datas-sujas', str(args.datas_sujas),
+               '--drive', args.drive, '--latencia-ms', str(args.latencia_ms)]
+    if args.banda_mb_s:
+        comando += ['--banda-mb-s', str(args.banda_mb_s)]
+    saida = subprocess.run(comando, check=True, capture_output=True, text=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def combinar_repeticoes(medidas):
+    """Menor tempo e maior pico de cada etapa entre as repetições"""
+    resultado = dict(medidas[0])
+    resultado['etapas'] = {}
+    for etapa in medidas[0]['etapas']:
+        segundos = [medida['etapas'][etapa]['segundos'] for medida in medidas]
+        memorias = [medida['etapas'][etapa]['memoria_mb'] for medida in medidas
+                    if medida['etapas'][etapa]['memoria_mb'] is not None]
+        resultado['etapas'][etapa] = {'segundos': min(segundos), 'memoria_mb': max(memorias) if memorias else None}
+    return resultado
+
+
+# ===========================
+# RESULTADOS
+# ===========================
+def versao_codigo():
+    """Versão do app e commit do git (None fora de um repositório)"""
+    versao = {'app': None, 'git': None}
+    try:
+        with open(ARQUIVO_APP, encoding='utf-8') as arquivo:
+            encontrada = re.search(r'^APP_VERSION = "([^"]+)"', arquivo.read(), re.MULTILINE)
+        versao['app'] = encontrada.group(1) if encontrada else None
+    except OSError:
+        pass
+    try:
+        versao['git'] = subprocess.run(['git', 'describe', '--always', '--dirty'], check=True,
+                                       capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return versao
+
+
+def ambiente():
+    import numpy as np
+    import pyarrow
+
+    return {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'pyarrow': pyarrow.__version__, 'plataforma': platform.platform(), 'cpus': os.cpu_count()}
+
+
+def formatar(valor, formato):
+    return format(valor, formato) if valor is not None else "n/d"
+
+
+def imprimir_cenario(cenario):
+    print(f"\n{cenario['linhas']} linhas, {cenario['lojas']} lojas "
+          f"({cenario['tamanho_consolidado_mb']:.1f} MB); envio de {cenario['linhas_envio']} linhas, "
+          f"{len(cenario['erros_validacao'])} erro(s) de validação")
+    print(f"  {'etapa':<28} {'tempo (s)':>10} {'memória (+MB)':>14}")
+    for etapa, medida in cenario['etapas'].items():
+        print(f"  {etapa:<28} {medida['segundos']:>10.3f} {formatar(medida['memoria_mb'], '.0f'):>14}")
+
+
+def comparar(anterior, atual, tolerancia):
+    """Etapas mais lentas que no resultado anterior; retorna o número de regressões"""
+    base = {(cenario['linhas_solicitadas'], cenario['lojas']): cenario for cenario in anterior['cenarios']}
+    regressoes = 0
+    print(f"\nComparação com {anterior['versao'].get('git') or anterior['versao'].get('app')} "
+          f"({anterior['data']}), tolerância {tolerancia:.0%}")
+    for cenario in atual['cenarios']:
+        cenario_base = base.get((cenario['linhas_solicitadas'], cenario['lojas']))
+        if cenario_base is None:
+            continue
+        for etapa, medida in cenario['etapas'].items():
+            medida_base = cenario_base['etapas'].get(etapa)
+            if medida_base is None or medida_base['segundos'] <= 0:
+                continue
+            razao = medida['segundos'] / medida_base['segundos']
+            regressao = (razao > 1 + tolerancia
+                         and medida['segundos'] - medida_base['segundos'] > RUIDO_SEGUNDOS)
+            regressoes += regressao
+            print(f"  {cenario['linhas_solicitadas']:>8} x {cenario['lojas']:<5} {etapa:<28} "
+                  f"{medida_base['segundos']:>8.3f}s -> {medida['segundos']:>8.3f}s ({razao:>5.2f}x)"
+                  f"{'  REGRESSÃO' if regressao else ''}")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000],
+                        help="linhas do consolidado (1000000 leva alguns minutos)")
+    parser.add_argument('--lojas', type=int, nargs='+', default=[50, 1000])
+    parser.add_argument('--lojas-envio', type=int, default=10, help="lojas no envio (um mês)")
+    parser.add_argument('--datas-sujas', type=float, default=0.01, help="fração de DATA como texto no envio")
+    parser.add_argument('--repeticoes', type=int, default=1)
+    parser.add_argument('--saida', default='benchmark_pipeline.json')
+    parser.add_argument('--comparar', help="JSON de uma execução anterior")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA)
+    parser.add_argument('--drive', choices=('simulado', 'local'), default='simulado',
+                        help="Graph simulado ou diretório local")
+    parser.add_argument('--latencia-ms', type=float, default=0, help="latência por operação do drive local")
+    parser.add_argument('--banda-mb-s', type=float, help="banda do drive local em MB/s")
+    parser.add_argument('--cenario', type=int, nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cenario:
+        executar_cenario(*args.cenario, args.lojas_envio, args.datas_sujas, args.drive, args.latencia_ms,
+                         args.banda_mb_s)
+        return
+
+    resultados = {
+        'versao': versao_codigo(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': ambiente(),
+        'parametros': {'meses': MESES, 'lojas_envio': args.lojas_envio, 'datas_sujas': args.datas_sujas,
+                       'repeticoes': args.repeticoes, 'drive': args.drive, 'latencia_ms': args.latencia_ms,
+                       'banda_mb_s': args.banda_mb_s},
+        'cenarios': [],
+    }
+    for linhas in args.linhas:
+        for lojas in args.lojas:
+            medidas = [medir_em_processo(linhas, lojas, args) for _ in range(args.repeticoes)]
+            cenario = dict(combinar_repeticoes(medidas), linhas_solicitadas=linhas, lojas=lojas)
+            resultados['cenarios'].append(cenario)
+            imprimir_cenario(cenario)
+
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultados, arquivo, ensure_ascii=False, indent=1)
+    print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            anterior = json.load(arquivo)
+        if comparar(anterior, resultados, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark do reenvio de um lote pelo bonificacao.cli: o mesmo diretório
+consolidado duas vezes, com arquivos que dividem lojas/meses (cada um
+substitui parte do anterior), em um drive local.
+
+Na segunda execução os arquivos já consolidados são comparados com o
+consolidado; os que voltam ao lote não podem passar por cima de um
+arquivo posterior. Confere que as duas execuções deixam o mesmo
+consolidado.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_reenvio_lote
+    python -m benchmarks.bench_reenvio_lote --arquivos 5 --lojas 20
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.dados_sinteticos import gerar_bonificacao, gravar_planilhas
+from bonificacao.cli import criar_consolidador_local
+from bonificacao.cli import main as executar_cli
+
+
+def gravar_lote(diretorio, arquivos, lojas, meses, linhas_por_loja):
+    """Um arquivo por envio; cada um começa no meio das lojas do anterior"""
+    passo = max(lojas // 2, 1)
+    for indice in range(arquivos):
+        df = gerar_bonificacao(lojas, meses, linhas_por_loja, seed=indice, primeira_loja=indice * passo)
+        caminho, = gravar_planilhas(diretorio, df, agrupar='nenhum')
+        Path(caminho).rename(Path(diretorio) / f"envio_{indice:02d}.xlsx")
+
+
+def consolidado_local(drive):
+    consolidador = criar_consolidador_local(drive)
+    _, df, _, _ = consolidador.carregar_consolidado(consolidador.obter_token())
+    colunas = [coluna for coluna in df.columns if coluna != 'DATA_ULTIMO_ENVIO']
+    return df[colunas].sort_values(colunas).reset_index(drop=True)
+
+
+def executar(diretorio, drive):
+    saida = io.StringIO()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(saida):
+        codigo = executar_cli([diretorio, '--local', drive, '--processos', '1'])
+    segundos = time.perf_counter() - inicio
+    if codigo != 0:
+        raise SystemExit(f"bonificacao.cli saiu com {codigo}:\n{saida.getvalue()}")
+    return segundos, saida.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--arquivos', type=int, default=3)
+    parser.add_argument('--lojas', type=int, default=8, help="lojas por arquivo")
+    parser.add_argument('--meses', type=int, default=2)
+    parser.add_argument('--linhas-por-loja', type=int, default=5, help="linhas por loja em cada mês")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporario:
+        diretorio, drive = f"{temporario}/planilhas", f"{temporario}/drive"
+        gravar_lote(diretorio, args.arquivos, args.lojas, args.meses, args.linhas_por_loja)
+
+        t_primeira, _ = executar(diretorio, drive)
+        df_primeira = consolidado_local(drive)
+        t_segunda, saida = executar(diretorio, drive)
+        df_segunda = consolidado_local(drive)
+
+    print(f"{args.arquivos} arquivos de {args.lojas} lojas x {args.meses} meses")
+    print(f"primeira execução: {t_primeira:.2f}s; reexecução: {t_segunda:.2f}s")
+    for linha in saida.splitlines():
+        if linha.startswith("envio_") and " - " in linha:
+            print(f"  {linha}")
+
+    if not df_primeira.equals(df_segunda):
+        raise SystemExit("Divergência: a reexecução do lote mudou o consolidado")
+
+
+if __name__ == '__main__':
+    main()
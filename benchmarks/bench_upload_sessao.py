@@ -0,0 +1,56 @@
+"""
+Upload em sessão contra o Graph simulado, com conexões derrubadas.
+
+Verifica que o arquivo gravado é idêntico ao enviado e mostra quantos
+fragmentos e quedas ocorreram, comparando com o upload simples.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_upload_sessao
+    python -m benchmarks.bench_upload_sessao --mb 50 --prob-queda 0.3
+"""
+import argparse
+import os
+import time
+
+import requests
+
+from bonificacao import graph
+from bonificacao.graph_simulado import SimuladorGraph
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--mb', type=float, default=20)
+    parser.add_argument('--prob-queda', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    conteudo = os.urandom(int(args.mb * 2**20))
+    graph.ESPERA_BASE_SEGUNDOS = 0.01
+
+    with SimuladorGraph(prob_queda=args.prob_queda, seed=args.seed) as simulador:
+        base_url = f"{simulador.url_servidor}/v1.0"
+        url_item = graph.url_item_drive('site', 'drive', 'FontedeDados/teste.xlsx', base_url=base_url)
+
+        inicio = time.perf_counter()
+        requests.put(f"{url_item}:/content", data=conteudo, timeout=60)
+        t_simples = time.perf_counter() - inicio
+
+        simulador.arquivos.clear()
+        inicio = time.perf_counter()
+        sucesso = graph.enviar_em_sessao(url_item, 'token', conteudo)
+        t_sessao = time.perf_counter() - inicio
+
+        gravado = simulador.arquivos.get('FontedeDados/teste.xlsx')
+        print(f"Tamanho: {args.mb:.1f} MB | probabilidade de queda: {args.prob_queda:.0%}")
+        print(f"Upload simples (sem quedas): {t_simples:.2f}s")
+        print(f"Upload em sessão: {t_sessao:.2f}s | sucesso={sucesso} | "
+              f"fragmentos={simulador.contadores['fragmentos']} | quedas={simulador.contadores['quedas']}")
+
+        if not sucesso or gravado != conteudo:
+            raise SystemExit("Arquivo gravado difere do enviado")
+        print("Conteúdo gravado idêntico ao enviado")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark da validação: motor de regras em uma passada (avaliar_planilha)
+contra a validação anterior (datas e LOJA, com to_period e DATA convertida
+no próprio DataFrame).
+
+O motor avalia também as regras numéricas, de faixa e de soma, então o
+tempo dele cobre mais verificações que o legado. A variante "texto" lê
+todas as colunas como texto, o pior caso de conversão.
+
+Uso (a partir da raiz do repositório):
+    python -m benchmarks.bench_validacao
+    python -m benchmarks.bench_validacao --linhas 10000 100000 500000
+"""
+import argparse
+import time
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from benchmarks.dados_sinteticos import gerar_planilha
+from bonificacao.esquema import COLUNAS_OBRIGATORIAS
+from bonificacao.validacao import MESES_PASSADO, avaliar_planilha
+
+AGORA = pd.Timestamp('2024-06-15')
+# Datas do limite do passado até o mês de AGORA: só os erros plantados violam regras
+MESES = MESES_PASSADO + 1
+
+
+def gerar_validacao(linhas):
+    """Planilha com TOTAL_X = R$_X + EXTRA_X e alguns erros conhecidos"""
+    inicio = AGORA.replace(day=1) - pd.DateOffset(months=MESES - 1)
+    df = gerar_planilha(linhas, lojas=50, meses=MESES, inicio=inicio)
+    for coluna in COLUNAS_OBRIGATORIAS:
+        if coluna.startswith('TOTAL_'):
+            servico = coluna[len('TOTAL_'):]
+            df[coluna] = df[f'R$_{servico}'] + df[f'EXTRA_{servico}']
+    passo = max(linhas // 100, 1)
+    df.loc[df.index[::passo], 'LOJA'] = None
+    df.loc[df.index[1::passo], 'TOTAL_DUTO'] += 1
+    df.loc[df.index[2::passo], 'R$_FREIO'] = -250
+    return df
+
+
+def como_texto(df):
+    """Todas as colunas como texto, como vêm de planilhas digitadas à mão"""
+    texto = df.copy()
+    texto['DATA'] = texto['DATA'].dt.strftime('%Y-%m-%d')
+    for coluna in texto.columns:
+        if coluna != 'LOJA':
+            texto[coluna] = texto[coluna].astype(str)
+    texto.loc[texto.index[3], 'R$_DUTO'] = 'n/d'
+    return texto
+
+
+def validar_legado(df):
+    """Validação anterior: datas e LOJA, alterando o DataFrame"""
+    erros = []
+    df['DATA'] = pd.to_datetime(df['DATA'], errors='coerce')
+    erros.append(df['DATA'].isna().sum())
+    mes_atual = AGORA.replace(day=1)
+    datas_validas = df[df['DATA'].notna()]['DATA']
+    erros.append(len(datas_validas[datas_validas > mes_atual + relativedelta(months=2)]))
+    erros.append(len(datas_validas[datas_validas < mes_atual - relativedelta(months=6)]))
+    df['MES_ANO'] = df['DATA'].dt.to_period('M')
+    meses = sorted(str(m) for m in df[df['DATA'].notna()]['MES_ANO'].unique())
+    df.drop('MES_ANO', axis=1, inplace=True)
+    erros.append(df['LOJA'].isna().sum())
+    erros.append(len(df['LOJA'].dropna().unique()))
+    return erros, meses
+
+
+def medir(funcao, df, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        copia = df.copy()
+        inicio = time.perf_counter()
+        funcao(copia)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'linhas':>8} {'variante':>9} {'legado (s)':>11} {'regras (s)':>11} {'regras violadas':>16}")
+    for linhas in args.linhas:
+        base = gerar_validacao(linhas)
+        for variante, df in (('numérica', base), ('texto', como_texto(base))):
+            t_legado = medir(validar_legado, df, args.repeticoes)
+            t_regras = medir(lambda d: avaliar_planilha(d, agora=AGORA), df, args.repeticoes)
+            _, _, info_datas, ocorrencias = avaliar_planilha(df, agora=AGORA)
+            _, meses_legado = validar_legado(df.copy())
+            if info_datas['meses_presentes'] != meses_legado:
+                raise SystemExit(f"Divergência nos meses: {info_datas['meses_presentes']} != {meses_legado}")
+            print(f"{linhas:>8} {variante:>9} {t_legado:>11.3f} {t_regras:>11.3f} {len(ocorrencias):>16}")
+    print(ocorrencias[['regra', 'nivel', 'quantidade']].to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
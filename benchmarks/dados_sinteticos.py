@@ -0,0 +1,190 @@
+"""
+Planilhas sintéticas com a estrutura de COLUNAS_OBRIGATORIAS, para benchmarks.
+
+gerar_planilha produz linhas independentes e aleatórias (usada pelos
+benchmarks de leitura, escrita e memória). gerar_bonificacao produz uma
+planilha realista: lojas com grupo, concessionária e funcionários fixos,
+um número de linhas por loja e mês, totais consistentes e, se pedido,
+datas digitadas como texto.
+
+Também grava planilhas em um diretório, prontas para o envio em lote ou
+para bonificacao.cli:
+    python -m benchmarks.dados_sinteticos planilhas --lojas 50 --meses 12 --linhas-por-loja 40
+    python -m benchmarks.dados_sinteticos planilhas --lojas 1000 --datas-sujas 0.01 --agrupar mes
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from bonificacao.esquema import COLUNAS_OBRIGATORIAS
+
+SERVICOS = {
+    'DUTO': 35.0, 'FREIO': 28.0, 'SANIT': 22.0, 'VERNIZ': 40.0,
+    'CX EVAP': 45.0, 'PROTEC': 30.0, 'VC GREEN': 18.0, 'NITROGÊNIO': 12.0,
+}
+FUNCOES = ['LAVADOR', 'PREPARADOR', 'POLIDOR', 'HIGIENIZADOR', 'SUPERVISOR']
+FORMAS_PAGAMENTO = ['PIX', 'CARTÃO', 'DINHEIRO']
+FUNCIONARIOS_POR_LOJA = 12
+LOJAS_POR_CONCESSIONARIA = 5
+LOJAS_POR_GRUPO = 25
+
+
+def gerar_planilha(linhas, lojas=50, meses=12, seed=0, inicio='2024-01-01'):
+    """Gera um DataFrame com todas as colunas obrigatórias preenchidas, com datas de inicio em diante"""
+    rng = np.random.default_rng(seed)
+    inicio = pd.Timestamp(inicio)
+    dados = {}
+    for coluna in COLUNAS_OBRIGATORIAS:
+        if coluna == 'LOJA':
+            dados[coluna] = [f"LOJA {n:04d}" for n in rng.integers(0, lojas, linhas)]
+        elif coluna == 'DATA':
+            dados[coluna] = inicio + pd.to_timedelta(rng.integers(0, meses * 30, linhas), unit='D')
+        elif coluna.startswith(('TMO_', 'R$_', 'EXTRA_', 'TOTAL_')):
+            dados[coluna] = np.round(rng.random(linhas) * 500, 2)
+        elif coluna in ('GRUPO', 'FUNÇÃO', 'STATUS', 'FORMA PAG'):
+            dados[coluna] = rng.choice([f"{coluna} {n}" for n in range(5)], linhas)
+        else:
+            dados[coluna] = [f"{coluna} {n}" for n in rng.integers(0, 5000, linhas)]
+    return pd.DataFrame(dados, columns=COLUNAS_OBRIGATORIAS)
+
+
+def primeiro_mes(meses, inicio=None):
+    """Primeiro mês dos dados: inicio, ou os últimos meses terminando no mês atual"""
+    if inicio is not None:
+        return pd.Timestamp(inicio).normalize().replace(day=1)
+    return pd.Timestamp.today().normalize().replace(day=1) - pd.DateOffset(months=meses - 1)
+
+
+def gerar_bonificacao(lojas=50, meses=12, linhas_por_loja=100, datas_sujas=0.0, inicio=None, seed=0,
+                      primeira_loja=0):
+    """
+    Planilha realista com linhas_por_loja linhas para cada loja em cada mês
+    (lojas * meses * linhas_por_loja linhas), ordenada por loja e mês
+
+    TOTAL_X = R$_X + EXTRA_X, TMO_TOTAL e R$_TOTAL somam os serviços e PAGO +
+    A PAGAR = R$_TOTAL. datas_sujas é a fração das linhas com DATA digitada
+    como texto: formatos misturados, vazias e datas inexistentes. Lojas
+    numeradas a partir de primeira_loja, para gerar envios de outras lojas
+    """
+    rng = np.random.default_rng(seed)
+    linhas = lojas * meses * linhas_por_loja
+    loja = np.repeat(np.arange(primeira_loja, primeira_loja + lojas), meses * linhas_por_loja)
+    mes = np.tile(np.repeat(np.arange(meses), linhas_por_loja), lojas)
+    funcionario = rng.integers(0, FUNCIONARIOS_POR_LOJA, linhas)
+
+    # Textos montados uma vez por loja/funcionário e indexados, não linha a linha
+    codigos = np.arange(primeira_loja, primeira_loja + lojas)
+    nomes_lojas = np.array([f"LOJA {n:04d}" for n in codigos], dtype=object)
+    nomes_funcionarios = np.array([f"FUNCIONÁRIO {n:04d}-{k:02d}" for n in codigos
+                                   for k in range(FUNCIONARIOS_POR_LOJA)], dtype=object)
+    chaves_pix = np.array([f"pix.{n:04d}.{k:02d}@exemplo.com.br" for n in codigos
+                           for k in range(FUNCIONARIOS_POR_LOJA)], dtype=object)
+    indice_funcionario = (loja - primeira_loja) * FUNCIONARIOS_POR_LOJA + funcionario
+
+    meses_inicio = pd.date_range(primeiro_mes(meses, inicio), periods=meses, freq='MS').to_numpy()
+    datas = meses_inicio[mes] + rng.integers(0, 28, linhas).astype('timedelta64[D]')
+
+    dados = {
+        'GRUPO': np.array([f"GRUPO {n // LOJAS_POR_GRUPO:02d}" for n in codigos], dtype=object)[loja - primeira_loja],
+        'CONCESSIONÁRIA': np.array([f"CONCESSIONÁRIA {n // LOJAS_POR_CONCESSIONARIA:03d}" for n in codigos],
+                                   dtype=object)[loja - primeira_loja],
+        'LOJA': nomes_lojas[loja - primeira_loja],
+        'FUNÇÃO': np.array(FUNCOES, dtype=object)[funcionario % len(FUNCOES)],
+        'NOME': nomes_funcionarios[indice_funcionario],
+        'DATA': datas,
+        'FORMA PAG': np.array(FORMAS_PAGAMENTO, dtype=object)[rng.integers(0, len(FORMAS_PAGAMENTO), linhas)],
+        'CARTÃO / PIX': chaves_pix[indice_funcionario],
+    }
+
+    tmo_total = np.zeros(linhas)
+    valor_total = np.zeros(linhas)
+    for servico, preco in SERVICOS.items():
+        quantidade = rng.integers(0, 20, linhas) * (rng.random(linhas) < 0.6)
+        valor = np.round(quantidade * preco, 2)
+        extra = np.round(rng.random(linhas) * 50, 2) * (rng.random(linhas) < 0.1)
+        dados[f'TMO_{servico}'] = quantidade.astype('float64')
+        dados[f'R$_{servico}'] = valor
+        dados[f'EXTRA_{servico}'] = extra
+        dados[f'TOTAL_{servico}'] = np.round(valor + extra, 2)
+        tmo_total += quantidade
+        valor_total += dados[f'TOTAL_{servico}']
+
+    pago = rng.random(linhas) < 0.7
+    dados['TMO_TOTAL'] = tmo_total
+    dados['R$_TOTAL'] = np.round(valor_total, 2)
+    dados['STATUS'] = np.where(pago, 'PAGO', 'PENDENTE')
+    dados['PAGO'] = np.where(pago, dados['R$_TOTAL'], 0.0)
+    dados['A PAGAR'] = np.round(dados['R$_TOTAL'] - dados['PAGO'], 2)
+    dados['PIX'] = np.where(dados['FORMA PAG'] == 'PIX', dados['CARTÃO / PIX'], '')
+
+    df = pd.DataFrame(dados, columns=COLUNAS_OBRIGATORIAS)
+    if datas_sujas > 0:
+        sujar_datas(df, datas_sujas, rng)
+    return df
+
+
+def sujar_datas(df, fracao, rng):
+    """Troca uma fração de DATA por texto, como em planilhas preenchidas à mão (altera df)"""
+    posicoes = rng.choice(len(df), int(round(len(df) * fracao)), replace=False)
+    if len(posicoes) == 0:
+        return df
+    originais = pd.DatetimeIndex(df['DATA'].iloc[posicoes])
+    textos = np.array(originais.strftime('%d/%m/%Y'), dtype=object)
+    tipo = np.arange(len(posicoes)) % 5
+    textos[tipo == 1] = originais[tipo == 1].strftime('%Y-%m-%d %H:%M:%S')
+    textos[tipo == 2] = ''
+    textos[tipo == 3] = originais[tipo == 3].strftime('31/02/%Y')
+    textos[tipo == 4] = 'ver RH'
+
+    coluna = df['DATA'].astype(object)
+    coluna.iloc[posicoes] = textos
+    df['DATA'] = coluna
+    return df
+
+
+def gravar_planilhas(diretorio, df, agrupar='loja'):
+    """Grava df em um xlsx por loja, por loja e mês ou em um único arquivo; retorna os caminhos"""
+    from bonificacao.excel import gerar_xlsx
+
+    os.makedirs(diretorio, exist_ok=True)
+    if agrupar == 'nenhum':
+        grupos = [('bonificacao', df)]
+    else:
+        chaves = [df['LOJA']]
+        if agrupar == 'mes':
+            chaves.append(pd.to_datetime(df['DATA'], errors='coerce', format='mixed', dayfirst=True)
+                          .dt.strftime('%Y-%m').fillna('sem-data'))
+        grupos = [('_'.join(str(parte).replace(' ', '') for parte in chave), grupo)
+                  for chave, grupo in df.groupby(chaves, sort=True, observed=True)]
+
+    caminhos = []
+    for nome, grupo in grupos:
+        caminho = os.path.join(diretorio, f"{nome}.xlsx")
+        with open(caminho, 'wb') as arquivo:
+            arquivo.write(gerar_xlsx(grupo.reset_index(drop=True)))
+        caminhos.append(caminho)
+    return caminhos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grava planilhas de bonificação sintéticas")
+    parser.add_argument('diretorio')
+    parser.add_argument('--lojas', type=int, default=50)
+    parser.add_argument('--meses', type=int, default=12)
+    parser.add_argument('--linhas-por-loja', type=int, default=40, help="linhas por loja em cada mês")
+    parser.add_argument('--datas-sujas', type=float, default=0.0, help="fração de DATA digitada como texto")
+    parser.add_argument('--inicio', help="primeiro mês (AAAA-MM); padrão: terminando no mês atual")
+    parser.add_argument('--agrupar', choices=('loja', 'mes', 'nenhum'), default='loja',
+                        help="um arquivo por loja, por loja e mês, ou um só")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df = gerar_bonificacao(args.lojas, args.meses, args.linhas_por_loja, args.datas_sujas, args.inicio, args.seed)
+    caminhos = gravar_planilhas(args.diretorio, df, args.agrupar)
+    print(f"{len(caminhos)} planilha(s), {len(df)} linhas em {args.diretorio}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Medidas de tempo e de pico de memória por etapa, compartilhadas pelos benchmarks.
+
+O pico é o do RSS do processo (VmHWM, Linux), que inclui a memória do
+Arrow que o tracemalloc não enxerga. Antes de cada etapa a memória livre é
+devolvida ao sistema (malloc_trim) e o pico é zerado; o acréscimo é o pico
+da etapa menos o RSS no início dela. Fora do Linux as memórias são None.
+"""
+import ctypes
+import gc
+import time
+
+
+def status_mb(campo):
+    """Campo de /proc/self/status em MB (None fora do Linux)"""
+    try:
+        with open('/proc/self/status') as status:
+            for linha in status:
+                if linha.startswith(campo + ':'):
+                    return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def zerar_pico_rss():
+    """Devolve a memória livre ao sistema e zera o VmHWM"""
+    gc.collect()
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def medir_etapa(funcao):
+    """Executa funcao e retorna (resultado, acréscimo de pico do RSS em MB, segundos)"""
+    zerar_pico_rss()
+    base = status_mb('VmRSS')
+    inicio = time.perf_counter()
+    resultado = funcao()
+    segundos = time.perf_counter() - inicio
+    pico = status_mb('VmHWM')
+    return resultado, (pico - base if base is not None and pico is not None else None), segundos
@@ -0,0 +1,6 @@
+"""
+Núcleo da consolidação de bonificações, independente do Streamlit.
+
+Os módulos deste pacote não importam streamlit nem leem st.secrets, para
+que possam ser usados pela aplicação, por benchmarks e por scripts.
+"""
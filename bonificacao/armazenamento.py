@@ -0,0 +1,287 @@
+"""
+Armazenamento do drive: Graph/SharePoint ou um diretório local.
+
+ConsolidadorSharePoint faz todo o acesso ao drive (lock, consolidado,
+backups, cópias ENVIO, partições e deltas) por estas operações, com
+caminhos relativos à raiz do drive ("Documentos Compartilhados/..."):
+
+    ler(token, caminho)              bytes, ou None se o item não existe
+    metadados(token, caminho)        dict com name, eTag, size e
+                                     lastModifiedDateTime, ou None
+    gravar(token, caminho, conteudo, tipo, if_match=None, somente_criar=False)
+                                     item gravado (com eTag); ConflitoEtag se
+                                     a condição falhar
+    remover(token, caminho)          um item ausente já conta como removido
+    copiar(token, caminho, pasta_destino, nome_destino)
+                                     True quando a cópia terminou, None se
+                                     indisponível (o chamador reenvia os bytes)
+    listar(token, pasta)             itens da pasta como no Graph (name, size,
+                                     file ou folder); [] se a pasta não existe
+    chave(caminho)                   identificador estável do item (cache local)
+
+Os demais erros levantam exceção; quem chama decide se falha ou segue.
+ler, gravar e remover aceitam endpoint, o nome usado nas métricas do
+ClienteGraph (o armazenamento local ignora).
+
+ArmazenamentoLocal guarda os arquivos em um diretório com a mesma estrutura
+de pastas, com eTag pelo conteúdo, gravação condicional atômica e cópia, e
+pode simular latência por operação e banda limitada, para medir desempenho
+e testar a aplicação sem rede.
+"""
+import hashlib
+import logging
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from bonificacao.graph import (GRAPH_URL, LIMITE_UPLOAD_SIMPLES, STATUS_CONFLITO, ConflitoEtag,
+                               cabecalhos_condicionais, cliente_padrao, copiar_item, enviar_em_sessao, listar_pasta,
+                               obter_metadados, url_item_drive)
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TIPO_BINARIO = "application/octet-stream"
+ARQUIVO_LOCK_LOCAL = ".armazenamento.lock"
+
+
+# ===========================
+# GRAPH / SHAREPOINT
+# ===========================
+class ArmazenamentoGraph:
+    """Drive do SharePoint pelo Microsoft Graph"""
+
+    def __init__(self, site_id, drive_id, base_url=GRAPH_URL, cliente=None):
+        self.site_id = site_id
+        self.drive_id = drive_id
+        self.base_url = base_url
+        self.cliente = cliente
+
+    def _cliente(self):
+        return self.cliente or cliente_padrao()
+
+    def url(self, caminho):
+        return url_item_drive(self.site_id, self.drive_id, caminho, base_url=self.base_url)
+
+    def chave(self, caminho):
+        return self.url(caminho)
+
+    def ler(self, token, caminho, endpoint="download"):
+        response = self._cliente().get(f"{self.url(caminho)}:/content", token=token, timeout=30, endpoint=endpoint)
+        if response.status_code == 200:
+            return response.content
+        if response.status_code == 404:
+            return None
+        raise RuntimeError(f"Erro ao ler {caminho}: {response.status_code}")
+
+    def metadados(self, token, caminho):
+        return obter_metadados(self.url(caminho), token, cliente=self.cliente)
+
+    def gravar(self, token, caminho, conteudo, tipo=TIPO_BINARIO, if_match=None, somente_criar=False,
+               endpoint="upload"):
+        """Acima de LIMITE_UPLOAD_SIMPLES usa sessão de upload retomável em fragmentos"""
+        url = self.url(caminho)
+        if len(conteudo) > LIMITE_UPLOAD_SIMPLES:
+            item = enviar_em_sessao(url, token, conteudo, cliente=self.cliente, if_match=if_match,
+                                    somente_criar=somente_criar)
+            if not item:
+                raise RuntimeError(f"Erro no upload em sessão: {caminho}")
+            return item
+
+        headers = {"Content-Type": tipo, **cabecalhos_condicionais(if_match)}
+        params = {"@microsoft.graph.conflictBehavior": "fail"} if somente_criar else None
+        response = self._cliente().put(f"{url}:/content", token=token, headers=headers, data=conteudo,
+                                       params=params, timeout=60, endpoint=endpoint)
+
+        if response.status_code in STATUS_CONFLITO and (if_match or somente_criar):
+            raise ConflitoEtag(f"{caminho} alterado desde a leitura ({response.status_code})")
+        if response.status_code not in (200, 201):
+            raise RuntimeError(f"Erro no upload de {caminho}: {response.status_code} - {response.text[:200]}")
+        try:
+            return response.json() or {}
+        except ValueError:
+            return {}
+
+    def remover(self, token, caminho, endpoint="remoção"):
+        response = self._cliente().delete(self.url(caminho), token=token, timeout=10, endpoint=endpoint)
+        if response.status_code not in (204, 404):
+            raise RuntimeError(f"Erro ao remover {caminho}: {response.status_code}")
+
+    def copiar(self, token, caminho, pasta_destino, nome_destino):
+        """Cópia no próprio servidor, acompanhada pela URL de monitoramento"""
+        return copiar_item(self.url(caminho), token, self.drive_id, pasta_destino, nome_destino, cliente=self.cliente)
+
+    def listar(self, token, pasta):
+        return listar_pasta(self.url(pasta), token, cliente=self.cliente)
+
+
+# ===========================
+# DIRETÓRIO LOCAL
+# ===========================
+class ArmazenamentoLocal:
+    """
+    Drive espelhado em um diretório local
+    latencia: segundos somados a cada operação (variacao: fração aleatória, ±)
+    banda: bytes por segundo nas leituras e gravações (None = sem limite)
+    """
+
+    def __init__(self, raiz, latencia=0.0, variacao=0.0, banda=None, seed=None):
+        self.raiz = os.path.abspath(raiz)
+        self.latencia = latencia
+        self.variacao = variacao
+        self.banda = banda
+        self._aleatorio = random.Random(seed)
+        self._lock = threading.Lock()
+        self._etags = {}
+        os.makedirs(self.raiz, exist_ok=True)
+
+    def _caminho(self, caminho):
+        destino = os.path.abspath(os.path.join(self.raiz, caminho))
+        if os.path.commonpath([destino, self.raiz]) != self.raiz:
+            raise ValueError(f"Caminho fora do armazenamento: {caminho}")
+        return destino
+
+    def _esperar(self, tamanho=0):
+        """Latência da operação mais o tempo de transferir tamanho bytes na banda configurada"""
+        atraso = self.latencia * (1 + self._aleatorio.uniform(-self.variacao, self.variacao))
+        if self.banda:
+            atraso += tamanho / self.banda
+        if atraso > 0:
+            time.sleep(atraso)
+
+    @contextmanager
+    def _exclusivo(self):
+        """Verificação e troca de arquivos sem outra gravação no meio (threads e processos)"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.raiz, ARQUIVO_LOCK_LOCAL), "a") as arquivo_lock:
+                fcntl.flock(arquivo_lock, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(arquivo_lock, fcntl.LOCK_UN)
+
+    def _etag(self, destino, info):
+        """eTag pelo hash do conteúdo, recalculado só quando o arquivo muda"""
+        assinatura = (info.st_ino, info.st_mtime_ns, info.st_size)
+        em_cache = self._etags.get(destino)
+        if em_cache is not None and em_cache[0] == assinatura:
+            return em_cache[1]
+        resumo = hashlib.sha1()
+        with open(destino, "rb") as arquivo:
+            for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+                resumo.update(bloco)
+        etag = f'"{resumo.hexdigest()}"'
+        self._etags[destino] = (assinatura, etag)
+        return etag
+
+    def _item(self, destino, info, etag=True):
+        item = {
+            "name": os.path.basename(destino),
+            "size": info.st_size,
+            "lastModifiedDateTime": datetime.fromtimestamp(info.st_mtime, timezone.utc).isoformat(),
+        }
+        if os.path.isdir(destino):
+            item["folder"] = {}
+        else:
+            item["file"] = {}
+            if etag:
+                item["eTag"] = self._etag(destino, info)
+        return item
+
+    def chave(self, caminho):
+        return f"file://{self._caminho(caminho)}"
+
+    def ler(self, token, caminho, endpoint=None):
+        destino = self._caminho(caminho)
+        try:
+            with open(destino, "rb") as arquivo:
+                conteudo = arquivo.read()
+        except (FileNotFoundError, IsADirectoryError):
+            self._esperar()
+            return None
+        self._esperar(len(conteudo))
+        return conteudo
+
+    def metadados(self, token, caminho):
+        self._esperar()
+        destino = self._caminho(caminho)
+        try:
+            return self._item(destino, os.stat(destino))
+        except FileNotFoundError:
+            return None
+
+    def gravar(self, token, caminho, conteudo, tipo=TIPO_BINARIO, if_match=None, somente_criar=False,
+               endpoint=None):
+        self._esperar(len(conteudo))
+        destino = self._caminho(caminho)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(destino), prefix=".tmp_")
+        try:
+            with os.fdopen(descritor, "wb") as arquivo:
+                arquivo.write(conteudo)
+            with self._exclusivo():
+                existe = os.path.exists(destino)
+                if somente_criar and existe:
+                    raise ConflitoEtag(f"{caminho} já existe")
+                if if_match and (not existe or self._etag(destino, os.stat(destino)) != if_match):
+                    raise ConflitoEtag(f"{caminho} alterado desde a leitura")
+                os.replace(temporario, destino)
+                info = os.stat(destino)
+                etag = f'"{hashlib.sha1(conteudo).hexdigest()}"'
+                self._etags[destino] = ((info.st_ino, info.st_mtime_ns, info.st_size), etag)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+        return dict(self._item(destino, info, etag=False), eTag=etag)
+
+    def remover(self, token, caminho, endpoint=None):
+        self._esperar()
+        destino = self._caminho(caminho)
+        with self._exclusivo():
+            try:
+                os.remove(destino)
+            except FileNotFoundError:
+                pass
+        self._etags.pop(destino, None)
+
+    def copiar(self, token, caminho, pasta_destino, nome_destino):
+        """Como no Graph, um nome já existente no destino ganha um sufixo (" 1", " 2"...)"""
+        self._esperar()
+        origem = self._caminho(caminho)
+        if not os.path.isfile(origem):
+            logger.warning(f"Cópia indisponível: {caminho} não existe")
+            return None
+        pasta = self._caminho(pasta_destino)
+        os.makedirs(pasta, exist_ok=True)
+        base, extensao = os.path.splitext(nome_destino)
+        with self._exclusivo():
+            destino = os.path.join(pasta, nome_destino)
+            sufixo = 1
+            while os.path.exists(destino):
+                destino = os.path.join(pasta, f"{base} {sufixo}{extensao}")
+                sufixo += 1
+            shutil.copyfile(origem, destino)
+        return True
+
+    def listar(self, token, pasta):
+        self._esperar()
+        try:
+            entradas = sorted(os.scandir(self._caminho(pasta)), key=lambda entrada: entrada.name)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        return [self._item(entrada.path, entrada.stat(), etag=False) for entrada in entradas
+                if not entrada.name.startswith(".")]
+
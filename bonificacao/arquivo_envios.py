@@ -0,0 +1,38 @@
+"""
+Arquivo das planilhas enviadas, endereçado pelo conteúdo.
+
+A cópia ENVIO guarda os bytes originais do upload, sem reserializar, com
+nome derivado do SHA-256 do conteúdo. O mesmo arquivo enviado de novo tem
+o mesmo nome, então um envio repetido é detectado com uma consulta de
+metadados antes de ler a planilha ou gravar qualquer coisa no drive.
+"""
+import hashlib
+import os
+
+PREFIXO_ENVIO = "ENVIO_"
+TAMANHO_HASH_NOME = 32
+
+TIPOS_CONTEUDO = {
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".xls": "application/vnd.ms-excel",
+}
+
+
+def hash_conteudo(conteudo):
+    """SHA-256 (hex) dos bytes enviados"""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+def extensao_envio(nome_arquivo_original):
+    """Extensão do arquivo original em minúsculas (.xlsx se não houver)"""
+    extensao = os.path.splitext(nome_arquivo_original or "")[1].lower()
+    return extensao if extensao in TIPOS_CONTEUDO else ".xlsx"
+
+
+def nome_arquivo_envio(hash_hex, nome_arquivo_original):
+    """Nome da cópia ENVIO: ENVIO_<hash>.<extensão original>"""
+    return f"{PREFIXO_ENVIO}{hash_hex[:TAMANHO_HASH_NOME]}{extensao_envio(nome_arquivo_original)}"
+
+
+def tipo_conteudo_envio(nome_arquivo_original):
+    return TIPOS_CONTEUDO[extensao_envio(nome_arquivo_original)]
@@ -0,0 +1,101 @@
+"""
+Token de acesso do Microsoft Graph compartilhado pelo processo.
+
+Um único ConfidentialClientApplication (e seu cache de tokens) atende todas
+as sessões do Streamlit. O token é renovado MARGEM_RENOVACAO_SEGUNDOS antes
+do expires_in informado pelo Azure AD, e renovações simultâneas são
+agrupadas: uma thread busca o token novo enquanto as outras seguem com o
+token ainda válido ou aguardam o resultado, se ele já expirou.
+"""
+import logging
+import threading
+import time
+
+from msal import ConfidentialClientApplication
+
+logger = logging.getLogger(__name__)
+
+ESCOPOS_GRAPH = ["https://graph.microsoft.com/.default"]
+MARGEM_RENOVACAO_SEGUNDOS = 300
+
+
+class ProvedorToken:
+    """Obtém e renova o token de aplicação (client credentials) de forma thread-safe"""
+
+    def __init__(self, client_id, tenant_id, client_secret, escopos=ESCOPOS_GRAPH,
+                 margem_renovacao=MARGEM_RENOVACAO_SEGUNDOS):
+        self.client_id = client_id
+        self.tenant_id = tenant_id
+        self.client_secret = client_secret
+        self.escopos = escopos
+        self.margem_renovacao = margem_renovacao
+        self._app = None
+        self._token = None
+        self._expira_em = 0.0
+        self._lock = threading.Lock()
+
+    def _aplicacao(self):
+        if self._app is None:
+            self._app = ConfidentialClientApplication(
+                self.client_id,
+                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                client_credential=self.client_secret
+            )
+        return self._app
+
+    def _renovar(self):
+        """Busca um token novo; chamado com o lock adquirido"""
+        result = self._aplicacao().acquire_token_for_client(scopes=self.escopos)
+
+        if "access_token" not in result:
+            error_desc = result.get("error_description", "Token não obtido")
+            logger.error(f"Falha na autenticação: {error_desc}")
+            return None
+
+        self._token = result["access_token"]
+        self._expira_em = time.time() + int(result.get("expires_in", 3600))
+        logger.info(f"Token obtido com sucesso (expira em {int(result.get('expires_in', 3600))}s)")
+        return self._token
+
+    def _valido(self, margem=0):
+        return self._token is not None and time.time() < self._expira_em - margem
+
+    def obter_token(self):
+        """Retorna um token válido, renovando-o se estiver perto de expirar"""
+        if self._valido(self.margem_renovacao):
+            return self._token
+
+        if self._valido():
+            # Ainda válido: só uma thread renova, as demais seguem com o token atual
+            if not self._lock.acquire(blocking=False):
+                return self._token
+        else:
+            self._lock.acquire()
+
+        try:
+            if self._valido(self.margem_renovacao):
+                return self._token
+            token = self._renovar()
+            if token is None and self._valido():
+                return self._token
+            return token
+        finally:
+            self._lock.release()
+
+    def segundos_restantes(self):
+        return max(0, int(self._expira_em - time.time())) if self._token else 0
+
+
+_provedores = {}
+_lock_provedores = threading.Lock()
+
+
+def obter_provedor(client_id, tenant_id, client_secret):
+    """ProvedorToken único do processo para a combinação de aplicação e tenant"""
+    chave = (client_id, tenant_id)
+    with _lock_provedores:
+        provedor = _provedores.get(chave)
+        if provedor is None or provedor.client_secret != client_secret:
+            provedor = ProvedorToken(client_id, tenant_id, client_secret)
+            _provedores[chave] = provedor
+        return provedor
@@ -0,0 +1,160 @@
+"""
+Cache em memória das planilhas enviadas já lidas e validadas.
+
+Cada interação com a tela (escolha de aba, botão Consolidar, Limpar Tela)
+reexecuta o script do Streamlit; sem cache, o mesmo upload seria aberto,
+lido e validado de novo a cada clique. As leituras ficam guardadas pelo
+hash do conteúdo e pela aba, e a validação também pelo dia, já que as
+regras de data dependem da data atual.
+
+O cache é único do processo e compartilhado entre as sessões. É limitado
+pelo número de entradas e pela memória estimada dos DataFrames; ao passar
+de qualquer um dos limites, as entradas usadas há mais tempo saem primeiro.
+Os DataFrames devolvidos são compartilhados e não devem ser alterados.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from bonificacao.esquema import ABA_DADOS
+from bonificacao.excel import abrir_planilha, ler_aba
+from bonificacao.validacao import avaliar_planilha
+
+logger = logging.getLogger(__name__)
+
+MEMORIA_MAXIMA_BYTES = int(os.environ.get("BONIFICACAO_CACHE_LEITURAS_MB", "512")) * 1024 * 1024
+MAX_ENTRADAS = 64
+TAMANHO_MINIMO_ENTRADA = 1024
+
+
+def tamanho_estimado(valor):
+    """Memória aproximada de um valor guardado (DataFrames contam com deep=True)"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, (tuple, list)):
+        return TAMANHO_MINIMO_ENTRADA + sum(tamanho_estimado(item) for item in valor)
+    return TAMANHO_MINIMO_ENTRADA
+
+
+class CacheLeituras:
+    """LRU thread-safe limitado por número de entradas e por memória"""
+
+    def __init__(self, memoria_maxima=MEMORIA_MAXIMA_BYTES, max_entradas=MAX_ENTRADAS):
+        self.memoria_maxima = memoria_maxima
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._memoria = 0
+        self._lock = threading.Lock()
+        self.estatisticas = {'acertos': 0, 'falhas': 0, 'descartes': 0}
+
+    def obter(self, chave):
+        """Valor guardado (marcado como usado agora) ou None"""
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.estatisticas['falhas'] += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.estatisticas['acertos'] += 1
+            return entrada[0]
+
+    def guardar(self, chave, valor, tamanho=None):
+        """Guarda valor e descarta as entradas mais antigas até caber nos limites"""
+        tamanho = tamanho_estimado(valor) if tamanho is None else tamanho
+        if tamanho > self.memoria_maxima:
+            logger.info(f"Entrada de {tamanho / 1024 / 1024:.1f} MB maior que o cache de leituras, não guardada")
+            return False
+        with self._lock:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self._memoria -= anterior[1]
+            self._entradas[chave] = (valor, tamanho)
+            self._memoria += tamanho
+            while self._memoria > self.memoria_maxima or len(self._entradas) > self.max_entradas:
+                _, (_, tamanho_descartado) = self._entradas.popitem(last=False)
+                self._memoria -= tamanho_descartado
+                self.estatisticas['descartes'] += 1
+        return True
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._memoria = 0
+
+    def memoria_usada(self):
+        return self._memoria
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+_cache = None
+_lock_cache = threading.Lock()
+
+
+def obter_cache():
+    """CacheLeituras único do processo"""
+    global _cache
+    with _lock_cache:
+        if _cache is None:
+            _cache = CacheLeituras()
+        return _cache
+
+
+# ===========================
+# LEITURA E VALIDAÇÃO EM CACHE
+# ===========================
+def abas_em_cache(conteudo, hash_hex, cache=None):
+    """
+    Nomes das abas do arquivo; abre a pasta de trabalho só na primeira vez
+    Se houver a aba Dados, ela já é lida e guardada na mesma abertura
+    """
+    cache = obter_cache() if cache is None else cache
+    abas = cache.obter(('abas', hash_hex))
+    if abas is not None:
+        return abas
+
+    with abrir_planilha(BytesIO(conteudo)) as planilha:
+        abas = list(planilha.sheet_names)
+        if ABA_DADOS in abas and cache.obter(('dados', hash_hex, ABA_DADOS)) is None:
+            cache.guardar(('dados', hash_hex, ABA_DADOS), ler_aba(planilha, ABA_DADOS))
+    cache.guardar(('abas', hash_hex), abas)
+    return abas
+
+
+def ler_aba_em_cache(conteudo, hash_hex, aba, cache=None):
+    """DataFrame da aba, lido do Excel só se ainda não estiver no cache"""
+    cache = obter_cache() if cache is None else cache
+    df = cache.obter(('dados', hash_hex, aba))
+    if df is None:
+        with abrir_planilha(BytesIO(conteudo)) as planilha:
+            df = ler_aba(planilha, aba)
+        cache.guardar(('dados', hash_hex, aba), df)
+    return df
+
+
+def chave_validacao(hash_hex, aba, agora=None):
+    return ('validacao', hash_hex, aba, (agora or datetime.now()).date())
+
+
+def validacao_em_cache(hash_hex, aba, cache=None):
+    """Resultado de avaliar_planilha já calculado hoje, ou None"""
+    cache = obter_cache() if cache is None else cache
+    return cache.obter(chave_validacao(hash_hex, aba))
+
+
+def validar_em_cache(df, hash_hex, aba, cache=None):
+    """avaliar_planilha memorizado: (erros, avisos, info_datas, ocorrencias)"""
+    cache = obter_cache() if cache is None else cache
+    chave = chave_validacao(hash_hex, aba)
+    resultado = cache.obter(chave)
+    if resultado is None:
+        resultado = avaliar_planilha(df)
+        cache.guardar(chave, resultado)
+    erros, avisos, info_datas, ocorrencias = resultado
+    return list(erros), list(avisos), dict(info_datas), ocorrencias
@@ -0,0 +1,163 @@
+"""
+Cache em disco do consolidado, validado pelo eTag do item no drive.
+
+Para cada arquivo remoto guarda os bytes originais (xlsx) e o DataFrame já
+lido (Parquet), junto com o eTag da versão em que foram obtidos. Antes de
+baixar, uma consulta de metadados compara o eTag atual com o do cache: se
+forem iguais, download e leitura do Excel são evitados.
+
+Os bytes e o DataFrame de cada versão têm nomes próprios (chave + hash do
+eTag) e são gravados em arquivo temporário e renomeados; os metadados são
+gravados por último e apontam para eles, com o sha256 de cada um. Duas
+gravações simultâneas da mesma chave (sessões do app, a fila, a linha de
+comando) não misturam arquivos de versões diferentes: a entrada fica com uma
+das duas, inteira, e os arquivos das outras versões são removidos depois.
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from bonificacao.compactacao import compactar
+
+logger = logging.getLogger(__name__)
+
+DIRETORIO_CACHE = os.environ.get(
+    "BONIFICACAO_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "bonificacao_cache")
+)
+
+
+def _gravar_atomico(caminho, conteudo):
+    """Grava em arquivo temporário no mesmo diretório e renomeia"""
+    diretorio = os.path.dirname(caminho)
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix=".tmp_")
+    try:
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(conteudo)
+        os.replace(temporario, caminho)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+class CacheConsolidado:
+    """Cache local de bytes e DataFrame por chave (ex.: URL do item) e eTag"""
+
+    def __init__(self, diretorio=DIRETORIO_CACHE):
+        self.diretorio = diretorio
+
+    def _base(self, chave):
+        nome = hashlib.sha256(chave.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.diretorio, nome)
+
+    def _base_versao(self, chave, etag):
+        """Prefixo dos arquivos da versão etag da chave"""
+        return f"{self._base(chave)}_{hashlib.sha256(etag.encode('utf-8')).hexdigest()[:16]}"
+
+    def _remover_outras_versoes(self, chave, manter):
+        """Remove os arquivos das versões da chave que não são manter nem a apontada pelos metadados"""
+        meta = self.metadados(chave) or {}
+        versoes = {os.path.basename(manter), meta.get("versao")}
+        for caminho in glob.glob(f"{glob.escape(self._base(chave))}_*"):
+            if os.path.basename(caminho).split(".")[0] not in versoes:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
+    def metadados(self, chave):
+        """Metadados da entrada em cache, ou None"""
+        try:
+            with open(f"{self._base(chave)}.json", encoding="utf-8") as arquivo:
+                return json.load(arquivo)
+        except (OSError, ValueError):
+            return None
+
+    def carregar(self, chave, etag):
+        """
+        Retorna (conteudo, df) se o cache estiver na versão etag, senão None
+        df é None quando o DataFrame não pôde ser guardado em Parquet
+        """
+        meta = self.metadados(chave)
+        if not meta or not etag or meta.get("etag") != etag:
+            return None
+
+        if meta.get("versao") is None:
+            return None
+        base = os.path.join(self.diretorio, meta["versao"])
+        try:
+            with open(f"{base}.bin", "rb") as arquivo:
+                conteudo = arquivo.read()
+            if hashlib.sha256(conteudo).hexdigest() != meta.get("sha256"):
+                logger.warning("Cache local corrompido - ignorando")
+                return None
+
+            df = None
+            if meta.get("tem_dataframe"):
+                with open(f"{base}.parquet", "rb") as arquivo:
+                    parquet = arquivo.read()
+                if hashlib.sha256(parquet).hexdigest() != meta.get("sha256_parquet"):
+                    logger.warning("DataFrame do cache local não corresponde aos bytes - ignorando")
+                    return None
+                df = compactar(pd.read_parquet(BytesIO(parquet)))
+            return conteudo, df
+        except Exception as e:
+            logger.warning(f"Falha ao ler cache local: {e}")
+            return None
+
+    def salvar(self, chave, etag, conteudo, df=None):
+        """Guarda os bytes (e opcionalmente o DataFrame) da versão etag"""
+        if not etag:
+            return False
+
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            base = self._base_versao(chave, etag)
+
+            _gravar_atomico(f"{base}.bin", bytes(conteudo))
+
+            sha256_parquet = None
+            if df is not None:
+                buffer = BytesIO()
+                try:
+                    df.to_parquet(buffer, index=False)
+                    _gravar_atomico(f"{base}.parquet", buffer.getvalue())
+                    sha256_parquet = hashlib.sha256(buffer.getvalue()).hexdigest()
+                except Exception as e:
+                    logger.info(f"DataFrame não guardado em cache (tipos mistos): {e}")
+
+            meta = {
+                "chave": chave,
+                "etag": etag,
+                "versao": os.path.basename(base),
+                "sha256": hashlib.sha256(conteudo).hexdigest(),
+                "tamanho": len(conteudo),
+                "tem_dataframe": sha256_parquet is not None,
+                "sha256_parquet": sha256_parquet,
+                "salvo_em": datetime.now().isoformat(),
+            }
+            _gravar_atomico(f"{self._base(chave)}.json", json.dumps(meta).encode("utf-8"))
+
+            # Versões anteriores (ou de uma gravação simultânea que perdeu) não são mais apontadas
+            self._remover_outras_versoes(chave, base)
+            return True
+
+        except Exception as e:
+            logger.warning(f"Falha ao gravar cache local: {e}")
+            return False
+
+    def invalidar(self, chave):
+        base = self._base(chave)
+        for caminho in [f"{base}.json", f"{base}.bin", f"{base}.parquet"] + glob.glob(f"{glob.escape(base)}_*"):
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
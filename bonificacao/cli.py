@@ -0,0 +1,272 @@
+"""
+Linha de comando para cargas em lote sem a interface (ex.: um ano de
+planilhas históricas das lojas).
+
+Lê e valida em paralelo, em um pool de processos, todas as planilhas de um
+diretório e consolida as válidas no SharePoint de uma vez: uma leitura do
+consolidado, um merge, um backup (delta) e uma gravação, com a cópia ENVIO de cada
+arquivo. Quando dois arquivos trazem a mesma loja/mês, vale o que vem
+depois na ordem escolhida (--ordem).
+
+Credenciais: variáveis de ambiente CLIENT_ID, CLIENT_SECRET, TENANT_ID,
+SITE_ID e DRIVE_ID, ou o secrets.toml do Streamlit (--secrets). Com --local o
+drive é um diretório com a mesma estrutura de pastas e nenhuma credencial é
+usada (ensaios de carga, testes e medições sem rede).
+
+Uso (a partir da raiz do repositório):
+    python -m bonificacao.cli planilhas/2024 --somente-validar
+    python -m bonificacao.cli planilhas/2024
+    python -m bonificacao.cli planilhas --recursivo --ordem modificacao --processos 8
+    python -m bonificacao.cli planilhas/2024 --local /tmp/drive --latencia-ms 80 --banda-mb-s 20
+"""
+import argparse
+import logging
+import os
+import sys
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    import tomli as tomllib
+
+from bonificacao.armazenamento import ArmazenamentoLocal
+from bonificacao.cache_leituras import CacheLeituras
+from bonificacao.consolidador import ConsolidadorSharePoint
+from bonificacao.graph import GRAPH_URL
+from bonificacao.lote import ler_e_validar_arquivos
+from bonificacao.motor import chaves_lojas_meses
+
+logger = logging.getLogger(__name__)
+
+CREDENCIAIS = ("CLIENT_ID", "CLIENT_SECRET", "TENANT_ID", "SITE_ID", "DRIVE_ID")
+EXTENSOES = (".xlsx", ".xls")
+SECRETS_PADRAO = ".streamlit/secrets.toml"
+
+SAIDA_OK = 0
+SAIDA_INVALIDOS = 1
+SAIDA_ERRO = 2
+
+SITUACOES_VALIDO = {
+    None: "válido",
+    "alterado": "válido (já enviado antes, mas o consolidado mudou)",
+    "inalterado": "válido (já consolidado, mas um arquivo anterior do lote tem as mesmas lojas/meses)",
+}
+
+
+def listar_planilhas(diretorio, recursivo=False, ordem="nome"):
+    """Planilhas do diretório (ignora temporários do Excel ~$), na ordem de aplicação"""
+    padrao = "**/*" if recursivo else "*"
+    caminhos = [
+        caminho for caminho in Path(diretorio).glob(padrao)
+        if caminho.is_file() and caminho.suffix.lower() in EXTENSOES and not caminho.name.startswith("~$")
+    ]
+    if ordem == "modificacao":
+        return sorted(caminhos, key=lambda caminho: (caminho.stat().st_mtime, str(caminho)))
+    return sorted(caminhos, key=str)
+
+
+def carregar_credenciais(caminho_secrets=SECRETS_PADRAO):
+    """Credenciais do ambiente, completadas pelo secrets.toml; levanta KeyError se faltar alguma"""
+    secrets = {}
+    if caminho_secrets and os.path.exists(caminho_secrets):
+        with open(caminho_secrets, "rb") as arquivo:
+            secrets = tomllib.load(arquivo)
+
+    credenciais = {}
+    for chave in CREDENCIAIS:
+        valor = os.environ.get(chave) or secrets.get(chave)
+        if not valor:
+            raise KeyError(chave)
+        credenciais[chave] = valor
+    return credenciais
+
+
+def criar_consolidador(credenciais, modo_concorrencia="lock", base_url=GRAPH_URL):
+    """ConsolidadorSharePoint com o token de aplicação das credenciais"""
+    from bonificacao.autenticacao import obter_provedor
+
+    provedor = obter_provedor(credenciais["CLIENT_ID"], credenciais["TENANT_ID"], credenciais["CLIENT_SECRET"])
+    return ConsolidadorSharePoint(credenciais["SITE_ID"], credenciais["DRIVE_ID"], provedor.obter_token,
+                                  modo_concorrencia=modo_concorrencia, base_url=base_url, versao="cli")
+
+
+def criar_consolidador_local(diretorio, modo_concorrencia="lock", latencia_ms=0, banda_mb_s=None):
+    """ConsolidadorSharePoint sobre um diretório local, com latência e banda simuladas"""
+    armazenamento = ArmazenamentoLocal(diretorio, latencia=latencia_ms / 1000,
+                                       banda=banda_mb_s * 1024 * 1024 if banda_mb_s else None)
+    return ConsolidadorSharePoint("local", "local", lambda: "local", modo_concorrencia=modo_concorrencia,
+                                  versao="cli", armazenamento=armazenamento)
+
+
+def descricao(doc):
+    """Primeiro parágrafo da docstring do módulo em uma linha (descrição do --help)"""
+    return " ".join(doc.strip().split("\n\n")[0].split())
+
+
+def imprimir_progresso(etapa, atual, total):
+    print(f"  [{atual}/{total}] {etapa}", flush=True)
+
+
+def validar_diretorio(caminhos, max_processos):
+    """
+    Lê e valida as planilhas em paralelo, mostrando o andamento
+    Retorna [(caminho, conteudo, validacao)] na ordem de caminhos
+    """
+    arquivos = [(caminho.name, caminho.read_bytes()) for caminho in caminhos]
+
+    def progresso(nome, lidos, total):
+        print(f"  [{lidos}/{total}] {nome}", flush=True)
+
+    # Sem cache: cada arquivo é lido uma única vez nesta execução
+    validacoes = ler_e_validar_arquivos(arquivos, progresso=progresso, max_processos=max_processos,
+                                        cache=CacheLeituras(memoria_maxima=0))
+    return [(caminho, conteudo, validacao)
+            for caminho, (_, conteudo), validacao in zip(caminhos, arquivos, validacoes)]
+
+
+def selecionar_envios(validados, consolidador=None, token=None, reenviar=False):
+    """
+    Separa os arquivos que entram na consolidação
+    Um arquivo já consolidado e inalterado volta para o lote se divide alguma
+    loja/mês com um arquivo anterior do lote: senão o anterior, reaplicado,
+    ficaria por último nessas lojas/meses
+    Retorna (envios, situacoes): envios no formato de consolidar_envios e a situação de cada arquivo
+    """
+    envios = []
+    situacoes = []
+    hashes_vistos = set()
+    chaves_lote = set()
+    for caminho, conteudo, validacao in validados:
+        if validacao["hash"] in hashes_vistos:
+            situacao = "repetido neste lote"
+        elif validacao["erros"]:
+            situacao = "com erros"
+        else:
+            repetido = None
+            if not reenviar and consolidador is not None:
+                repetido = _envio_repetido(consolidador, token, conteudo, caminho, validacao["df"])
+            chaves = set(chaves_lojas_meses(validacao["df"]))
+            if repetido == "inalterado" and chaves.isdisjoint(chaves_lote):
+                situacao = "já consolidado"
+            else:
+                situacao = SITUACOES_VALIDO[repetido]
+                envios.append({"df": validacao["df"], "nome": caminho.name, "conteudo": conteudo})
+                chaves_lote |= chaves
+        hashes_vistos.add(validacao["hash"])
+        situacoes.append((caminho, validacao, situacao))
+    return envios, situacoes
+
+
+def _envio_repetido(consolidador, token, conteudo, caminho, df):
+    """
+    None se o conteúdo nunca foi consolidado (ou não foi possível verificar),
+    "inalterado" se foi e as lojas/meses dele continuam como ele deixou, senão "alterado"
+    """
+    try:
+        if consolidador.envio_existente(token, conteudo, caminho.name) is None:
+            return None
+    except Exception as e:
+        logger.warning(f"Não foi possível verificar envio duplicado de {caminho.name}: {e}")
+        return None
+    return "inalterado" if consolidador.envio_inalterado(token, df) else "alterado"
+
+
+def imprimir_validacao(situacoes):
+    for caminho, validacao, situacao in situacoes:
+        df = validacao["df"]
+        meses = ", ".join(validacao["info_datas"].get("meses_presentes", []))
+        print(f"{caminho.name}: {len(df) if df is not None else 0} linhas, meses {meses or '-'} - {situacao}")
+        for erro in validacao["erros"]:
+            print(f"    erro: {erro}")
+
+
+def main(argv=None, consolidador=None):
+    parser = argparse.ArgumentParser(description=descricao(__doc__))
+    parser.add_argument("diretorio", help="diretório com as planilhas (.xlsx/.xls) a consolidar")
+    parser.add_argument("--recursivo", action="store_true", help="inclui subdiretórios")
+    parser.add_argument("--ordem", choices=("nome", "modificacao"), default="nome",
+                        help="ordem de aplicação; na mesma loja/mês vale o último arquivo")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                        help="processos de leitura e validação")
+    parser.add_argument("--somente-validar", action="store_true", help="só lê e valida, sem acessar o drive")
+    parser.add_argument("--estrito", action="store_true", help="não consolida nada se algum arquivo tiver erros")
+    parser.add_argument("--reenviar", action="store_true", help="inclui arquivos já consolidados cujas lojas/meses não mudaram desde então")
+    parser.add_argument("--concorrencia", choices=("lock", "otimista"), default="lock")
+    parser.add_argument("--secrets", default=SECRETS_PADRAO, help="secrets.toml com as credenciais")
+    parser.add_argument("--graph-url", default=GRAPH_URL, help="URL base do Graph (ex.: servidor simulado)")
+    parser.add_argument("--local", metavar="DIRETORIO", help="usa um diretório local como drive, sem credenciais")
+    parser.add_argument("--latencia-ms", type=float, default=0, help="latência simulada por operação (--local)")
+    parser.add_argument("--banda-mb-s", type=float, help="banda simulada em MB/s (--local)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    caminhos = listar_planilhas(args.diretorio, args.recursivo, args.ordem)
+    if not caminhos:
+        print(f"Nenhuma planilha encontrada em {args.diretorio}")
+        return SAIDA_INVALIDOS
+
+    print(f"Lendo e validando {len(caminhos)} planilhas com {args.processos} processo(s)...")
+    validados = validar_diretorio(caminhos, args.processos)
+
+    token = None
+    if not args.somente_validar and consolidador is None and args.local:
+        consolidador = criar_consolidador_local(args.local, args.concorrencia, args.latencia_ms, args.banda_mb_s)
+    elif not args.somente_validar and consolidador is None:
+        try:
+            consolidador = criar_consolidador(carregar_credenciais(args.secrets), args.concorrencia, args.graph_url)
+        except KeyError as e:
+            print(f"Credencial faltando: {e}")
+            return SAIDA_ERRO
+    if not args.somente_validar:
+        token = consolidador.obter_token()
+        if not token:
+            print("Erro de autenticação no Microsoft Graph")
+            return SAIDA_ERRO
+
+    envios, situacoes = selecionar_envios(validados, None if args.somente_validar else consolidador,
+                                          token, args.reenviar)
+    imprimir_validacao(situacoes)
+    com_erros = sum(1 for _, _, situacao in situacoes if situacao == "com erros")
+    print(f"{len(envios)} válido(s), {com_erros} com erros, {len(situacoes) - len(envios) - com_erros} ignorado(s)")
+
+    if args.somente_validar:
+        return SAIDA_INVALIDOS if com_erros else SAIDA_OK
+    if com_erros and args.estrito:
+        print("Nada consolidado (--estrito)")
+        return SAIDA_INVALIDOS
+    if not envios:
+        print("Nenhum arquivo a consolidar")
+        return SAIDA_INVALIDOS if com_erros else SAIDA_OK
+
+    print(f"Consolidando {len(envios)} arquivo(s) em uma única gravação...")
+    try:
+        resultados = consolidador.consolidar_envios(envios, progresso=imprimir_progresso, origem="cli")
+    except Exception as e:
+        print(f"Erro na consolidação: {e}")
+        return SAIDA_ERRO
+
+    for envio, resultado in zip(envios, resultados):
+        if resultado["sucesso"]:
+            copia = "" if resultado["copia_envio"] is not None else " (cópia ENVIO não salva)"
+            inalterados = f", {resultado['inalterados']} sem alteração" if resultado.get("inalterados") else ""
+            print(f"{envio['nome']}: {resultado['novos']} novos, {resultado['removidos']} substituídos"
+                  f"{inalterados}{copia}")
+        else:
+            print(f"{envio['nome']}: {resultado['erro']}")
+
+    consolidados = [resultado for resultado in resultados if resultado["sucesso"]]
+    if consolidados:
+        if consolidados[0]["snapshot"]:
+            print(f"Snapshot do consolidado: {consolidados[0]['snapshot']}")
+        if consolidados[0]["backup"]:
+            print(f"Backup criado: {consolidados[0]['backup']}")
+        print(f"Total no consolidado: {consolidados[-1]['total_final']} registros")
+    if len(consolidados) < len(resultados):
+        return SAIDA_ERRO
+    return SAIDA_INVALIDOS if com_erros else SAIDA_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Representação compacta do consolidado em memória.
+
+Aplicada na leitura (ler_aba), depois dos tipos do esquema:
+
+- texto com poucos valores distintos (além de GRUPO, LOJA, FUNÇÃO e STATUS,
+  que o esquema já trata como categoria) vira categoria
+- o restante do texto passa a string do Arrow, um buffer contíguo em vez de
+  um ponteiro por célula para um objeto Python
+- números são reduzidos (float32, inteiros menores) só quando todos os
+  valores continuam exatamente iguais
+
+Só colunas em que todos os valores preenchidos são texto são convertidas,
+e nenhum valor muda, então a planilha gravada a partir do DataFrame
+compacto é a mesma. concatenar une frames compactos sem perder as
+categorias e sem copiar as partes filtradas antes de juntá-las.
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+# Categoria só compensa com poucos distintos: cada categoria custa o texto e
+# uma entrada na tabela de hash, enquanto a string Arrow custa ~4 bytes por
+# célula além do próprio texto
+PROPORCAO_MAXIMA_CATEGORIAS = 0.1
+LINHAS_MINIMAS_CATEGORIA = 100
+
+try:
+    TIPO_TEXTO = pd.StringDtype('pyarrow')
+except ImportError:  # pragma: no cover - depende do ambiente
+    TIPO_TEXTO = None
+
+
+def _somente_texto(serie):
+    return pd.api.types.infer_dtype(serie, skipna=True) in ('string', 'empty')
+
+
+def _compactar_texto(serie):
+    if not _somente_texto(serie):
+        return serie
+    preenchidos = int(serie.notna().sum())
+    if (preenchidos >= LINHAS_MINIMAS_CATEGORIA
+            and serie.nunique(dropna=True) <= preenchidos * PROPORCAO_MAXIMA_CATEGORIAS):
+        return serie.astype('category')
+    if TIPO_TEXTO is not None:
+        return serie.astype(TIPO_TEXTO)
+    return serie
+
+
+def _compactar_numero(serie):
+    if pd.api.types.is_integer_dtype(serie.dtype):
+        return pd.to_numeric(serie, downcast='integer')
+
+    valores = serie.to_numpy()
+    reduzidos = valores.astype(np.float32)
+    with np.errstate(over='ignore', invalid='ignore'):
+        sem_perda = np.array_equal(reduzidos.astype(np.float64), valores, equal_nan=True)
+    return serie.astype(np.float32) if sem_perda else serie
+
+
+def compactar(df):
+    """
+    Converte as colunas para a representação compacta (altera df)
+    Nenhum valor é alterado; colunas que não podem ser reduzidas sem
+    perda ficam como estão
+    """
+    for coluna in df.columns:
+        serie = df[coluna]
+        tipo = serie.dtype
+        if isinstance(tipo, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(tipo):
+            continue
+        if tipo == object:
+            df[coluna] = _compactar_texto(serie)
+        elif isinstance(tipo, pd.StringDtype) and TIPO_TEXTO is not None and tipo != TIPO_TEXTO:
+            # Texto lido do Parquet volta com armazenamento Python
+            df[coluna] = serie.astype(TIPO_TEXTO)
+        elif tipo in (np.float64, np.int64, np.int32):
+            df[coluna] = _compactar_numero(serie)
+    return df
+
+
+def memoria_mb(df):
+    """
+    Memória do DataFrame em MB, incluindo o texto
+    Em colunas object cada objeto conta uma vez: a leitura do Excel reaproveita
+    o mesmo str para valores repetidos, e o deep=True do pandas os contaria
+    uma vez por célula
+    """
+    total = df.memory_usage(index=True, deep=False).sum()
+    for coluna in df.columns:
+        serie = df[coluna]
+        if serie.dtype == object:
+            objetos = {id(valor): valor for valor in serie.to_numpy()}
+            total += sum(sys.getsizeof(valor) for valor in objetos.values())
+        elif isinstance(serie.dtype, pd.CategoricalDtype):
+            total += serie.cat.categories.memory_usage(deep=True)
+    return total / 2**20
+
+
+# ===========================
+# CONCATENAÇÃO
+# ===========================
+def _alinhar_categorias(series):
+    """Mesmo CategoricalDtype em todas as partes de uma coluna, se alguma for categórica"""
+    if not any(isinstance(serie.dtype, pd.CategoricalDtype) for serie in series):
+        return series
+
+    valores = [
+        serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) else pd.Index(serie.dropna().unique())
+        for serie in series
+    ]
+    tipo = pd.CategoricalDtype(valores[0].append(valores[1:]).unique())
+    return [serie if serie.dtype == tipo else serie.astype(tipo) for serie in series]
+
+
+def concatenar(partes, manter=None):
+    """
+    Equivale a pd.concat(ignore_index=True) das linhas mantidas de cada parte
+    manter: uma máscara booleana por parte (None mantém a parte inteira)
+
+    O resultado é montado coluna a coluna, sem a cópia filtrada de cada parte
+    que o pd.concat exigiria, e as colunas categóricas continuam categorias
+    (o pd.concat com categorias diferentes volta a object)
+    """
+    manter = manter or [None] * len(partes)
+    selecionadas = [
+        (parte, mascara) for parte, mascara in zip(partes, manter)
+        if (len(parte) if mascara is None else mascara.any())
+    ]
+    if not selecionadas:
+        return pd.DataFrame()
+    if len(partes) == 1 and selecionadas[0][1] is None:
+        return selecionadas[0][0].reset_index(drop=True)
+
+    # Como no pd.concat, as colunas de partes sem linhas mantidas também entram
+    colunas = list(dict.fromkeys(coluna for parte in partes for coluna in parte.columns))
+    dados = {}
+    for coluna in colunas:
+        modelo = next(parte[coluna] for parte in partes if coluna in parte.columns)
+        series = []
+        for parte, mascara in selecionadas:
+            if coluna in parte.columns:
+                serie = parte[coluna] if mascara is None else parte[coluna][mascara]
+            else:
+                # Coluna ausente na parte: vazia, com o tipo da coluna nas outras partes
+                serie = modelo.iloc[:0].reindex(range(len(parte) if mascara is None else int(mascara.sum())))
+            series.append(serie)
+        dados[coluna] = pd.concat(_alinhar_categorias(series), ignore_index=True)
+    return pd.DataFrame(dados, columns=colunas, copy=False)
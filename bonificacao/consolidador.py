@@ -0,0 +1,830 @@
+"""
+Consolidação no SharePoint sem Streamlit.
+
+ConsolidadorSharePoint reúne o que a aplicação faz no drive: lock, leitura
+do consolidado (com o cache local por eTag), backup, gravação condicional,
+cópias ENVIO, partições, log de deltas e o índice de resumo por loja/mês
+(bonificacao/resumo.py). Lojas/meses reenviadas sem mudança de conteúdo
+(bonificacao/impressoes.py) ficam como estão, e um envio sem mudança alguma
+não regrava o consolidado. O backup de cada gravação é um delta com as
+lojas/meses substituídas, com snapshots completos de tempos em tempos
+(bonificacao/historico.py), e restaurar_consolidado volta o consolidado a
+qualquer horário do histórico. A aplicação e a linha de comando
+(bonificacao/cli.py) usam a mesma instância configurada com o site, o drive
+e uma função que devolve o token.
+
+O acesso aos arquivos passa por um armazenamento (bonificacao.armazenamento):
+o drive pelo Graph por padrão, ou um diretório local com a mesma estrutura
+de pastas.
+
+Nada aqui escreve na tela: as operações longas aceitam progresso(etapa,
+atual, total), chamado a cada etapa concluída, e devolvem os números para
+quem chamou exibir.
+"""
+import json
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pandas as pd
+
+from bonificacao.armazenamento import ArmazenamentoGraph
+from bonificacao.arquivo_envios import hash_conteudo, nome_arquivo_envio, tipo_conteudo_envio
+from bonificacao.cache_local import CacheConsolidado
+from bonificacao.compactacao import memoria_mb
+from bonificacao.deltas import PASTA_DELTAS, RegistroDeltas
+from bonificacao.esquema import aplicar_tipos
+from bonificacao.excel import gerar_xlsx, ler_planilha
+from bonificacao.graph import GRAPH_URL, ConflitoEtag
+from bonificacao.historico import (PASTA_HISTORICO, VERSAO_VAZIA, HistoricoConsolidado, nome_delta, nome_snapshot,
+                                   precisa_snapshot, versao_consolidado)
+from bonificacao.impressoes import remover_inalteradas, separar_inalteradas
+from bonificacao.instrumentacao import etapa, iniciar_execucao
+from bonificacao.motor import chaves_lojas_meses, consolidar_lote, mascara_lojas_meses, unir_chaves
+from bonificacao.particoes import ArmazenamentoParticionado, chave_particao, serializar_parquet
+from bonificacao.pipeline import PipelineEtapas
+from bonificacao.resumo import ARQUIVO_RESUMO, ResumoLojasMeses
+
+logger = logging.getLogger(__name__)
+
+PASTA_CONSOLIDADO = "Documentos Compartilhados/LimparAuto/FontedeDados"
+PASTA_ENVIOS_BACKUPS = "Documentos Compartilhados/PlanilhasEnviadas_Backups/Bonificacao"
+ARQUIVO_LOCK = "sistema_lock_bonificacao.json"
+ARQUIVO_CONSOLIDADO = "bonificacao_consolidada.xlsx"
+TIMEOUT_LOCK_MINUTOS = 10
+MAX_TENTATIVAS_CONFLITO = 5
+
+TIPO_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def preparar_dados_novos(df_novo):
+    """Adiciona DATA_ULTIMO_ENVIO e MES_ANO aos dados enviados"""
+    df_novo_processado = df_novo.copy()
+
+    # Adicionar DATA_ULTIMO_ENVIO
+    df_novo_processado['DATA_ULTIMO_ENVIO'] = datetime.now()
+
+    # Garantir que DATA está em datetime
+    df_novo_processado['DATA'] = pd.to_datetime(df_novo_processado['DATA'])
+
+    # Criar coluna MES_ANO para identificação
+    df_novo_processado['MES_ANO'] = df_novo_processado['DATA'].dt.to_period('M').astype(str)
+
+    return df_novo_processado
+
+
+def _avisar(progresso, etapa, atual, total):
+    """Chama o callback de progresso, sem deixar uma falha dele interromper a operação"""
+    if progresso is None:
+        return
+    try:
+        progresso(etapa, atual, total)
+    except Exception as e:
+        logger.warning(f"Falha no callback de progresso: {e}")
+
+
+class ConsolidadorSharePoint:
+    """
+    Operações sobre o consolidado no drive do SharePoint
+    obter_token() deve devolver um token válido do Graph (ou None)
+    modo_concorrencia: "lock" (arquivo de lock) ou "otimista" (If-Match no eTag lido)
+    armazenamento: onde ficam os arquivos (padrão: o drive pelo Graph em base_url)
+    """
+
+    def __init__(self, site_id, drive_id, obter_token, pasta_consolidado=PASTA_CONSOLIDADO,
+                 pasta_envios_backups=PASTA_ENVIOS_BACKUPS, arquivo_consolidado=ARQUIVO_CONSOLIDADO,
+                 arquivo_lock=ARQUIVO_LOCK, timeout_lock_minutos=TIMEOUT_LOCK_MINUTOS,
+                 modo_concorrencia="lock", max_tentativas_conflito=MAX_TENTATIVAS_CONFLITO,
+                 cache=None, base_url=GRAPH_URL, versao=None, armazenamento=None):
+        self.site_id = site_id
+        self.drive_id = drive_id
+        self.obter_token = obter_token
+        self.pasta_consolidado = pasta_consolidado
+        self.pasta_envios_backups = pasta_envios_backups
+        self.pasta_historico = f"{pasta_envios_backups}/{PASTA_HISTORICO}"
+        self.arquivo_consolidado = arquivo_consolidado
+        self.arquivo_lock = arquivo_lock
+        self.timeout_lock_minutos = timeout_lock_minutos
+        self.modo_concorrencia = modo_concorrencia
+        self.max_tentativas_conflito = max_tentativas_conflito
+        self.cache = cache if cache is not None else CacheConsolidado()
+        self.base_url = base_url
+        self.versao = versao
+        self.armazenamento = armazenamento or ArmazenamentoGraph(site_id, drive_id, base_url=base_url)
+        self._resumo_em_cache = None
+        self._cabeca_historico = None
+
+    def caminho_item(self, caminho, pasta=None):
+        """Caminho do item pasta/caminho no drive (pasta do consolidado por padrão)"""
+        pasta = self.pasta_consolidado if pasta is None else pasta
+        return f"{pasta}/{caminho}"
+
+    # ---------------------------
+    # Lock
+    # ---------------------------
+    def verificar_lock_existente(self, token):
+        """Verifica se existe um lock ativo no sistema; retorna (ocupado, dados do lock)"""
+        try:
+            conteudo = self.armazenamento.ler(token, self.caminho_item(self.arquivo_lock), endpoint="lock (GET)")
+
+            if conteudo is not None:
+                lock_data = json.loads(conteudo)
+                timestamp_lock = datetime.fromisoformat(lock_data['timestamp'])
+
+                if datetime.now() - timestamp_lock > timedelta(minutes=self.timeout_lock_minutos):
+                    logger.info("Lock expirado - removendo automaticamente")
+                    self.remover_lock(token, force=True)
+                    return False, None
+
+                return True, lock_data
+
+            return False, None
+
+        except Exception as e:
+            logger.error(f"Erro ao verificar lock: {e}")
+            return False, None
+
+    @etapa("lock")
+    def criar_lock(self, token, operacao="Consolidação por loja e mês", session_id=None):
+        """Cria um lock para bloquear outras operações"""
+        try:
+            session_id = session_id or str(uuid.uuid4())[:8]
+
+            lock_data = {
+                "timestamp": datetime.now().isoformat(),
+                "session_id": session_id,
+                "operacao": operacao,
+                "status": "EM_ANDAMENTO",
+                "app_version": self.versao
+            }
+
+            content = json.dumps(lock_data).encode('utf-8')
+            self.armazenamento.gravar(token, self.caminho_item(self.arquivo_lock), content, "application/json",
+                                      endpoint="lock (PUT)")
+            logger.info(f"Lock criado: {session_id}")
+            return True
+
+        except Exception as e:
+            logger.error(f"Falha ao criar lock: {e}")
+            return False
+
+    @etapa("liberar_lock")
+    def remover_lock(self, token, session_id=None, force=False):
+        """Remove o lock do sistema (só o da própria sessão, a menos que force)"""
+        try:
+            if not force:
+                ocupado, lock_data = self.verificar_lock_existente(token)
+                if ocupado and lock_data:
+                    if session_id and lock_data.get("session_id") != session_id:
+                        logger.warning("Tentativa de remover lock de outra sessão")
+                        return False
+
+            self.armazenamento.remover(token, self.caminho_item(self.arquivo_lock), endpoint="lock (DELETE)")
+            logger.info("Lock removido com sucesso")
+            return True
+
+        except Exception as e:
+            logger.error(f"Falha ao remover lock: {e}")
+            return False
+
+    @etapa("aguardar_lock")
+    def aguardar_lock_livre(self, token, intervalo=5):
+        """Espera o lock de outra operação ser liberado (ou expirar); retorna False no timeout"""
+        limite = time.monotonic() + self.timeout_lock_minutos * 60
+        while time.monotonic() < limite:
+            ocupado, _ = self.verificar_lock_existente(token)
+            if not ocupado:
+                return True
+            time.sleep(intervalo)
+        return False
+
+    # ---------------------------
+    # Arquivos no drive
+    # ---------------------------
+    def baixar_arquivo(self, token, nome_arquivo):
+        """Faz download de um arquivo da pasta do consolidado; retorna BytesIO ou None"""
+        try:
+            conteudo = self.armazenamento.ler(token, self.caminho_item(nome_arquivo))
+
+            if conteudo is None:
+                logger.warning(f"Arquivo não encontrado: {nome_arquivo}")
+                return None
+            return BytesIO(conteudo)
+
+        except Exception as e:
+            logger.error(f"Erro no download: {e}")
+            return None
+
+    def enviar_item(self, token, nome_arquivo, conteudo, pasta, content_type=TIPO_XLSX,
+                    if_match=None, somente_criar=False):
+        """
+        Faz upload de um arquivo e retorna o item gravado (com eTag)
+        No Graph, acima de LIMITE_UPLOAD_SIMPLES usa sessão de upload retomável em fragmentos
+        if_match/somente_criar tornam a gravação condicional (levanta ConflitoEtag)
+        Retorna None em caso de falha
+        """
+        try:
+            item = self.armazenamento.gravar(token, self.caminho_item(nome_arquivo, pasta), conteudo, content_type,
+                                             if_match=if_match, somente_criar=somente_criar)
+            logger.info(f"Arquivo enviado: {nome_arquivo}")
+            return item
+
+        except ConflitoEtag:
+            raise
+        except Exception as e:
+            logger.error(f"Erro no upload: {e}")
+            return None
+
+    def upload_arquivo(self, token, nome_arquivo, conteudo, pasta, content_type=TIPO_XLSX):
+        """Faz upload de um arquivo; retorna True em caso de sucesso"""
+        return self.enviar_item(token, nome_arquivo, conteudo, pasta, content_type) is not None
+
+    def copiar_consolidado(self, token, nome_backup, pasta=None):
+        """
+        Copia o consolidado atual para a pasta de backups (ou pasta) no próprio servidor
+        Retorna "copiado" ou "indisponivel" (o chamador recorre ao upload)
+        """
+        try:
+            copiado = self.armazenamento.copiar(token, self.caminho_item(self.arquivo_consolidado),
+                                                pasta or self.pasta_envios_backups, nome_backup)
+        except Exception as e:
+            logger.warning(f"Cópia no servidor falhou: {e}")
+            copiado = None
+        if copiado is None:
+            return "indisponivel"
+        return "copiado"
+
+    def ler_bytes(self, token, caminho):
+        """
+        Lê um arquivo relativo à pasta do consolidado
+        Retorna None se não existir e levanta exceção em qualquer outro erro,
+        para que uma falha de rede não seja confundida com arquivo inexistente
+        """
+        return self.armazenamento.ler(token, self.caminho_item(caminho))
+
+    def listar_arquivos(self, token, pasta):
+        """Nomes dos arquivos de uma pasta relativa à pasta do consolidado ([] se não existir)"""
+        return [item["name"] for item in self.armazenamento.listar(token, self.caminho_item(pasta))
+                if "folder" not in item]
+
+    def remover_arquivo(self, token, caminho):
+        """Remove um arquivo relativo à pasta do consolidado (um arquivo ausente já conta como removido)"""
+        self.armazenamento.remover(token, self.caminho_item(caminho))
+
+    # ---------------------------
+    # Consolidado e cópias ENVIO
+    # ---------------------------
+    def carregar_consolidado(self, token):
+        """
+        Obtém o consolidado, usando o cache local quando o eTag não mudou
+        Retorna: (arquivo_consolidado, df_consolidado, veio_do_cache, etag)
+        arquivo_consolidado é None se o consolidado ainda não existe; etag é o
+        da versão lida (None se os metadados não puderam ser obtidos)
+        """
+        caminho = self.caminho_item(self.arquivo_consolidado)
+        chave = self.armazenamento.chave(caminho)
+
+        with etapa("download") as span:
+            try:
+                metadados = self.armazenamento.metadados(token, caminho)
+            except Exception as e:
+                logger.warning(f"Metadados indisponíveis, baixando sem cache: {e}")
+                metadados = None
+
+            etag = metadados.get('eTag') if metadados else None
+            em_cache = self.cache.carregar(chave, etag) if etag else None
+            if em_cache is not None:
+                conteudo, df_consolidado = em_cache
+                span.registrar(cache=True, bytes=len(conteudo))
+            else:
+                arquivo_consolidado = self.baixar_arquivo(token, self.arquivo_consolidado)
+                span.registrar(cache=False, bytes=arquivo_consolidado.getbuffer().nbytes if arquivo_consolidado else 0)
+
+        if em_cache is not None:
+            if df_consolidado is None:
+                with etapa("leitura") as span:
+                    df_consolidado = ler_planilha(BytesIO(conteudo), "Dados")
+                    span.registrar(linhas=len(df_consolidado))
+            logger.info(f"Consolidado obtido do cache local ({etag}, {memoria_mb(df_consolidado):.1f} MB em memória)")
+            return BytesIO(conteudo), df_consolidado, True, etag
+
+        if arquivo_consolidado is None:
+            return None, pd.DataFrame(), False, None
+
+        with etapa("leitura") as span:
+            df_consolidado = ler_planilha(arquivo_consolidado, "Dados")
+            span.registrar(linhas=len(df_consolidado))
+        logger.info(f"Consolidado lido: {len(df_consolidado)} linhas, {memoria_mb(df_consolidado):.1f} MB em memória")
+        self.cache.salvar(chave, etag, arquivo_consolidado.getvalue(), df_consolidado)
+        return arquivo_consolidado, df_consolidado, False, etag
+
+    def atualizar_cache_consolidado(self, item, conteudo, df_final):
+        """Guarda no cache a versão recém-enviada, com o eTag devolvido pelo upload"""
+        etag = item.get('eTag') if item else None
+        if not etag:
+            return
+        self.cache.salvar(self.armazenamento.chave(self.caminho_item(self.arquivo_consolidado)), etag, conteudo, aplicar_tipos(df_final))
+
+    def etag_consolidado(self, token):
+        """eTag da versão atual do consolidado (None se não existe)"""
+        metadados = self.armazenamento.metadados(token, self.caminho_item(self.arquivo_consolidado))
+        return metadados.get('eTag') if metadados else None
+
+    def enviar_copia_envio(self, token, conteudo_original, nome_arquivo_original):
+        """Grava os bytes originais do envio como ENVIO_<hash>; retorna o item ou None"""
+        nome_copia = nome_arquivo_envio(hash_conteudo(conteudo_original), nome_arquivo_original)
+        logger.info(f"Cópia do envio {nome_arquivo_original} arquivada como {nome_copia}")
+        with etapa("copia_envio", bytes=len(conteudo_original)):
+            return self.enviar_item(token, nome_copia, conteudo_original, self.pasta_envios_backups,
+                                    tipo_conteudo_envio(nome_arquivo_original))
+
+    def envio_existente(self, token, conteudo_original, nome_arquivo_original):
+        """Metadados da cópia ENVIO deste conteúdo (já consolidado) ou None; levanta exceção em erro"""
+        nome_copia = nome_arquivo_envio(hash_conteudo(conteudo_original), nome_arquivo_original)
+        return self.armazenamento.metadados(token, self.caminho_item(nome_copia, self.pasta_envios_backups))
+
+    def envio_inalterado(self, token, df, origem=None):
+        """
+        As lojas/meses de um arquivo já enviado continuam no consolidado como ele deixou?
+        A cópia ENVIO só diz que o conteúdo foi consolidado alguma vez: um envio
+        posterior pode ter substituído essas lojas/meses (ex.: uma loja reenviando
+        o arquivo antigo para desfazer uma correção). Decide pelas impressões do
+        índice de resumo (sem_alteracoes); na dúvida retorna False
+        """
+        try:
+            df_novo_processado = preparar_dados_novos(df)
+        except Exception as e:
+            logger.info(f"Envio repetido não comparado com o consolidado: {e}")
+            return False
+        return self.sem_alteracoes(token, [df_novo_processado], origem) is not None
+
+    def montar_pipeline_gravacao(self, token, arquivo_consolidado, df_final, copias_envio, condicao,
+                                 etag_lido=None, chaves=None):
+        """
+        Etapas de gravação: snapshot do consolidado anterior (quando necessário),
+        consolidado novo, delta com as lojas/meses em chaves (etapa delta, depois
+        do consolidado) e uma cópia ENVIO por envio (etapas envio_0, envio_1...)
+        chaves=None grava um snapshot antes e outro depois, sem delta (restauração)
+        copias_envio: lista de (conteudo_original, nome_arquivo_original)
+        Retorna: (pipeline, nome_snapshot) com nome_snapshot None se não houver snapshot
+        """
+        horario = datetime.now()
+        versao_lida = versao_consolidado(etag_lido) if arquivo_consolidado is not None else VERSAO_VAZIA
+        cabeca = self.cabeca_historico(token, versao_lida)
+        nome_backup = None
+        if arquivo_consolidado is not None and (chaves is None or precisa_snapshot(cabeca, horario)):
+            nome_backup = nome_snapshot(horario, versao_lida)
+
+        def copiar_backup(resultados):
+            if condicao:
+                # Sem lock o consolidado pode mudar antes da cópia: o snapshot sai dos bytes lidos
+                return "indisponivel"
+            with etapa("backup", modo="copia"):
+                return self.copiar_consolidado(token, nome_backup, self.pasta_historico)
+
+        def enviar_backup(resultados):
+            if resultados["copia_backup"] == "copiado":
+                return True
+            with etapa("backup", modo="upload", bytes=len(conteudo_backup)):
+                return self.upload_arquivo(token, nome_backup, conteudo_backup, self.pasta_historico)
+
+        def serializar(resultados):
+            # Escrita em streaming (memória limitada) com formatos por coluna
+            with etapa("serializacao", linhas=len(df_final)) as span:
+                conteudo = gerar_xlsx(df_final)
+                span.registrar(bytes=len(conteudo))
+                return conteudo
+
+        def gravar_consolidado(resultados):
+            conteudo = resultados["xlsx_consolidado"]
+            with etapa("upload", bytes=len(conteudo)):
+                return self.enviar_item(token, self.arquivo_consolidado, conteudo, self.pasta_consolidado, **condicao)
+
+        def gravar_delta(resultados):
+            versao_final = versao_consolidado(resultados["consolidado"].get("eTag"))
+            nome = nome_delta(horario, versao_lida, versao_final)
+            with etapa("backup", modo="delta") as span:
+                linhas = df_final[mascara_lojas_meses(df_final, chaves)]
+                conteudo = serializar_parquet(linhas)
+                span.registrar(bytes=len(conteudo), linhas=len(linhas))
+                if not self.upload_arquivo(token, nome, conteudo, self.pasta_historico,
+                                           content_type="application/octet-stream"):
+                    self._cabeca_historico = None
+                    return None
+            self.avancar_cabeca_historico(cabeca if nome_backup is None else None, horario, versao_final,
+                                          tamanho_delta=len(conteudo),
+                                          tamanho_snapshot=len(conteudo_backup) if nome_backup else None)
+            return nome
+
+        def gravar_snapshot_final(resultados):
+            # Após uma restauração o delta não diria quais lojas/meses deixaram de existir
+            conteudo = resultados["xlsx_consolidado"]
+            versao_final = versao_consolidado(resultados["consolidado"].get("eTag"))
+            horario_final = datetime.now()
+            with etapa("backup", modo="snapshot", bytes=len(conteudo)):
+                if not self.upload_arquivo(token, nome_snapshot(horario_final, versao_final), conteudo,
+                                           self.pasta_historico):
+                    self._cabeca_historico = None
+                    return None
+            self.avancar_cabeca_historico(None, horario_final, versao_final, tamanho_snapshot=len(conteudo))
+            return nome_snapshot(horario_final, versao_final)
+
+        pipeline = PipelineEtapas()
+        antes_do_consolidado = ["xlsx_consolidado"]
+        if nome_backup is not None:
+            # Snapshot por cópia no servidor; se não for possível, reenvia os bytes baixados.
+            # O consolidado só é sobrescrito depois que a cópia terminou
+            conteudo_backup = arquivo_consolidado.getvalue()
+            pipeline.adicionar("copia_backup", copiar_backup)
+            pipeline.adicionar("backup", enviar_backup, depende_de=["copia_backup"])
+            antes_do_consolidado.append("copia_backup")
+        pipeline.adicionar("xlsx_consolidado", serializar)
+        pipeline.adicionar("consolidado", gravar_consolidado, depende_de=antes_do_consolidado)
+        # Sem o snapshot anterior o delta não teria de onde partir
+        depois_do_consolidado = ["consolidado"] + (["backup"] if nome_backup is not None else [])
+        if chaves is not None:
+            pipeline.adicionar("delta", gravar_delta, depende_de=depois_do_consolidado)
+        else:
+            pipeline.adicionar("snapshot_final", gravar_snapshot_final, depende_de=depois_do_consolidado)
+        # A cópia do envio (bytes originais) só é gravada depois que o consolidado foi salvo
+        for posicao, (conteudo, nome) in enumerate(copias_envio):
+            pipeline.adicionar(f"envio_{posicao}", lambda r, conteudo=conteudo, nome=nome: self.enviar_copia_envio(
+                token, conteudo, nome), depende_de=["consolidado"])
+
+        return pipeline, nome_backup
+
+    # ---------------------------
+    # Consolidação em lote
+    # ---------------------------
+    def gravar_lote(self, token, frames, copias=(), operacao="Consolidação em lote", origem="lote",
+                    progresso=None):
+        """
+        Aplica os frames ao consolidado (em ordem) com uma leitura, um merge e uma gravação
+        Lojas/meses idênticas às do consolidado não são regravadas; se nenhuma
+        muda, o consolidado não é gravado (só as cópias ENVIO)
+        Usa o lock ou If-Match conforme modo_concorrencia
+        copias: (conteudo_original, nome_arquivo_original) gravadas como ENVIO depois do consolidado
+        Retorna: (df_final, contagens, gravados, nome_snapshot); levanta RuntimeError em falha
+        O delta do histórico fica em gravados["delta"]
+        Cada chamada é uma execução medida (bonificacao.instrumentacao)
+        """
+        with iniciar_execucao(operacao, origem):
+            return self._gravar_lote(token, frames, copias, operacao, origem, progresso)
+
+    def gravar_somente_copias(self, token, copias, inalterados):
+        """
+        Lote sem nenhuma loja/mês alterada: sem backup nem gravação do consolidado
+        Grava só as cópias ENVIO; retorna (contagens, gravados) como gravar_lote
+        """
+        gravados = {f"envio_{posicao}": self.enviar_copia_envio(token, conteudo, nome)
+                    for posicao, (conteudo, nome) in enumerate(copias)}
+        contagens = [{'novos': 0, 'removidos': 0, 'mantidos': 0, 'inalterados': linhas} for linhas in inalterados]
+        return contagens, gravados
+
+    def _gravar_lote(self, token, frames_recebidos, copias, operacao, origem, progresso):
+        usar_lock = self.modo_concorrencia == "lock"
+        session_id = f"{origem}-{uuid.uuid4().hex[:8]}"
+        total = 4
+        if usar_lock:
+            _avisar(progresso, "Aguardando o lock", 0, total)
+            if not self.aguardar_lock_livre(token):
+                raise RuntimeError("Sistema bloqueado por outra operação")
+            if not self.criar_lock(token, operacao, session_id=session_id):
+                raise RuntimeError("Não foi possível bloquear o sistema")
+
+        try:
+            for tentativa in range(1, self.max_tentativas_conflito + 1):
+                arquivo_consolidado, df_consolidado, _, etag_lido = self.carregar_consolidado(token)
+                _avisar(progresso, f"Consolidado lido ({len(df_consolidado)} registros)", 1, total)
+
+                condicao = {}
+                if not usar_lock:
+                    if arquivo_consolidado is not None and not etag_lido:
+                        time.sleep(tentativa)
+                        continue
+                    condicao = {"if_match": etag_lido} if arquivo_consolidado is not None else {"somente_criar": True}
+
+                if len(df_consolidado) > 0:
+                    df_consolidado['DATA'] = pd.to_datetime(df_consolidado['DATA'])
+
+                # Lojas/meses com o mesmo conteúdo do consolidado ficam como estão
+                with etapa("impressoes", envios=len(frames_recebidos)) as span:
+                    frames, inalterados = separar_inalteradas(df_consolidado, frames_recebidos)
+                    span.registrar(linhas=sum(inalterados))
+                if not any(len(df) for df in frames):
+                    _avisar(progresso, "Nenhuma loja/mês alterada, consolidado mantido", 2, total)
+                    contagens, gravados = self.gravar_somente_copias(token, copias, inalterados)
+                    _avisar(progresso, "Concluído", total, total)
+                    return df_consolidado, contagens, gravados, None
+
+                # Todas as substituições por loja/mês do lote em um único merge
+                # (MES_ANO sai dos envios, que são pequenos, e não do resultado)
+                with etapa("merge", envios=len(frames)) as span:
+                    df_final, contagens = consolidar_lote(
+                        df_consolidado, [df.drop(columns='MES_ANO', errors='ignore') for df in frames]
+                    )
+                    span.registrar(linhas=len(df_final))
+                for contagem, linhas in zip(contagens, inalterados):
+                    contagem['inalterados'] = linhas
+                _avisar(progresso, f"{len(frames)} envio(s) combinados ({len(df_final)} registros)", 2, total)
+
+                chaves = unir_chaves([chaves_lojas_meses(df) for df in frames])
+                pipeline, nome_backup = self.montar_pipeline_gravacao(token, arquivo_consolidado, df_final,
+                                                                      list(copias), condicao, etag_lido, chaves)
+                gravados, erros = pipeline.executar()
+
+                if isinstance(erros.get("consolidado"), ConflitoEtag):
+                    logger.info(f"Conflito de eTag no lote (tentativa {tentativa}): {erros['consolidado']}")
+                    time.sleep(random.uniform(0, tentativa))
+                    continue
+                break
+            else:
+                raise RuntimeError("O consolidado foi alterado repetidamente por outros envios")
+
+            if "consolidado" in erros:
+                raise RuntimeError("Erro ao salvar arquivo consolidado")
+            _avisar(progresso, "Backup, consolidado e cópias gravados", 3, total)
+
+            self.atualizar_cache_consolidado(gravados["consolidado"], gravados["xlsx_consolidado"], df_final)
+            self.atualizar_resumo(token, frames, etag_lido, (gravados["consolidado"] or {}).get("eTag"),
+                                  lambda: df_final)
+
+        finally:
+            if usar_lock:
+                self.remover_lock(token, session_id)
+
+        _avisar(progresso, "Concluído", total, total)
+        return df_final, contagens, gravados, nome_backup
+
+    def consolidar_envios(self, envios, progresso=None, origem="lote"):
+        """
+        Consolida vários envios com uma leitura, um merge e uma gravação
+        envios são dicts com df, nome e conteudo
+        Retorna um dict de resultado por envio, na mesma ordem
+        """
+        resultados = [{"sucesso": False, "erro": None} for _ in envios]
+
+        token = self.obter_token()
+        if not token:
+            raise RuntimeError("Erro de autenticação no Microsoft Graph")
+
+        # Um envio que não pode ser preparado falha sozinho, sem derrubar o lote
+        validos = []
+        for posicao, envio in enumerate(envios):
+            try:
+                validos.append((posicao, preparar_dados_novos(envio["df"])))
+            except Exception as e:
+                resultados[posicao]["erro"] = f"Erro ao preparar dados: {e}"
+        if not validos:
+            return resultados
+
+        copias = [(envios[posicao]["conteudo"], envios[posicao]["nome"]) for posicao, _ in validos]
+        frames = [df for _, df in validos]
+
+        # Reenvio sem mudança reconhecido pelo índice: nem lock nem leitura do consolidado
+        total_final = self.sem_alteracoes(token, frames)
+        if total_final is not None:
+            logger.info(f"Nenhuma loja/mês alterada em {len(frames)} envio(s), consolidado mantido")
+            contagens, gravados = self.gravar_somente_copias(token, copias, [len(df) for df in frames])
+            nome_backup = None
+        else:
+            df_final, contagens, gravados, nome_backup = self.gravar_lote(
+                token, frames, copias, f"Consolidação em lote ({len(validos)} envios)",
+                origem=origem, progresso=progresso
+            )
+            total_final = len(df_final)
+
+        for indice, ((posicao, _), contagem) in enumerate(zip(validos, contagens)):
+            resultados[posicao].update(
+                contagem,
+                sucesso=True,
+                preservados=total_final - contagem["mantidos"],
+                total_final=total_final,
+                envios_no_lote=len(validos),
+                backup=gravados.get("delta"),
+                snapshot=nome_backup if "backup" in gravados else None,
+                copia_envio=gravados.get(f"envio_{indice}"),
+            )
+        return resultados
+
+    # ---------------------------
+    # Histórico de backups
+    # ---------------------------
+    def historico(self, token):
+        """Acesso ao histórico de snapshots e deltas na pasta de backups"""
+        return HistoricoConsolidado(
+            listar=lambda: [item for item in self.armazenamento.listar(token, self.pasta_historico)
+                            if "folder" not in item],
+            ler_bytes=lambda nome: self.armazenamento.ler(token, self.caminho_item(nome, self.pasta_historico))
+        )
+
+    def cabeca_historico(self, token, versao_lida):
+        """
+        Situação do histórico se ele chega à versão lida do consolidado, senão None
+        Fica em memória: a pasta só é listada quando a versão lida não é a última gravada aqui
+        """
+        if self._cabeca_historico is None or self._cabeca_historico['versao'] != versao_lida:
+            try:
+                self._cabeca_historico = self.historico(token).cabeca()
+            except Exception as e:
+                logger.warning(f"Histórico de backups indisponível: {e}")
+                self._cabeca_historico = None
+        cabeca = self._cabeca_historico
+        return cabeca if cabeca is not None and cabeca['versao'] == versao_lida else None
+
+    def avancar_cabeca_historico(self, cabeca, horario, versao, tamanho_delta=None, tamanho_snapshot=None):
+        """Registra em memória o delta ou snapshot recém-gravado; cabeca None começa uma sequência nova"""
+        if cabeca is None:
+            cabeca = {'deltas': 0, 'tamanho_deltas': 0, 'tamanho_base': tamanho_snapshot, 'inicio_em': horario}
+        if tamanho_delta is not None:
+            cabeca = dict(cabeca, deltas=cabeca['deltas'] + 1, tamanho_deltas=cabeca['tamanho_deltas'] + tamanho_delta)
+        self._cabeca_historico = dict(cabeca, versao=versao)
+
+    def restaurar_consolidado(self, ate, progresso=None):
+        """
+        Volta o consolidado ao horário ate, reconstruído do histórico, em uma gravação
+        O consolidado substituído e o restaurado ficam como snapshots no histórico
+        Retorna: (df_restaurado, entradas usadas, gravados); levanta ValueError se o
+        histórico não cobre o horário e RuntimeError em outras falhas
+        """
+        token = self.obter_token()
+        if not token:
+            raise RuntimeError("Erro de autenticação no Microsoft Graph")
+
+        with iniciar_execucao("Restauração do consolidado", "restauracao"):
+            usar_lock = self.modo_concorrencia == "lock"
+            session_id = f"restauracao-{uuid.uuid4().hex[:8]}"
+            total = 4
+            if usar_lock:
+                _avisar(progresso, "Aguardando o lock", 0, total)
+                if not self.aguardar_lock_livre(token):
+                    raise RuntimeError("Sistema bloqueado por outra operação")
+                if not self.criar_lock(token, "Restauração do consolidado", session_id=session_id):
+                    raise RuntimeError("Não foi possível bloquear o sistema")
+
+            try:
+                with etapa("reconstrucao") as span:
+                    df_restaurado, usadas = self.historico(token).reconstruir(ate)
+                    span.registrar(linhas=len(df_restaurado), entradas=len(usadas))
+                _avisar(progresso, f"Reconstruído de {len(usadas)} backup(s) ({len(df_restaurado)} registros)", 1, total)
+
+                arquivo_consolidado, _, _, etag_lido = self.carregar_consolidado(token)
+                condicao = {}
+                if not usar_lock:
+                    condicao = {"if_match": etag_lido} if arquivo_consolidado is not None else {"somente_criar": True}
+                _avisar(progresso, "Consolidado atual lido", 2, total)
+
+                pipeline, _ = self.montar_pipeline_gravacao(token, arquivo_consolidado, df_restaurado, [], condicao,
+                                                            etag_lido)
+                gravados, erros = pipeline.executar()
+                if "consolidado" in erros:
+                    raise RuntimeError(f"Erro ao gravar o consolidado restaurado: {erros['consolidado']}")
+                if "snapshot_final" in erros:
+                    logger.warning("Snapshot do consolidado restaurado não gravado; a próxima consolidação grava um")
+                _avisar(progresso, "Consolidado restaurado gravado", 3, total)
+
+                self.atualizar_cache_consolidado(gravados["consolidado"], gravados["xlsx_consolidado"], df_restaurado)
+                # Lojas/meses podem ter deixado de existir: o índice é reconstruído
+                self.atualizar_resumo(token, [], None, gravados["consolidado"].get("eTag"), lambda: df_restaurado)
+            finally:
+                if usar_lock:
+                    self.remover_lock(token, session_id)
+
+        _avisar(progresso, "Concluído", total, total)
+        return df_restaurado, usadas, gravados
+
+    # ---------------------------
+    # Partições e log de deltas
+    # ---------------------------
+    def armazenamento_particionado(self, token):
+        """Acesso ao armazenamento Parquet ao lado do consolidado"""
+        return ArmazenamentoParticionado(
+            ler_bytes=lambda caminho: self.ler_bytes(token, caminho),
+            gravar_bytes=lambda caminho, conteudo: self.upload_arquivo(
+                token, caminho, conteudo, self.pasta_consolidado, content_type="application/octet-stream"
+            ),
+            remover=lambda caminho: self.remover_arquivo(token, caminho)
+        )
+
+    def exportar_xlsx_particoes(self, token, armazenamento):
+        """Regera o consolidado xlsx a partir de todas as partições"""
+        df_final = armazenamento.ler_particoes()
+        conteudo = gerar_xlsx(df_final)
+
+        if not self.upload_arquivo(token, self.arquivo_consolidado, conteudo, self.pasta_consolidado):
+            return False
+
+        armazenamento.marcar_exportado()
+        logger.info(f"Planilha consolidada exportada: {len(df_final)} registros")
+        return True
+
+    def registro_deltas(self, token):
+        """Acesso ao log de deltas ao lado do consolidado"""
+        return RegistroDeltas(
+            listar=lambda: self.listar_arquivos(token, PASTA_DELTAS),
+            ler_bytes=lambda caminho: self.ler_bytes(token, caminho),
+            gravar_bytes=lambda caminho, conteudo: self.upload_arquivo(
+                token, caminho, conteudo, self.pasta_consolidado, content_type="application/octet-stream"
+            ),
+            remover=lambda caminho: self.remover_arquivo(token, caminho)
+        )
+
+    def compactar_deltas(self):
+        """
+        Aplica os deltas pendentes ao consolidado em uma única gravação
+        Retorna quantos deltas foram compactados
+        """
+        token = self.obter_token()
+        if not token:
+            raise RuntimeError("Erro de autenticação no Microsoft Graph")
+
+        # Os deltas já têm DATA_ULTIMO_ENVIO do momento do envio e as cópias ENVIO já foram salvas
+        compactados = self.registro_deltas(token).compactar(lambda frames: self.gravar_lote(
+            token, frames, operacao=f"Compactação de {len(frames)} envio(s)", origem="deltas"
+        ))
+        return len(compactados)
+
+    # ---------------------------
+    # Índice de resumo por loja/mês
+    # ---------------------------
+    def resumo_lojas_meses(self, token):
+        """Acesso ao índice de resumo por loja/mês ao lado do consolidado"""
+        return ResumoLojasMeses(
+            ler_bytes=lambda caminho: self.ler_bytes(token, caminho),
+            gravar_bytes=lambda caminho, conteudo: self.upload_arquivo(
+                token, caminho, conteudo, self.pasta_consolidado, content_type="application/json"
+            )
+        )
+
+    def atualizar_resumo(self, token, frames, origem_anterior, origem, carregar_completo):
+        """
+        Atualiza o índice de resumo com as lojas/meses dos frames aplicados
+        origem_anterior e origem: versão do consolidado antes e depois da gravação
+        carregar_completo() devolve o consolidado inteiro, usado só se o índice
+        não corresponde a origem_anterior
+        Uma falha fica só no log (o índice é reconstruído na próxima consolidação)
+        """
+        try:
+            with etapa("resumo") as span:
+                resumo = self.resumo_lojas_meses(token)
+                resumo.carregar()
+                incremental = resumo.corresponde(origem_anterior)
+                if incremental:
+                    resumo.aplicar(frames, origem)
+                else:
+                    resumo.reconstruir(carregar_completo(), origem)
+                resumo.gravar()
+                span.registrar(incremental=incremental, lojas_meses=len(resumo.indice['registros']))
+            return True
+        except Exception as e:
+            logger.warning(f"Índice de resumo não atualizado: {e}")
+            return False
+
+    def carregar_resumo(self, token):
+        """
+        Índice de resumo: (tabela, origem, atualizado_em), ou None se ainda não existe
+        O índice só é baixado de novo quando o eTag dele muda
+        """
+        metadados = self.armazenamento.metadados(token, self.caminho_item(ARQUIVO_RESUMO))
+        if metadados is None:
+            return None
+        etag = metadados.get('eTag')
+        em_cache = self._resumo_em_cache
+        if em_cache is not None and etag and em_cache[0] == etag:
+            return em_cache[1]
+
+        resumo = self.resumo_lojas_meses(token)
+        if resumo.carregar() is None:
+            return None
+        resultado = (resumo.tabela(), resumo.indice['origem'], resumo.indice['atualizado_em'])
+        self._resumo_em_cache = (etag, resultado)
+        return resultado
+
+    def sem_alteracoes(self, token, frames, origem=None):
+        """
+        Total de linhas do consolidado se nenhuma loja/mês dos frames muda, senão None
+        Decide só pelo índice de resumo, sem baixar o consolidado, e só quando o
+        índice é da versão atual (origem; padrão: o eTag do consolidado)
+        Na dúvida (índice ausente, antigo ou erro) retorna None e a consolidação segue
+        """
+        try:
+            with etapa("impressoes", modo="indice") as span:
+                resumo = self.carregar_resumo(token)
+                if resumo is None:
+                    return None
+                tabela, origem_resumo, _ = resumo
+                origem = origem or self.etag_consolidado(token)
+                if origem is None or origem_resumo != origem:
+                    return None
+                atuais = {chave_particao(loja, mes): impressao for loja, mes, impressao
+                          in zip(tabela['LOJA'], tabela['MES_ANO'], tabela['IMPRESSAO'])}
+                filtrados, _ = remover_inalteradas(frames, atuais)
+                inalterado = not any(len(df) for df in filtrados)
+                span.registrar(inalterado=inalterado)
+            return int(tabela['LINHAS'].sum()) if inalterado else None
+        except Exception as e:
+            logger.warning(f"Verificação de alterações pelo índice indisponível: {e}")
+            return None
@@ -0,0 +1,331 @@
+"""
+Registro de envios em log somente de acréscimo (deltas), compactado no
+consolidado em segundo plano.
+
+Layout, relativo à pasta do consolidado:
+    deltas/_compactacao.json
+    deltas/<AAAAMMDDTHHMMSSffffffZ>-<id>.parquet
+
+Cada envio validado vira um delta imutável: as linhas enviadas, já com
+DATA_ULTIMO_ENVIO, gravadas uma única vez com nome novo. O envio custa essa
+gravação pequena, sem ler nem regravar o consolidado.
+
+A compactação aplica os deltas pendentes ao consolidado, na ordem dos nomes
+(a ordem dos envios), com a mesma substituição por loja/mês de
+consolidar_lote. Depois que o consolidado foi gravado, o marcador
+_compactacao.json registra os deltas aplicados; ele é o ponto de commit. Se
+a compactação parar entre as duas gravações, a próxima reaplica os mesmos
+deltas, o que não muda o resultado. Deltas compactados são removidos depois
+do marcador.
+
+Só entram na compactação deltas com mais de idade_minima segundos, para
+que um envio ainda em gravação não fique para trás de outro mais novo. Uma
+gravação mais lenta que isso, ou um relógio atrasado, ainda pode produzir um
+delta com nome anterior ao último compactado (registrado no marcador):
+aplicá-lo por último sobrescreveria dados mais novos das mesmas lojas/meses.
+Esse delta fica de fora (atrasado), com um aviso no log. registrar confere o
+marcador depois de gravar e registra o envio de novo, com outro nome, quando
+uma compactação já passou dele.
+
+estado_atual devolve o consolidado mais os deltas ainda pendentes, sem
+esperar a compactação.
+"""
+import json
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from bonificacao.instrumentacao import etapa, executar_no_contexto
+from bonificacao.motor import consolidar_lote
+from bonificacao.particoes import ler_parquet, serializar_parquet
+
+logger = logging.getLogger(__name__)
+
+PASTA_DELTAS = "deltas"
+ARQUIVO_MARCADOR = f"{PASTA_DELTAS}/_compactacao.json"
+VERSAO_MARCADOR = 1
+EXTENSAO_DELTA = ".parquet"
+FORMATO_HORARIO = "%Y%m%dT%H%M%S%fZ"
+IDADE_MINIMA_SEGUNDOS = 30
+MAX_TRANSFERENCIAS_PARALELAS = 8
+MAX_TENTATIVAS_REGISTRO = 3
+MAX_TENTATIVAS_LEITURA = 5
+
+INTERVALO_COMPACTACAO_SEGUNDOS = 300
+LIMITE_DELTAS_PENDENTES = 20
+
+
+def nome_delta(agora=None):
+    """Nome único e ordenável pelo horário do envio (UTC)"""
+    agora = agora or datetime.now(timezone.utc)
+    return f"{agora.strftime(FORMATO_HORARIO)}-{uuid.uuid4().hex[:12]}{EXTENSAO_DELTA}"
+
+
+def horario_delta(nome):
+    """Horário (UTC) em que o delta foi registrado, a partir do nome"""
+    return datetime.strptime(nome.split('-', 1)[0], FORMATO_HORARIO).replace(tzinfo=timezone.utc)
+
+
+def eh_delta(nome):
+    if not nome.endswith(EXTENSAO_DELTA):
+        return False
+    try:
+        horario_delta(nome)
+    except ValueError:
+        return False
+    return True
+
+
+class RegistroDeltas:
+    """
+    Log de deltas ao lado do consolidado
+
+    listar() deve retornar os nomes dos arquivos em PASTA_DELTAS ([] se a
+    pasta não existir). ler_bytes(caminho) retorna os bytes ou None se não
+    existir; gravar_bytes(caminho, conteudo) retorna True em caso de
+    sucesso; remover(caminho), opcional, apaga um arquivo. Caminhos são
+    relativos à pasta do consolidado.
+    """
+
+    def __init__(self, listar, ler_bytes, gravar_bytes, remover=None,
+                 idade_minima=IDADE_MINIMA_SEGUNDOS, max_paralelo=MAX_TRANSFERENCIAS_PARALELAS):
+        self.listar = listar
+        self.ler_bytes = ler_bytes
+        self.gravar_bytes = gravar_bytes
+        self.remover = remover
+        self.idade_minima = idade_minima
+        self.max_paralelo = max_paralelo
+
+    # ---------------------------
+    # Registro
+    # ---------------------------
+    def registrar(self, df_novo):
+        """
+        Grava as linhas de um envio como um novo delta e retorna o nome dele
+        df_novo já deve ter DATA_ULTIMO_ENVIO (preparar_dados_novos)
+        Se uma compactação passou do nome durante a gravação, o delta ficaria
+        atrasado: ele é removido e gravado de novo com um nome atual
+        """
+        conteudo = serializar_parquet(df_novo.drop(columns='MES_ANO', errors='ignore'))
+        for tentativa in range(1, MAX_TENTATIVAS_REGISTRO + 1):
+            nome = nome_delta()
+            with etapa("registro_delta", linhas=len(df_novo), bytes=len(conteudo)):
+                if not self.gravar_bytes(f"{PASTA_DELTAS}/{nome}", conteudo):
+                    raise RuntimeError(f"Falha ao gravar o delta {nome}")
+            if not self._atrasado(nome):
+                logger.info(f"Delta registrado: {nome} ({len(df_novo)} linhas, {len(conteudo) / 1024:.0f} KB)")
+                return nome
+            logger.warning(f"Delta {nome} gravado depois de uma compactação mais recente (tentativa {tentativa})")
+            if self.remover is not None:
+                try:
+                    self.remover(f"{PASTA_DELTAS}/{nome}")
+                except Exception as e:
+                    logger.warning(f"Delta atrasado não removido ({nome}): {e}")
+        raise RuntimeError("Envio gravado sempre depois de compactações mais recentes (relógio do servidor atrasado?)")
+
+    def _atrasado(self, nome):
+        """O delta recém-gravado ficou antes do último compactado, sem ter sido compactado?"""
+        marcador = self.carregar_marcador()
+        ultimo = marcador.get('ultimo')
+        if ultimo is None or nome > ultimo or nome in marcador['compactados']:
+            return False
+        # Só a compactação remove deltas: se ele sumiu, já foi aplicado
+        return self.ler_bytes(f"{PASTA_DELTAS}/{nome}") is not None
+
+    # ---------------------------
+    # Marcador e pendentes
+    # ---------------------------
+    def carregar_marcador(self):
+        """Marcador da última compactação (vazio se nunca houve)"""
+        conteudo = self.ler_bytes(ARQUIVO_MARCADOR)
+        if conteudo is None:
+            return {'versao': VERSAO_MARCADOR, 'compactados': [], 'compactado_em': None}
+
+        marcador = json.loads(conteudo)
+        if marcador.get('versao') != VERSAO_MARCADOR:
+            raise ValueError(f"Versão de marcador não suportada: {marcador.get('versao')}")
+        return marcador
+
+    def _gravar_marcador(self, marcador):
+        conteudo = json.dumps(marcador, ensure_ascii=False, indent=1).encode('utf-8')
+        if not self.gravar_bytes(ARQUIVO_MARCADOR, conteudo):
+            raise RuntimeError("Falha ao gravar o marcador da compactação")
+
+    def situacao(self):
+        """
+        Deltas existentes, já separados
+        Retorna: (pendentes em ordem, compactados ainda não removidos,
+        atrasados (nome anterior ao último compactado, não aplicados), marcador)
+        """
+        marcador = self.carregar_marcador()
+        nomes = sorted(nome for nome in self.listar() if eh_delta(nome))
+        compactados = set(marcador['compactados'])
+        ultimo = marcador.get('ultimo')
+        restantes = [nome for nome in nomes if nome not in compactados]
+        atrasados = [nome for nome in restantes if ultimo is not None and nome < ultimo]
+        pendentes = [nome for nome in restantes if ultimo is None or nome > ultimo]
+        return pendentes, [nome for nome in nomes if nome in compactados], atrasados, marcador
+
+    def pendentes(self):
+        return self.situacao()[0]
+
+    def _ler_disponiveis(self, nomes):
+        """DataFrames dos deltas, na ordem de nomes (None para um delta que não existe mais)"""
+        def ler(nome):
+            conteudo = self.ler_bytes(f"{PASTA_DELTAS}/{nome}")
+            return None if conteudo is None else ler_parquet(conteudo)
+
+        if not nomes:
+            return []
+        with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+            futuros = [executar_no_contexto(executor, ler, nome) for nome in nomes]
+            return [futuro.result() for futuro in futuros]
+
+    def ler_deltas(self, nomes):
+        """DataFrames dos deltas, na ordem de nomes; levanta RuntimeError se algum não existe"""
+        frames = self._ler_disponiveis(nomes)
+        for nome, df in zip(nomes, frames):
+            if df is None:
+                raise RuntimeError(f"Delta ausente: {nome}")
+        return frames
+
+    # ---------------------------
+    # Leitura do estado atual
+    # ---------------------------
+    def estado_atual(self, carregar_snapshot):
+        """
+        Consolidado com os deltas pendentes aplicados
+        carregar_snapshot() retorna o DataFrame do consolidado
+        Retorna: (df, nomes dos deltas aplicados)
+
+        A lista é lida antes do consolidado: se uma compactação terminar no
+        meio, os deltas dela são reaplicados sobre um consolidado que já os
+        contém, sem mudar o resultado. Se ela chegou a remover algum delta,
+        o marcador é relido: os deltas que ele dá como compactados ficam de
+        fora (o consolidado, lido depois, já os contém); um delta ausente que
+        não está no marcador faz a leitura recomeçar
+        """
+        for tentativa in range(1, MAX_TENTATIVAS_LEITURA + 1):
+            pendentes = self.pendentes()
+            frames = self._ler_disponiveis(pendentes)
+            ausentes = [nome for nome, df in zip(pendentes, frames) if df is None]
+            if ausentes:
+                compactados = set(self.carregar_marcador()['compactados'])
+                if not compactados.issuperset(ausentes):
+                    logger.info(f"Deltas removidos durante a leitura ({len(ausentes)}), relendo (tentativa {tentativa})")
+                    continue
+                # A compactação aplica um prefixo dos pendentes: o que sobra é o sufixo ainda não aplicado
+                lidos = [(nome, df) for nome, df in zip(pendentes, frames) if nome not in compactados]
+                pendentes = [nome for nome, _ in lidos]
+                frames = [df for _, df in lidos]
+
+            df_snapshot = carregar_snapshot()
+            if not frames:
+                return df_snapshot, []
+            df_final, _ = consolidar_lote(df_snapshot, frames)
+            return df_final, pendentes
+        raise RuntimeError("Deltas pendentes compactados repetidamente durante a leitura")
+
+    # ---------------------------
+    # Compactação
+    # ---------------------------
+    def compactar(self, aplicar, agora=None):
+        """
+        Aplica os deltas pendentes (com idade mínima) ao consolidado
+        aplicar(frames) deve gravar o consolidado e levantar exceção em caso
+        de falha; o marcador só é gravado depois dele
+        Retorna a lista de deltas compactados
+        """
+        agora = agora or datetime.now(timezone.utc)
+        pendentes, antigos, atrasados, marcador = self.situacao()
+        for nome in atrasados:
+            if nome not in marcador.get('atrasados', []):
+                logger.error(f"Delta {nome} anterior ao último compactado ({marcador['ultimo']}): não será aplicado, "
+                             "o envio deve ser refeito")
+        # Nomes começam pelo horário, então os prontos são sempre um prefixo dos pendentes
+        prontos = [nome for nome in pendentes
+                   if (agora - horario_delta(nome)).total_seconds() >= self.idade_minima]
+        if not prontos:
+            return []
+
+        aplicar(self.ler_deltas(prontos))
+
+        self._gravar_marcador({
+            'versao': VERSAO_MARCADOR,
+            'compactados': sorted(set(antigos) | set(prontos)),
+            'ultimo': prontos[-1],
+            'atrasados': atrasados,
+            'compactado_em': agora.isoformat(),
+            'total_compactados': marcador.get('total_compactados', 0) + len(prontos),
+        })
+        logger.info(f"{len(prontos)} delta(s) compactados no consolidado")
+
+        if self.remover is not None:
+            for nome in antigos + prontos:
+                try:
+                    self.remover(f"{PASTA_DELTAS}/{nome}")
+                except Exception as e:
+                    logger.warning(f"Delta compactado não removido ({nome}): {e}")
+        return prontos
+
+
+# ===========================
+# COMPACTAÇÃO EM SEGUNDO PLANO
+# ===========================
+class CompactadorDeltas:
+    """
+    Thread que compacta os deltas a cada intervalo, ou antes disso quando
+    os envios registrados neste processo chegam a limite
+    compactar() deve retornar o número de deltas compactados
+    """
+
+    def __init__(self, compactar, intervalo=INTERVALO_COMPACTACAO_SEGUNDOS, limite=LIMITE_DELTAS_PENDENTES):
+        self.compactar = compactar
+        self.intervalo = intervalo
+        self.limite = limite
+        self._acordar = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._novos = 0
+        self.estatisticas = {'compactacoes': 0, 'deltas': 0, 'falhas': 0, 'ultima': None, 'ultimo_erro': None}
+
+    def avisar_envio(self):
+        """Conta um delta registrado; acorda a thread ao atingir o limite"""
+        with self._lock:
+            self._novos += 1
+            atingiu = self._novos >= self.limite
+        self._garantir_thread()
+        if atingiu:
+            self._acordar.set()
+
+    def compactar_agora(self):
+        """Pede uma compactação imediata (a thread faz o trabalho)"""
+        self._garantir_thread()
+        self._acordar.set()
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name="compactador-deltas", daemon=True)
+                self._thread.start()
+
+    def _executar(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            try:
+                compactados = self.compactar()
+            except Exception as e:
+                logger.error(f"Erro na compactação dos deltas: {e}")
+                self.estatisticas['falhas'] += 1
+                self.estatisticas['ultimo_erro'] = str(e)
+                continue
+            with self._lock:
+                self._novos = max(self._novos - compactados, 0)
+            self.estatisticas['ultimo_erro'] = None
+            if compactados:
+                self.estatisticas['compactacoes'] += 1
+                self.estatisticas['deltas'] += compactados
+                self.estatisticas['ultima'] = datetime.now()
@@ -0,0 +1,110 @@
+"""
+Esquema da planilha de bonificações (aba "Dados").
+"""
+import pandas as pd
+
+COLUNAS_OBRIGATORIAS = [
+    'GRUPO', 'CONCESSIONÁRIA', 'LOJA', 'FUNÇÃO', 'NOME', 'DATA',
+    'FORMA PAG', 'CARTÃO / PIX',
+    'TMO_DUTO', 'R$_DUTO', 'EXTRA_DUTO', 'TOTAL_DUTO',
+    'TMO_FREIO', 'R$_FREIO', 'EXTRA_FREIO', 'TOTAL_FREIO',
+    'TMO_SANIT', 'R$_SANIT', 'EXTRA_SANIT', 'TOTAL_SANIT',
+    'TMO_VERNIZ', 'R$_VERNIZ', 'EXTRA_VERNIZ', 'TOTAL_VERNIZ',
+    'TMO_CX EVAP', 'R$_CX EVAP', 'EXTRA_CX EVAP', 'TOTAL_CX EVAP',
+    'TMO_PROTEC', 'R$_PROTEC', 'EXTRA_PROTEC', 'TOTAL_PROTEC',
+    'TMO_VC GREEN', 'R$_VC GREEN', 'EXTRA_VC GREEN', 'TOTAL_VC GREEN',
+    'TMO_NITROGÊNIO', 'R$_NITROGÊNIO', 'EXTRA_NITROGÊNIO', 'TOTAL_NITROGÊNIO',
+    'TMO_TOTAL', 'R$_TOTAL', 'STATUS', 'PAGO', 'A PAGAR', 'PIX'
+]
+
+COLUNA_ULTIMO_ENVIO = 'DATA_ULTIMO_ENVIO'
+ABA_DADOS = 'Dados'
+
+# ===========================
+# FORMATOS DE CÉLULA
+# ===========================
+FORMATO_DATA = 'dd/mm/yyyy'
+FORMATO_DATA_HORA = 'dd/mm/yyyy hh:mm:ss'
+FORMATO_VALOR = '#,##0.00'
+FORMATO_QUANTIDADE = '0.00'
+
+PREFIXOS_VALOR = ('R$_', 'EXTRA_', 'TOTAL_')
+PREFIXOS_QUANTIDADE = ('TMO_',)
+
+
+def formato_coluna(coluna):
+    """Formato numérico Excel da coluna, ou None para o formato geral"""
+    if coluna == 'DATA':
+        return FORMATO_DATA
+    if coluna == COLUNA_ULTIMO_ENVIO:
+        return FORMATO_DATA_HORA
+    if coluna.startswith(PREFIXOS_VALOR):
+        return FORMATO_VALOR
+    if coluna.startswith(PREFIXOS_QUANTIDADE):
+        return FORMATO_QUANTIDADE
+    return None
+
+
+FORMATOS_COLUNAS = {
+    coluna: formato_coluna(coluna)
+    for coluna in COLUNAS_OBRIGATORIAS + [COLUNA_ULTIMO_ENVIO]
+}
+
+# ===========================
+# TIPOS DAS COLUNAS
+# ===========================
+COLUNAS_CATEGORICAS = ['GRUPO', 'LOJA', 'FUNÇÃO', 'STATUS']
+PREFIXOS_NUMERICOS = ('TMO_', 'R$_', 'EXTRA_', 'TOTAL_')
+COLUNAS_DATA = ['DATA']
+
+TIPO_CATEGORIA = 'categoria'
+TIPO_NUMERICO = 'numerico'
+TIPO_DATA = 'data'
+
+
+def tipo_coluna(coluna):
+    """Tipo esperado da coluna, ou None para manter o tipo inferido na leitura"""
+    if coluna in COLUNAS_CATEGORICAS:
+        return TIPO_CATEGORIA
+    if coluna in COLUNAS_DATA:
+        return TIPO_DATA
+    if coluna.startswith(PREFIXOS_NUMERICOS):
+        return TIPO_NUMERICO
+    return None
+
+
+TIPOS_COLUNAS = {
+    coluna: tipo_coluna(coluna)
+    for coluna in COLUNAS_OBRIGATORIAS
+    if tipo_coluna(coluna) is not None
+}
+
+
+def aplicar_tipos(df):
+    """
+    Converte as colunas conhecidas para o tipo do esquema (altera df)
+    Datas e números só são convertidos se nenhum valor preenchido se perder;
+    texto inválido fica como está para a validação apontar
+    """
+    for coluna, tipo in TIPOS_COLUNAS.items():
+        if coluna not in df.columns:
+            continue
+        serie = df[coluna]
+
+        if tipo == TIPO_CATEGORIA:
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                df[coluna] = serie.astype('category')
+            continue
+
+        if tipo == TIPO_DATA:
+            if pd.api.types.is_datetime64_any_dtype(serie):
+                continue
+            convertida = pd.to_datetime(serie, errors='coerce')
+        else:
+            if pd.api.types.is_numeric_dtype(serie):
+                continue
+            convertida = pd.to_numeric(serie, errors='coerce')
+
+        if convertida.notna().sum() == serie.notna().sum():
+            df[coluna] = convertida
+    return df
@@ -0,0 +1,205 @@
+"""
+Leitura e escrita de planilhas xlsx.
+
+A leitura usa o motor calamine (Rust) quando o pacote python-calamine está
+instalado e, caso contrário, o openpyxl em modo somente leitura que o
+pandas já usa. Cada pasta de trabalho é aberta uma única vez e os tipos
+das colunas vêm do esquema (bonificacao.esquema.TIPOS_COLUNAS), seguidos
+da representação compacta (bonificacao.compactacao).
+
+A escrita é feita em modo streaming: as linhas são convertidas em blocos e
+gravadas uma a uma, sem montar o modelo de objetos do openpyxl. Com o
+XlsxWriter (constant_memory) cada linha é descarregada em disco assim que
+a seguinte começa; sem ele, cai para o modo write-only do openpyxl.
+"""
+import logging
+from io import BytesIO
+
+import pandas as pd
+
+from bonificacao.compactacao import compactar
+from bonificacao.esquema import ABA_DADOS, aplicar_tipos, formato_coluna
+
+logger = logging.getLogger(__name__)
+
+try:
+    import xlsxwriter
+except ImportError:  # pragma: no cover - depende do ambiente
+    xlsxwriter = None
+
+try:
+    import python_calamine  # noqa: F401
+    MOTOR_LEITURA = 'calamine'
+except ImportError:  # pragma: no cover - depende do ambiente
+    MOTOR_LEITURA = None  # pandas escolhe openpyxl (read-only) ou xlrd pelo formato
+
+LINHAS_POR_BLOCO = 5000
+
+
+# ===========================
+# LEITURA
+# ===========================
+def normalizar_colunas(df):
+    """Padroniza os nomes das colunas (sem espaços nas pontas, maiúsculas)"""
+    df.columns = df.columns.astype(str).str.strip().str.upper()
+    return df
+
+
+def abrir_planilha(origem):
+    """
+    Abre a pasta de trabalho uma única vez
+    Retorna um pd.ExcelFile; use sheet_names e ler_aba sobre o mesmo objeto
+    """
+    if hasattr(origem, 'seek'):
+        origem.seek(0)
+    try:
+        return pd.ExcelFile(origem, engine=MOTOR_LEITURA)
+    except Exception as e:
+        if MOTOR_LEITURA is None:
+            raise
+        logger.warning(f"Leitura com {MOTOR_LEITURA} falhou, usando motor padrão: {e}")
+        if hasattr(origem, 'seek'):
+            origem.seek(0)
+        return pd.ExcelFile(origem)
+
+
+def ler_aba(planilha, aba=ABA_DADOS, colunas=None, tipar=True):
+    """
+    Lê uma aba de uma planilha já aberta
+    colunas: lista opcional de colunas (nomes normalizados) a carregar
+    tipar: aplica os tipos do esquema (categorias, números, datas) e a
+    representação compacta (categorias, strings Arrow, números reduzidos)
+    """
+    usecols = None
+    if colunas is not None:
+        alvo = set(colunas)
+        usecols = lambda nome: str(nome).strip().upper() in alvo
+
+    df = planilha.parse(aba, usecols=usecols)
+    normalizar_colunas(df)
+
+    if tipar:
+        aplicar_tipos(df)
+        compactar(df)
+    return df
+
+
+def ler_planilha(origem, aba=ABA_DADOS, colunas=None, tipar=True):
+    """Abre a pasta de trabalho, lê uma aba e fecha"""
+    with abrir_planilha(origem) as planilha:
+        return ler_aba(planilha, aba, colunas=colunas, tipar=tipar)
+
+
+# ===========================
+# ESCRITA
+# ===========================
+def _iterar_blocos(dados, linhas_por_bloco):
+    """Divide um DataFrame (ou iterável de DataFrames) em blocos de linhas"""
+    frames = [dados] if isinstance(dados, pd.DataFrame) else dados
+    for df in frames:
+        for inicio in range(0, len(df), linhas_por_bloco):
+            yield df.iloc[inicio:inicio + linhas_por_bloco]
+
+
+def _valores_coluna(serie):
+    """Converte uma coluna em lista Python, com None no lugar de NaN/NaT"""
+    valores = serie.astype(object)
+    nulos = serie.isna().to_numpy()
+    if nulos.any():
+        valores = valores.where(~nulos, None)
+    return valores.tolist()
+
+
+def _linhas_bloco(bloco, colunas):
+    """Gera as linhas de um bloco como listas de valores Python"""
+    bloco = bloco.reindex(columns=colunas)
+    return zip(*(_valores_coluna(bloco[c]) for c in colunas))
+
+
+def _colunas_de(dados):
+    """Obtém o cabeçalho e o iterável de frames, consumindo o primeiro frame se preciso"""
+    if isinstance(dados, pd.DataFrame):
+        return list(dados.columns), dados
+
+    frames = iter(dados)
+    primeiro = next(frames, None)
+    if primeiro is None:
+        return [], pd.DataFrame()
+
+    def todos():
+        yield primeiro
+        yield from frames
+
+    return list(primeiro.columns), todos()
+
+
+def _escrever_xlsxwriter(dados, colunas, destino, aba, linhas_por_bloco):
+    workbook = xlsxwriter.Workbook(destino, {
+        'constant_memory': True,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    try:
+        worksheet = workbook.add_worksheet(aba)
+        cabecalho = workbook.add_format({'bold': True})
+
+        # Formatos precomputados por coluna, aplicados às células sem formato próprio.
+        # Sem default_date_format: ele daria a toda data o formato de DATA e
+        # esconderia a hora de DATA_ULTIMO_ENVIO
+        formatos = {}
+        for indice, coluna in enumerate(colunas):
+            formato = formato_coluna(str(coluna))
+            if formato not in formatos:
+                formatos[formato] = workbook.add_format({'num_format': formato}) if formato else None
+            if formatos[formato] is not None:
+                worksheet.set_column(indice, indice, None, formatos[formato])
+
+        worksheet.write_row(0, 0, [str(c) for c in colunas], cabecalho)
+
+        linha = 1
+        for bloco in _iterar_blocos(dados, linhas_por_bloco):
+            for valores in _linhas_bloco(bloco, colunas):
+                worksheet.write_row(linha, 0, valores)
+                linha += 1
+    finally:
+        workbook.close()
+    return linha - 1
+
+
+def _escrever_openpyxl(dados, colunas, destino, aba, linhas_por_bloco):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(aba)
+    worksheet.append([str(c) for c in colunas])
+
+    linhas = 0
+    for bloco in _iterar_blocos(dados, linhas_por_bloco):
+        for valores in _linhas_bloco(bloco, colunas):
+            worksheet.append(valores)
+            linhas += 1
+
+    workbook.save(destino)
+    return linhas
+
+
+def escrever_xlsx(dados, destino, aba=ABA_DADOS, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Grava os dados em xlsx no destino (caminho ou arquivo binário)
+    dados pode ser um DataFrame ou um iterável de DataFrames com as mesmas colunas
+    Retorna o número de linhas gravadas
+    """
+    colunas, dados = _colunas_de(dados)
+
+    if xlsxwriter is not None:
+        return _escrever_xlsxwriter(dados, colunas, destino, aba, linhas_por_bloco)
+
+    logger.info("XlsxWriter indisponível - usando openpyxl em modo write-only")
+    return _escrever_openpyxl(dados, colunas, destino, aba, linhas_por_bloco)
+
+
+def gerar_xlsx(dados, aba=ABA_DADOS):
+    """Gera o conteúdo xlsx em memória e retorna os bytes"""
+    output = BytesIO()
+    escrever_xlsx(dados, output, aba=aba)
+    return output.getvalue()
@@ -0,0 +1,110 @@
+"""
+Fila de consolidação com gravação em grupo (group commit).
+
+Os envios validados entram em uma fila única do processo. Uma thread de
+consolidação retira tudo o que estiver pendente, entrega o lote inteiro a
+processar_lote (uma leitura, um merge e uma gravação do consolidado) e
+devolve a cada envio o seu próprio resultado por um Future. Enquanto um
+lote está sendo gravado, os envios que chegam se acumulam para o próximo,
+então no pico o número de gravações acompanha o número de lotes e não o
+número de envios.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+MAX_ENVIOS_LOTE = 50
+ESPERA_AGRUPAMENTO_SEGUNDOS = 0.5
+
+
+class FilaConsolidacao:
+    """
+    Fila de envios atendida por uma única thread de consolidação
+    processar_lote(envios) deve retornar uma lista de resultados na mesma ordem
+    """
+
+    def __init__(self, processar_lote, max_lote=MAX_ENVIOS_LOTE,
+                 espera_agrupamento=ESPERA_AGRUPAMENTO_SEGUNDOS):
+        self.processar_lote = processar_lote
+        self.max_lote = max_lote
+        self.espera_agrupamento = espera_agrupamento
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._lock_entrada = threading.Lock()
+        self._em_processamento = 0
+        self.estatisticas = {'lotes': 0, 'envios': 0, 'maior_lote': 0}
+
+    def enviar(self, envio):
+        """Enfileira um envio; retorna um Future com o resultado dele"""
+        futuro = Future()
+        self._fila.put((envio, futuro))
+        self._garantir_thread()
+        return futuro
+
+    def enviar_varios(self, envios):
+        """
+        Enfileira vários envios que devem ser consolidados no mesmo lote
+        (desde que caibam em max_lote); retorna um Future por envio
+        """
+        futuros = []
+        with self._lock_entrada:
+            for envio in envios:
+                futuro = Future()
+                self._fila.put((envio, futuro))
+                futuros.append(futuro)
+        self._garantir_thread()
+        return futuros
+
+    def pendentes(self):
+        """Envios aguardando, incluindo os do lote em gravação"""
+        return self._fila.qsize() + self._em_processamento
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name="fila-consolidacao", daemon=True)
+                self._thread.start()
+
+    def _retirar_lote(self):
+        """Bloqueia até haver um envio e retira tudo o que estiver pendente (até max_lote)"""
+        lote = [self._fila.get()]
+        if self.espera_agrupamento:
+            time.sleep(self.espera_agrupamento)
+        # Não corta ao meio um grupo de enviar_varios que ainda está entrando
+        with self._lock_entrada:
+            while len(lote) < self.max_lote:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+        return lote
+
+    def _executar(self):
+        while True:
+            lote = self._retirar_lote()
+            self._em_processamento = len(lote)
+            envios = [envio for envio, _ in lote]
+            logger.info(f"Consolidando lote com {len(envios)} envio(s)")
+
+            self.estatisticas['lotes'] += 1
+            self.estatisticas['envios'] += len(lote)
+            self.estatisticas['maior_lote'] = max(self.estatisticas['maior_lote'], len(lote))
+
+            try:
+                resultados = self.processar_lote(envios)
+                if len(resultados) != len(lote):
+                    raise RuntimeError(f"processar_lote retornou {len(resultados)} resultados para {len(lote)} envios")
+            except Exception as e:
+                logger.error(f"Falha ao consolidar lote: {e}")
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+            else:
+                for (_, futuro), resultado in zip(lote, resultados):
+                    futuro.set_result(resultado)
+            finally:
+                self._em_processamento = 0
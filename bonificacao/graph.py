@@ -0,0 +1,497 @@
+"""
+Acesso ao Microsoft Graph (drive do SharePoint).
+
+Todas as chamadas passam por um ClienteGraph compartilhado pelo processo:
+uma requests.Session com pool de conexões (keep-alive, sem novo handshake
+TLS a cada chamada), limite de requisições simultâneas, novas tentativas
+com backoff e jitter para 429/5xx e falhas de conexão (respeitando
+Retry-After) e registro de latência por endpoint. Cada tentativa também
+vira um span da etapa em andamento (bonificacao.instrumentacao).
+
+Arquivos acima de LIMITE_UPLOAD_SIMPLES são enviados por sessão de upload
+(createUploadSession) em fragmentos. O Graph exige que os fragmentos de uma
+sessão cheguem em ordem, então eles são enviados em sequência. Se um
+fragmento falhar, o status da sessão é consultado e o envio retoma do
+primeiro byte ainda não confirmado. As sessões abertas ficam registradas por
+destino e conteúdo, para que uma nova tentativa com os mesmos bytes retome a
+sessão anterior em vez de reenviar tudo.
+
+Gravações condicionais recebem if_match com o eTag lido: se o item mudou
+desde a leitura o Graph responde 412 e a função levanta ConflitoEtag, para
+que o chamador releia o arquivo e reaplique a alteração.
+
+listar_pasta devolve os itens de uma pasta, seguindo a paginação do Graph
+(@odata.nextLink).
+
+Cópias de itens são feitas no próprio servidor (POST .../copy): o Graph
+responde 202 com uma URL de monitoramento, consultada até a operação
+assíncrona terminar, sem que os bytes passem pela aplicação.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from bonificacao.instrumentacao import registrar_chamada
+
+logger = logging.getLogger(__name__)
+
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+# Fragmentos devem ser múltiplos de 320 KiB (exigência do Graph)
+TAMANHO_BASE_FRAGMENTO = 320 * 1024
+TAMANHO_FRAGMENTO = 10 * TAMANHO_BASE_FRAGMENTO
+LIMITE_UPLOAD_SIMPLES = 4 * 1024 * 1024
+MAX_FALHAS_FRAGMENTO = 5
+ESPERA_BASE_SEGUNDOS = 0.5
+ESPERA_MAXIMA_SEGUNDOS = 60
+
+MAX_REQUISICOES_SIMULTANEAS = 8
+MAX_TENTATIVAS = 4
+TAMANHO_POOL = 16
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+AMOSTRAS_LATENCIA = 200
+
+INTERVALO_MONITOR_SEGUNDOS = 0.5
+ESPERA_MAXIMA_COPIA_SEGUNDOS = 120
+
+STATUS_CONFLITO = {409, 412}
+
+_sessoes_abertas = {}
+_lock_sessoes = threading.Lock()
+
+
+class ConflitoEtag(Exception):
+    """O item foi alterado (ou criado) por outro processo desde a leitura"""
+
+
+def cabecalhos_condicionais(if_match=None):
+    """Cabeçalho If-Match para gravação condicional ({} se não houver eTag)"""
+    return {"If-Match": if_match} if if_match else {}
+
+
+def url_item_drive(site_id, drive_id, caminho, base_url=GRAPH_URL):
+    """URL de um item do drive pelo caminho (sem o sufixo :/content)"""
+    return f"{base_url}/sites/{site_id}/drives/{drive_id}/root:/{caminho}"
+
+
+def obter_metadados(url_item, token, timeout=10, cliente=None):
+    """
+    Metadados do item (eTag, cTag, size, lastModifiedDateTime)
+    Retorna None se o item não existe; levanta exceção em outros erros
+    """
+    cliente = cliente or cliente_padrao()
+    response = cliente.get(url_item, token=token, timeout=timeout, endpoint="metadados",
+                           params={"$select": "id,eTag,cTag,size,lastModifiedDateTime"})
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise RuntimeError(f"Erro ao obter metadados: {response.status_code}")
+    return response.json()
+
+
+def listar_pasta(url_item, token, timeout=30, cliente=None):
+    """
+    Itens da pasta (name, eTag, size, lastModifiedDateTime), todas as páginas
+    Retorna [] se a pasta não existe; levanta exceção em outros erros
+    """
+    cliente = cliente or cliente_padrao()
+    itens = []
+    url = f"{url_item}:/children"
+    params = {"$select": "name,eTag,size,lastModifiedDateTime,file", "$top": 200}
+    while url:
+        response = cliente.get(url, token=token, timeout=timeout, endpoint="listagem", params=params)
+        if response.status_code == 404:
+            return []
+        if response.status_code != 200:
+            raise RuntimeError(f"Erro ao listar pasta: {response.status_code}")
+        dados = response.json()
+        itens.extend(dados.get("value", []))
+        # O nextLink já traz os parâmetros da consulta
+        url, params = dados.get("@odata.nextLink"), None
+    return itens
+
+
+def _espera(tentativa):
+    """Backoff exponencial com jitter"""
+    espera = ESPERA_BASE_SEGUNDOS * (2 ** (tentativa - 1)) * (0.5 + random.random())
+    return min(espera, ESPERA_MAXIMA_SEGUNDOS)
+
+
+def _espera_retry_after(response):
+    """Segundos pedidos pelo servidor no cabeçalho Retry-After, se houver"""
+    valor = response.headers.get('Retry-After') if response is not None else None
+    if not valor:
+        return None
+    try:
+        return min(float(valor), ESPERA_MAXIMA_SEGUNDOS)
+    except ValueError:
+        pass
+    try:
+        data = parsedate_to_datetime(valor)
+        return min(max(data.timestamp() - time.time(), 0), ESPERA_MAXIMA_SEGUNDOS)
+    except (TypeError, ValueError):
+        return None
+
+
+def nome_endpoint(metodo, url):
+    """Nome curto do endpoint para as métricas (sem o caminho do arquivo)"""
+    if '/root:/' in url:
+        resto = url.split('/root:/', 1)[1]
+        acao = resto.rsplit(':/', 1)[1] if ':/' in resto else 'item'
+        return f"{metodo} {acao.split('?')[0]}"
+    return f"{metodo} sessao_upload"
+
+
+# ===========================
+# CLIENTE HTTP COMPARTILHADO
+# ===========================
+class ClienteGraph:
+    """Cliente HTTP do Graph com pool de conexões, novas tentativas e métricas"""
+
+    def __init__(self, max_simultaneas=MAX_REQUISICOES_SIMULTANEAS, max_tentativas=MAX_TENTATIVAS,
+                 tamanho_pool=TAMANHO_POOL):
+        self.max_tentativas = max_tentativas
+        self.sessao = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=tamanho_pool, max_retries=0)
+        self.sessao.mount('https://', adaptador)
+        self.sessao.mount('http://', adaptador)
+        self._semaforo = threading.BoundedSemaphore(max_simultaneas)
+        self._lock_metricas = threading.Lock()
+        self._metricas = {}
+
+    def _registrar(self, endpoint, segundos, erro):
+        with self._lock_metricas:
+            metrica = self._metricas.setdefault(endpoint, {'chamadas': 0, 'erros': 0, 'amostras': []})
+            metrica['chamadas'] += 1
+            if erro:
+                metrica['erros'] += 1
+            amostras = metrica['amostras']
+            amostras.append(segundos)
+            if len(amostras) > AMOSTRAS_LATENCIA:
+                del amostras[0]
+
+    def requisicao(self, metodo, url, token=None, headers=None, tentativas=None, endpoint=None, **kwargs):
+        """
+        Executa a requisição com novas tentativas para 429/5xx e falhas de conexão
+        Retorna a última resposta; levanta a exceção de rede se todas as tentativas falharem
+        """
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        endpoint = endpoint or nome_endpoint(metodo, url)
+        tentativas = tentativas or self.max_tentativas
+
+        for tentativa in range(1, tentativas + 1):
+            response = None
+            erro = None
+            inicio = time.perf_counter()
+            try:
+                with self._semaforo:
+                    response = self.sessao.request(metodo, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                erro = e
+            transitorio = erro is not None or response.status_code in STATUS_TRANSITORIOS
+            segundos = time.perf_counter() - inicio
+            self._registrar(endpoint, segundos, transitorio)
+            registrar_chamada(
+                endpoint, segundos, erro=erro, tentativa=tentativa,
+                status=response.status_code if response is not None else None,
+                bytes_enviados=len(kwargs['data']) if isinstance(kwargs.get('data'), bytes) else 0,
+                bytes_recebidos=len(response.content) if response is not None and not kwargs.get('stream') else 0,
+            )
+
+            if not transitorio or tentativa == tentativas:
+                break
+
+            espera = _espera_retry_after(response)
+            if espera is None:
+                espera = _espera(tentativa)
+            motivo = erro if erro is not None else response.status_code
+            logger.warning(f"{endpoint}: tentativa {tentativa} falhou ({motivo}); nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+        if response is None:
+            raise erro
+        return response
+
+    def get(self, url, **kwargs):
+        return self.requisicao('GET', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.requisicao('PUT', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.requisicao('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.requisicao('DELETE', url, **kwargs)
+
+    def estatisticas(self):
+        """Latência por endpoint: chamadas, erros, média, p95 e máximo em ms"""
+        with self._lock_metricas:
+            copia = {nome: dict(m, amostras=list(m['amostras'])) for nome, m in self._metricas.items()}
+
+        resultado = {}
+        for nome, metrica in sorted(copia.items()):
+            amostras = sorted(metrica['amostras'])
+            if not amostras:
+                continue
+            p95 = amostras[min(len(amostras) - 1, int(round(0.95 * (len(amostras) - 1))))]
+            resultado[nome] = {
+                'chamadas': metrica['chamadas'],
+                'erros': metrica['erros'],
+                'media_ms': 1000 * sum(amostras) / len(amostras),
+                'p95_ms': 1000 * p95,
+                'max_ms': 1000 * amostras[-1],
+            }
+        return resultado
+
+
+_cliente_padrao = None
+_lock_cliente = threading.Lock()
+
+
+def cliente_padrao():
+    """ClienteGraph único do processo (compartilhado entre sessões do Streamlit)"""
+    global _cliente_padrao
+    if _cliente_padrao is None:
+        with _lock_cliente:
+            if _cliente_padrao is None:
+                _cliente_padrao = ClienteGraph()
+    return _cliente_padrao
+
+
+def _json_ou_vazio(response):
+    """Corpo JSON da resposta; {} se não houver (o item gravado continua truthy)"""
+    try:
+        return response.json() or {'ok': True}
+    except ValueError:
+        return {'ok': True}
+
+
+def _inicio_esperado(dados_sessao):
+    """Primeiro byte ainda não recebido, a partir de nextExpectedRanges"""
+    intervalos = dados_sessao.get('nextExpectedRanges') or []
+    if not intervalos:
+        return None
+    return int(str(intervalos[0]).split('-')[0])
+
+
+# ===========================
+# SESSÃO DE UPLOAD
+# ===========================
+def criar_sessao_upload(url_item, token, timeout=30, cliente=None, if_match=None, somente_criar=False):
+    """
+    Cria uma sessão de upload que substitui o arquivo existente
+    Com if_match, a sessão só é aceita se o item ainda estiver nesse eTag;
+    com somente_criar, só se o item ainda não existir
+    """
+    cliente = cliente or cliente_padrao()
+    corpo = {"item": {"@microsoft.graph.conflictBehavior": "fail" if somente_criar else "replace"}}
+    response = cliente.post(f"{url_item}:/createUploadSession", token=token, json=corpo, timeout=timeout,
+                            headers=cabecalhos_condicionais(if_match))
+
+    if response.status_code in STATUS_CONFLITO:
+        raise ConflitoEtag(f"Item alterado desde a leitura ({response.status_code})")
+    if response.status_code != 200:
+        raise RuntimeError(f"Falha ao criar sessão de upload: {response.status_code} - {response.text}")
+    return response.json()["uploadUrl"]
+
+
+def consultar_sessao(upload_url, timeout=30, cliente=None):
+    """
+    Consulta o progresso de uma sessão
+    Retorna o próximo byte esperado, ou None se a sessão não existe mais
+    """
+    cliente = cliente or cliente_padrao()
+    response = cliente.get(upload_url, timeout=timeout)
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise RuntimeError(f"Falha ao consultar sessão de upload: {response.status_code}")
+    return _inicio_esperado(response.json())
+
+
+def cancelar_sessao(upload_url, timeout=10, cliente=None):
+    """Cancela uma sessão de upload (ignora falhas)"""
+    cliente = cliente or cliente_padrao()
+    try:
+        cliente.delete(upload_url, timeout=timeout, tentativas=1)
+    except requests.RequestException as e:
+        logger.warning(f"Não foi possível cancelar a sessão de upload: {e}")
+
+
+def enviar_em_sessao(url_item, token, conteudo, tamanho_fragmento=TAMANHO_FRAGMENTO,
+                     max_falhas=MAX_FALHAS_FRAGMENTO, timeout=60, cliente=None,
+                     if_match=None, somente_criar=False):
+    """
+    Envia o conteúdo em fragmentos por uma sessão de upload retomável
+    Retorna o item gravado (dict com eTag, size...) ou None em caso de falha
+    Levanta ConflitoEtag se a gravação condicional for recusada
+    """
+    cliente = cliente or cliente_padrao()
+    if tamanho_fragmento % TAMANHO_BASE_FRAGMENTO != 0:
+        raise ValueError("tamanho_fragmento deve ser múltiplo de 320 KiB")
+
+    total = len(conteudo)
+    chave = (url_item, hashlib.sha256(conteudo).hexdigest(), if_match, somente_criar)
+
+    with _lock_sessoes:
+        upload_url = _sessoes_abertas.get(chave)
+
+    inicio = 0
+    if upload_url is not None:
+        try:
+            inicio = consultar_sessao(upload_url, timeout=timeout, cliente=cliente)
+        except Exception as e:
+            logger.warning(f"Sessão anterior inacessível, criando nova: {e}")
+            inicio = None
+        if inicio is None:
+            upload_url = None
+        else:
+            logger.info(f"Retomando upload a partir do byte {inicio} de {total}")
+
+    if upload_url is None:
+        upload_url = criar_sessao_upload(url_item, token, timeout=timeout, cliente=cliente,
+                                         if_match=if_match, somente_criar=somente_criar)
+        inicio = 0
+
+    with _lock_sessoes:
+        _sessoes_abertas[chave] = upload_url
+
+    falhas = 0
+    while True:
+        fim = min(inicio + tamanho_fragmento, total) - 1
+        headers = {
+            "Content-Length": str(fim - inicio + 1),
+            "Content-Range": f"bytes {inicio}-{fim}/{total}"
+        }
+
+        # Uma tentativa por fragmento: a recuperação consulta a sessão antes de reenviar
+        response = None
+        try:
+            response = cliente.put(upload_url, headers=headers, data=conteudo[inicio:fim + 1],
+                                   timeout=timeout, tentativas=1)
+        except requests.RequestException as e:
+            logger.warning(f"Fragmento {inicio}-{fim} interrompido: {e}")
+
+        if response is not None and response.status_code in (200, 201):
+            with _lock_sessoes:
+                _sessoes_abertas.pop(chave, None)
+            return _json_ou_vazio(response)
+
+        if response is not None and response.status_code in STATUS_CONFLITO:
+            # O item mudou antes do último fragmento: a sessão não serve mais
+            with _lock_sessoes:
+                _sessoes_abertas.pop(chave, None)
+            cancelar_sessao(upload_url, timeout=timeout, cliente=cliente)
+            raise ConflitoEtag(f"Item alterado durante o upload ({response.status_code})")
+
+        if response is not None and response.status_code == 202:
+            proximo = _inicio_esperado(response.json())
+            inicio = proximo if proximo is not None else fim + 1
+            falhas = 0
+            continue
+
+        if response is not None:
+            logger.warning(f"Fragmento {inicio}-{fim} recusado: {response.status_code}")
+
+        falhas += 1
+        if falhas > max_falhas:
+            logger.error(f"Upload interrompido após {max_falhas} falhas seguidas; sessão mantida para retomada")
+            return None
+
+        time.sleep(_espera(falhas))
+
+        # Descobre o que o servidor realmente confirmou antes de retomar
+        try:
+            proximo = consultar_sessao(upload_url, timeout=timeout, cliente=cliente)
+        except Exception as e:
+            logger.warning(f"Falha ao consultar sessão: {e}")
+            continue
+
+        if proximo is None:
+            logger.warning("Sessão de upload expirada - reiniciando envio")
+            upload_url = criar_sessao_upload(url_item, token, timeout=timeout, cliente=cliente,
+                                             if_match=if_match, somente_criar=somente_criar)
+            with _lock_sessoes:
+                _sessoes_abertas[chave] = upload_url
+            inicio = 0
+        else:
+            inicio = proximo
+
+
+# ===========================
+# CÓPIA NO SERVIDOR
+# ===========================
+def iniciar_copia(url_item, token, drive_id, pasta_destino, nome_destino, timeout=30, cliente=None):
+    """
+    Pede ao Graph uma cópia do item para pasta_destino/nome_destino
+    Retorna a URL de monitoramento, ou None se a cópia não foi aceita
+    """
+    cliente = cliente or cliente_padrao()
+    corpo = {
+        "parentReference": {"driveId": drive_id, "path": f"/drives/{drive_id}/root:/{pasta_destino}"},
+        "name": nome_destino,
+    }
+    response = cliente.post(f"{url_item}:/copy", token=token, json=corpo, timeout=timeout,
+                            params={"@microsoft.graph.conflictBehavior": "rename"}, endpoint="POST copy")
+
+    monitor = response.headers.get("Location")
+    if response.status_code != 202 or not monitor:
+        logger.warning(f"Cópia no servidor não aceita: {response.status_code}")
+        return None
+    return monitor
+
+
+def aguardar_copia(url_monitor, espera_maxima=ESPERA_MAXIMA_COPIA_SEGUNDOS,
+                   intervalo=INTERVALO_MONITOR_SEGUNDOS, timeout=30, cliente=None):
+    """
+    Consulta a URL de monitoramento até a cópia terminar
+    Retorna o id do item criado (ou True se o Graph não informar), None se falhar ou expirar
+    """
+    cliente = cliente or cliente_padrao()
+    limite = time.monotonic() + espera_maxima
+
+    while True:
+        # A URL de monitoramento não aceita o token; o 303 final aponta para o item criado
+        response = cliente.get(url_monitor, timeout=timeout, allow_redirects=False, endpoint="GET monitor copia")
+
+        if response.status_code == 303:
+            return True
+        if response.status_code not in (200, 202):
+            logger.warning(f"Falha ao consultar cópia: {response.status_code}")
+            return None
+
+        dados = response.json()
+        status = dados.get("status")
+        if status == "completed":
+            return dados.get("resourceId") or True
+        if status == "failed":
+            logger.warning(f"Cópia no servidor falhou: {dados.get('error')}")
+            return None
+
+        if time.monotonic() >= limite:
+            logger.warning(f"Cópia no servidor não concluída em {espera_maxima}s (status {status})")
+            return None
+        time.sleep(intervalo)
+        intervalo = min(intervalo * 2, 5)
+
+
+def copiar_item(url_item, token, drive_id, pasta_destino, nome_destino,
+                espera_maxima=ESPERA_MAXIMA_COPIA_SEGUNDOS, cliente=None):
+    """Cópia no servidor concluída; retorna o id do item criado (ou True) ou None"""
+    try:
+        monitor = iniciar_copia(url_item, token, drive_id, pasta_destino, nome_destino, cliente=cliente)
+        if monitor is None:
+            return None
+        return aguardar_copia(monitor, espera_maxima=espera_maxima, cliente=cliente)
+    except Exception as e:
+        logger.warning(f"Cópia no servidor indisponível: {e}")
+        return None
@@ -0,0 +1,415 @@
+"""
+Servidor HTTP local que imita o subconjunto do Microsoft Graph usado pela
+aplicação, para testes e benchmarks sem rede.
+
+Rotas suportadas (prefixo /v1.0/sites/<site>/drives/<drive>/root:/<caminho>):
+    GET    ...                       metadados (eTag, cTag, size)
+    GET    ...:/content              download (aceita If-None-Match)
+    GET    ...:/children             itens da pasta (paginados por $top/$skiptoken)
+    PUT    ...:/content              upload simples
+    DELETE ...                       remoção
+    POST   ...:/createUploadSession  sessão de upload
+    POST   ...:/copy                 cópia assíncrona (202 + Location)
+    GET/PUT/DELETE /sessoes/<id>     status, fragmento e cancelamento da sessão
+    GET    /monitor/<id>             progresso da cópia
+
+prob_queda simula conexões derrubadas durante fragmentos: metade das quedas
+acontece antes de gravar o fragmento e metade depois (o cliente não recebe a
+confirmação e precisa consultar a sessão para saber onde retomar).
+
+Uma cópia fica "inProgress" nas primeiras consultas_copia consultas ao
+monitor e é gravada no destino quando passa a "completed". Com
+copia_disponivel=False o servidor responde 501, como um drive sem suporte.
+
+Uploads aceitam If-Match (412 se o eTag mudou) e conflictBehavior=fail (409
+se o item já existe); uma sessão criada com If-Match também é recusada no
+último fragmento se o item mudou nesse meio tempo.
+
+Uso:
+    simulador = SimuladorGraph(prob_queda=0.2)
+    base_url = simulador.iniciar()
+    ...
+    simulador.parar()
+"""
+import json
+import random
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+PADRAO_ITEM = re.compile(r'^/v1\.0/sites/[^/]+/drives/[^/]+/root:/(?P<caminho>.+?)(?::/(?P<acao>content|children|createUploadSession|copy))?$')
+PADRAO_SESSAO = re.compile(r'^/sessoes/(?P<id>[0-9a-f]+)$')
+PADRAO_MONITOR = re.compile(r'^/monitor/(?P<id>[0-9a-f]+)$')
+PADRAO_DESTINO = re.compile(r'^/drives?/[^/]+/root:/(?P<pasta>.*)$')
+
+
+class SimuladorGraph:
+    """Estado do drive simulado e servidor HTTP associado"""
+
+    def __init__(self, prob_queda=0.0, seed=0, copia_disponivel=True, consultas_copia=1):
+        self.prob_queda = prob_queda
+        self.copia_disponivel = copia_disponivel
+        self.consultas_copia = consultas_copia
+        self.aleatorio = random.Random(seed)
+        self.arquivos = {}
+        self.metadados = {}
+        self.sessoes = {}
+        self.copias = {}
+        self.contadores = {'requisicoes': 0, 'quedas': 0, 'fragmentos': 0, 'uploads_simples': 0, 'copias': 0,
+                           'conflitos': 0}
+        self.lock = threading.Lock()
+        self.servidor = None
+        self.thread = None
+
+    # ---------------------------
+    # Ciclo de vida
+    # ---------------------------
+    def iniciar(self, host='127.0.0.1', porta=0):
+        """Inicia o servidor em uma thread e retorna a URL base (equivalente a GRAPH_URL)"""
+        simulador = self
+
+        class Handler(_HandlerGraph):
+            pass
+        Handler.simulador = simulador
+
+        self.servidor = ThreadingHTTPServer((host, porta), Handler)
+        self.servidor.daemon_threads = True
+        self.thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+        self.thread.start()
+        return f"{self.url_servidor}/v1.0"
+
+    def parar(self):
+        if self.servidor is not None:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+            self.servidor = None
+
+    @property
+    def url_servidor(self):
+        host, porta = self.servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def __enter__(self):
+        self.iniciar()
+        return self
+
+    def __exit__(self, *args):
+        self.parar()
+
+    # ---------------------------
+    # Drive
+    # ---------------------------
+    def gravar(self, caminho, conteudo):
+        """Grava um arquivo e gera novo eTag; retorna os metadados do item"""
+        with self.lock:
+            anterior = self.metadados.get(caminho)
+            versao = anterior['versao'] + 1 if anterior else 1
+            id_item = anterior['id'] if anterior else uuid.uuid4().hex.upper()
+            self.arquivos[caminho] = bytes(conteudo)
+            self.metadados[caminho] = {
+                'id': id_item,
+                'versao': versao,
+                'eTag': f'"{{{id_item}}},{versao}"',
+                'cTag': f'"c:{{{id_item}}},{versao}"',
+                'lastModifiedDateTime': datetime.now(timezone.utc).isoformat(),
+            }
+            return self.item(caminho)
+
+    def item(self, caminho):
+        """Representação JSON do item, como o Graph devolve"""
+        meta = self.metadados.get(caminho)
+        if meta is None or caminho not in self.arquivos:
+            return None
+        return {
+            'id': meta['id'],
+            'name': caminho.rsplit('/', 1)[-1],
+            'size': len(self.arquivos[caminho]),
+            'eTag': meta['eTag'],
+            'cTag': meta['cTag'],
+            'lastModifiedDateTime': meta['lastModifiedDateTime'],
+        }
+
+    def conflito(self, caminho, if_match, somente_criar=False):
+        """Status 412/409 se a gravação condicional deve ser recusada, senão None"""
+        item = self.item(caminho)
+        status = None
+        if somente_criar and item is not None:
+            status = 409
+        elif if_match and if_match != '*' and (item is None or if_match not in (item['eTag'], item['cTag'])):
+            status = 412
+        if status is not None:
+            with self.lock:
+                self.contadores['conflitos'] += 1
+        return status
+
+    def filhos(self, pasta):
+        """Itens diretamente dentro da pasta (subpastas como itens folder), ordenados pelo nome"""
+        prefixo = pasta.rstrip('/') + '/'
+        with self.lock:
+            caminhos = [c for c in self.arquivos if c.startswith(prefixo)]
+        arquivos, subpastas = [], set()
+        for caminho in caminhos:
+            resto = caminho[len(prefixo):]
+            if '/' in resto:
+                subpastas.add(resto.split('/', 1)[0])
+            else:
+                item = self.item(caminho)
+                if item is not None:
+                    arquivos.append(dict(item, file={}))
+        itens = arquivos + [{'name': nome, 'folder': {}} for nome in subpastas]
+        return sorted(itens, key=lambda item: item['name'])
+
+    def remover(self, caminho):
+        with self.lock:
+            self.metadados.pop(caminho, None)
+            return self.arquivos.pop(caminho, None) is not None
+
+    # ---------------------------
+    # Falhas simuladas
+    # ---------------------------
+    def sortear_queda(self):
+        """Retorna None, 'antes' ou 'depois' conforme prob_queda"""
+        with self.lock:
+            if self.aleatorio.random() >= self.prob_queda:
+                return None
+            self.contadores['quedas'] += 1
+            return 'antes' if self.aleatorio.random() < 0.5 else 'depois'
+
+
+class _HandlerGraph(BaseHTTPRequestHandler):
+    simulador = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    # ---------------------------
+    # Utilitários
+    # ---------------------------
+    def _corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(tamanho) if tamanho else b''
+
+    def _responder(self, status, corpo=None, tipo='application/json'):
+        if isinstance(corpo, (dict, list)):
+            corpo = json.dumps(corpo).encode('utf-8')
+        corpo = corpo or b''
+        self.send_response(status)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _derrubar(self):
+        """Fecha a conexão sem responder"""
+        self.close_connection = True
+        try:
+            self.connection.shutdown(2)
+        except OSError:
+            pass
+
+    def _rota(self):
+        with self.simulador.lock:
+            self.simulador.contadores['requisicoes'] += 1
+        caminho = urlsplit(self.path).path
+        item = PADRAO_ITEM.match(caminho)
+        if item:
+            return 'item', unquote(item.group('caminho')), item.group('acao')
+        sessao = PADRAO_SESSAO.match(caminho)
+        if sessao:
+            return 'sessao', sessao.group('id'), None
+        monitor = PADRAO_MONITOR.match(caminho)
+        if monitor:
+            return 'monitor', monitor.group('id'), None
+        return None, None, None
+
+    # ---------------------------
+    # Métodos HTTP
+    # ---------------------------
+    def do_GET(self):
+        tipo, alvo, acao = self._rota()
+        sim = self.simulador
+
+        if tipo == 'item' and acao == 'content':
+            item = sim.item(alvo)
+            if item is None:
+                return self._responder(404, {'error': {'code': 'itemNotFound'}})
+            if self.headers.get('If-None-Match') in (item['eTag'], item['cTag']):
+                return self._responder(304)
+            return self._responder(200, sim.arquivos[alvo], 'application/octet-stream')
+
+        if tipo == 'item' and acao == 'children':
+            return self._listar(alvo)
+
+        if tipo == 'item' and acao is None:
+            item = sim.item(alvo)
+            if item is None:
+                return self._responder(404, {'error': {'code': 'itemNotFound'}})
+            return self._responder(200, item)
+
+        if tipo == 'sessao':
+            sessao = sim.sessoes.get(alvo)
+            if sessao is None:
+                return self._responder(404, {'error': {'code': 'itemNotFound'}})
+            return self._responder(200, {'nextExpectedRanges': [f"{len(sessao['dados'])}-"]})
+
+        if tipo == 'monitor':
+            return self._monitor(alvo)
+
+        self._responder(404, {'error': {'code': 'invalidRequest'}})
+
+    def _listar(self, pasta):
+        itens = self.simulador.filhos(pasta)
+        if not itens:
+            return self._responder(404, {'error': {'code': 'itemNotFound'}})
+        consulta = parse_qs(urlsplit(self.path).query)
+        tamanho = int(consulta.get('$top', ['200'])[0])
+        inicio = int(consulta.get('$skiptoken', ['0'])[0])
+        pagina = {'value': itens[inicio:inicio + tamanho]}
+        if inicio + tamanho < len(itens):
+            base = self.path.split('?', 1)[0]
+            pagina['@odata.nextLink'] = f"{self.simulador.url_servidor}{base}?$top={tamanho}&$skiptoken={inicio + tamanho}"
+        return self._responder(200, pagina)
+
+    def _monitor(self, id_copia):
+        sim = self.simulador
+        with sim.lock:
+            copia = sim.copias.get(id_copia)
+            if copia is None:
+                return self._responder(404, {'error': {'code': 'itemNotFound'}})
+            copia['consultas'] += 1
+            concluida = copia['consultas'] > sim.consultas_copia
+        if not concluida:
+            return self._responder(202, {'status': 'inProgress', 'percentageComplete': 50.0})
+        if 'item' not in copia:
+            copia['item'] = sim.gravar(copia['destino'], copia['dados'])
+            with sim.lock:
+                sim.contadores['copias'] += 1
+        item = copia['item']
+        return self._responder(200, {'status': 'completed', 'percentageComplete': 100.0, 'resourceId': item['id']})
+
+    def do_PUT(self):
+        tipo, alvo, acao = self._rota()
+        sim = self.simulador
+
+        if tipo == 'item' and acao == 'content':
+            corpo = self._corpo()
+            consulta = parse_qs(urlsplit(self.path).query)
+            somente_criar = consulta.get('@microsoft.graph.conflictBehavior') == ['fail']
+            status = sim.conflito(alvo, self.headers.get('If-Match'), somente_criar)
+            if status is not None:
+                return self._responder(status, {'error': {'code': 'preconditionFailed' if status == 412 else 'nameAlreadyExists'}})
+            item = sim.gravar(alvo, corpo)
+            with sim.lock:
+                sim.contadores['uploads_simples'] += 1
+            return self._responder(201, item)
+
+        if tipo == 'sessao':
+            return self._fragmento(alvo)
+
+        self._responder(404, {'error': {'code': 'invalidRequest'}})
+
+    def _fragmento(self, id_sessao):
+        sim = self.simulador
+        corpo = self._corpo()
+        sessao = sim.sessoes.get(id_sessao)
+        if sessao is None:
+            return self._responder(404, {'error': {'code': 'itemNotFound'}})
+
+        faixa = re.match(r'bytes (\d+)-(\d+)/(\d+)', self.headers.get('Content-Range', ''))
+        if not faixa:
+            return self._responder(400, {'error': {'code': 'invalidRange'}})
+        inicio, fim, total = (int(v) for v in faixa.groups())
+
+        queda = sim.sortear_queda()
+        if queda == 'antes':
+            return self._derrubar()
+
+        with sim.lock:
+            if inicio != len(sessao['dados']) or fim - inicio + 1 != len(corpo):
+                esperado = len(sessao['dados'])
+                return self._responder(416, {'nextExpectedRanges': [f"{esperado}-"]})
+            sessao['dados'] += corpo
+            sim.contadores['fragmentos'] += 1
+            concluido = len(sessao['dados']) == total
+            if concluido:
+                del sim.sessoes[id_sessao]
+
+        if concluido:
+            status = sim.conflito(sessao['caminho'], sessao['if_match'], sessao['somente_criar'])
+            if status is not None:
+                return self._responder(status, {'error': {'code': 'preconditionFailed'}})
+            item = sim.gravar(sessao['caminho'], sessao['dados'])
+
+        if queda == 'depois':
+            return self._derrubar()
+
+        if concluido:
+            return self._responder(201, item)
+        return self._responder(202, {'nextExpectedRanges': [f"{len(sessao['dados'])}-"]})
+
+    def do_POST(self):
+        tipo, alvo, acao = self._rota()
+        corpo = self._corpo()
+        sim = self.simulador
+
+        if tipo == 'item' and acao == 'copy':
+            return self._copiar(alvo, corpo)
+
+        if tipo == 'item' and acao == 'createUploadSession':
+            pedido = json.loads(corpo or b'{}')
+            somente_criar = (pedido.get('item') or {}).get('@microsoft.graph.conflictBehavior') == 'fail'
+            if_match = self.headers.get('If-Match')
+            status = sim.conflito(alvo, if_match, somente_criar)
+            if status is not None:
+                return self._responder(status, {'error': {'code': 'preconditionFailed'}})
+            id_sessao = uuid.uuid4().hex
+            with sim.lock:
+                sim.sessoes[id_sessao] = {'caminho': alvo, 'dados': bytearray(),
+                                          'if_match': if_match, 'somente_criar': somente_criar}
+            return self._responder(200, {'uploadUrl': f"{sim.url_servidor}/sessoes/{id_sessao}"})
+
+        self._responder(404, {'error': {'code': 'invalidRequest'}})
+
+    def _copiar(self, origem, corpo):
+        sim = self.simulador
+        if not sim.copia_disponivel:
+            return self._responder(501, {'error': {'code': 'notSupported'}})
+        if sim.item(origem) is None:
+            return self._responder(404, {'error': {'code': 'itemNotFound'}})
+
+        pedido = json.loads(corpo or b'{}')
+        destino = PADRAO_DESTINO.match(unquote((pedido.get('parentReference') or {}).get('path', '')))
+        if destino is None or not pedido.get('name'):
+            return self._responder(400, {'error': {'code': 'invalidRequest'}})
+
+        # O conteúdo é o da origem no momento do pedido
+        id_copia = uuid.uuid4().hex
+        with sim.lock:
+            sim.copias[id_copia] = {
+                'destino': f"{destino.group('pasta').rstrip('/')}/{pedido['name']}",
+                'dados': sim.arquivos[origem],
+                'consultas': 0,
+            }
+        self.send_response(202)
+        self.send_header('Location', f"{sim.url_servidor}/monitor/{id_copia}")
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_DELETE(self):
+        tipo, alvo, acao = self._rota()
+        sim = self.simulador
+
+        if tipo == 'sessao':
+            sim.sessoes.pop(alvo, None)
+            return self._responder(204)
+
+        if tipo == 'item' and acao is None:
+            if not sim.remover(alvo):
+                return self._responder(404, {'error': {'code': 'itemNotFound'}})
+            return self._responder(204)
+
+        self._responder(404, {'error': {'code': 'invalidRequest'}})
@@ -0,0 +1,195 @@
+"""
+Histórico de backups do consolidado: deltas por loja/mês e snapshots completos.
+
+Layout, na pasta de backups:
+    historico/SNAPSHOT_bonificacao_<AAAAMMDD_HHMMSS_ffffff>_<versão>.xlsx
+    historico/DELTA_bonificacao_<AAAAMMDD_HHMMSS_ffffff>_<antes>_<depois>.parquet
+
+Cada consolidação grava um delta: as linhas das lojas/meses que ela
+substituiu, como ficaram depois da gravação, em Parquet. O backup de uma
+consolidação custa o tamanho da mudança, e não o do consolidado.
+
+Um snapshot é o consolidado inteiro como estava no horário do nome (antes
+da consolidação daquele horário). Ele é gravado quando os deltas não
+continuam a versão lida (primeira vez, consolidado alterado por fora, delta
+que não foi gravado) e periodicamente: a cada max_deltas deltas, depois de
+intervalo_snapshot, ou quando os deltas desde o último snapshot já somam o
+tamanho dele. Assim uma restauração nunca reaplica deltas demais.
+
+<antes>, <depois> e <versão> identificam versões do consolidado (um hash
+curto do eTag). O consolidado em um horário qualquer é o último snapshot
+até aquele horário mais os deltas seguintes, em ordem; a sequência só é
+aceita se cada delta partir da versão em que o anterior terminou.
+"""
+import hashlib
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+import pandas as pd
+
+from bonificacao.excel import ler_planilha
+from bonificacao.motor import consolidar_lote
+from bonificacao.particoes import ler_parquet
+
+logger = logging.getLogger(__name__)
+
+PASTA_HISTORICO = "historico"
+PREFIXO_SNAPSHOT = "SNAPSHOT_bonificacao_"
+PREFIXO_DELTA = "DELTA_bonificacao_"
+FORMATO_HORARIO = "%Y%m%d_%H%M%S_%f"
+# Versão "antes" de um delta que criou o consolidado, e de um consolidado sem eTag conhecido
+VERSAO_VAZIA = "vazio"
+VERSAO_DESCONHECIDA = "desconhecida"
+
+MAX_DELTAS_POR_SNAPSHOT = 50
+INTERVALO_SNAPSHOT = timedelta(days=1)
+MAX_TRANSFERENCIAS_PARALELAS = 8
+
+PADRAO_NOME = re.compile(
+    r'^(?P<tipo>SNAPSHOT|DELTA)_bonificacao_(?P<horario>\d{8}_\d{6}_\d{6})_'
+    r'(?P<antes>[0-9a-z]+)(?:_(?P<depois>[0-9a-z]+))?\.(?:xlsx|parquet)$'
+)
+
+
+def fim_do_minuto(horario):
+    """Último instante do minuto de horario: um horário escolhido até o minuto inclui os backups dentro dele"""
+    return horario.replace(second=59, microsecond=999999)
+
+
+def versao_consolidado(etag):
+    """Identificador curto da versão do consolidado a partir do eTag"""
+    if not etag:
+        return VERSAO_DESCONHECIDA
+    return hashlib.sha1(etag.encode('utf-8')).hexdigest()[:12]
+
+
+def nome_snapshot(horario, versao):
+    return f"{PREFIXO_SNAPSHOT}{horario.strftime(FORMATO_HORARIO)}_{versao}.xlsx"
+
+
+def nome_delta(horario, antes, depois):
+    return f"{PREFIXO_DELTA}{horario.strftime(FORMATO_HORARIO)}_{antes}_{depois}.parquet"
+
+
+def interpretar(nome, tamanho=None):
+    """Entrada do histórico a partir do nome do arquivo, ou None se não for do histórico"""
+    encontrado = PADRAO_NOME.match(nome)
+    if not encontrado or (encontrado['tipo'] == 'DELTA') != (encontrado['depois'] is not None):
+        return None
+    entrada = {
+        'nome': nome,
+        'tipo': encontrado['tipo'].lower(),
+        'horario': datetime.strptime(encontrado['horario'], FORMATO_HORARIO),
+        'antes': encontrado['antes'],
+        'tamanho': tamanho,
+    }
+    # Um snapshot é uma versão só: a sequência começa e termina nela
+    entrada['depois'] = encontrado['depois'] or encontrado['antes']
+    return entrada
+
+
+def precisa_snapshot(cabeca, agora, max_deltas=MAX_DELTAS_POR_SNAPSHOT, intervalo=INTERVALO_SNAPSHOT):
+    """
+    A próxima consolidação deve gravar um snapshot antes do delta?
+    cabeca: situação do histórico na versão lida (HistoricoConsolidado.cabeca),
+    ou None se os deltas não chegam a ela
+    """
+    if cabeca is None:
+        return True
+    return (cabeca['deltas'] >= max_deltas
+            or agora - cabeca['inicio_em'] >= intervalo
+            or (cabeca['tamanho_base'] is not None and cabeca['tamanho_deltas'] >= cabeca['tamanho_base']))
+
+
+class HistoricoConsolidado:
+    """
+    Histórico de snapshots e deltas na pasta de backups
+    listar() retorna os itens da pasta (name e size, como no Graph);
+    ler_bytes(nome) retorna o conteúdo, ou None se o arquivo não existe
+    """
+
+    def __init__(self, listar, ler_bytes, max_paralelo=MAX_TRANSFERENCIAS_PARALELAS):
+        self.listar = listar
+        self.ler_bytes = ler_bytes
+        self.max_paralelo = max_paralelo
+
+    def entradas(self):
+        """Snapshots e deltas em ordem de horário (o snapshot antes do delta do mesmo horário)"""
+        entradas = [interpretar(item['name'], item.get('size')) for item in self.listar()]
+        return sorted((e for e in entradas if e is not None),
+                      key=lambda e: (e['horario'], e['tipo'] != 'snapshot'))
+
+    def sequencia(self, ate=None, entradas=None):
+        """
+        Snapshot de partida (None se a sequência parte do consolidado vazio) e deltas
+        que reconstroem o consolidado no horário ate (padrão: a versão mais recente)
+        Levanta ValueError se o histórico não cobre o horário
+        """
+        entradas = self.entradas() if entradas is None else entradas
+        entradas = [e for e in entradas if ate is None or e['horario'] <= ate]
+        inicios = [posicao for posicao, e in enumerate(entradas)
+                   if e['tipo'] == 'snapshot' or e['antes'] == VERSAO_VAZIA]
+        if not inicios:
+            raise ValueError(f"Nenhum backup no histórico até {ate or 'agora'}")
+
+        base = entradas[inicios[-1]]
+        deltas = []
+        versao = base['depois'] if base['tipo'] == 'snapshot' else VERSAO_VAZIA
+        for entrada in entradas[inicios[-1]:]:
+            if entrada['tipo'] == 'snapshot':
+                continue
+            if entrada['antes'] != versao:
+                raise ValueError(f"Histórico incompleto: {entrada['nome']} não continua a versão {versao}")
+            deltas.append(entrada)
+            versao = entrada['depois']
+        return (base if base['tipo'] == 'snapshot' else None), deltas
+
+    def cabeca(self):
+        """
+        Situação da sequência mais recente: versão final, deltas e bytes desde o
+        início, horário e tamanho do snapshot de partida; None se não houver
+        """
+        try:
+            base, deltas = self.sequencia()
+        except ValueError as e:
+            logger.info(f"Histórico sem sequência válida: {e}")
+            return None
+        inicio = base or deltas[0]
+        return {
+            'versao': deltas[-1]['depois'] if deltas else base['depois'],
+            'deltas': len(deltas),
+            'tamanho_deltas': sum(d['tamanho'] or 0 for d in deltas),
+            'tamanho_base': base['tamanho'] if base else None,
+            'inicio_em': inicio['horario'],
+        }
+
+    def _ler(self, nome):
+        conteudo = self.ler_bytes(nome)
+        if conteudo is None:
+            raise RuntimeError(f"Backup não encontrado: {nome}")
+        return conteudo
+
+    def reconstruir(self, ate=None):
+        """
+        Consolidado no horário ate (padrão: a versão mais recente do histórico)
+        Retorna: (df, entradas usadas, do snapshot ao último delta)
+        """
+        base, deltas = self.sequencia(ate)
+        with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+            frames = list(executor.map(lambda delta: ler_parquet(self._ler(delta['nome'])), deltas))
+
+        if base is not None:
+            df = ler_planilha(BytesIO(self._ler(base['nome'])), "Dados")
+            df['DATA'] = pd.to_datetime(df['DATA'])
+        else:
+            df = pd.DataFrame()
+        if frames:
+            df, _ = consolidar_lote(df, frames)
+
+        usadas = ([base] if base is not None else []) + deltas
+        logger.info(f"Consolidado reconstruído em {ate or 'agora'}: {len(df)} linhas, "
+                    f"{len(deltas)} delta(s) sobre {base['nome'] if base else 'o consolidado vazio'}")
+        return df, usadas
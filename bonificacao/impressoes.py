@@ -0,0 +1,207 @@
+"""
+Impressões digitais do conteúdo por linha e por LOJA + MES_ANO.
+
+A impressão de uma linha é um hash das colunas de negócio, sem
+DATA_ULTIMO_ENVIO e MES_ANO (que mudam a cada envio sem mudar os dados).
+Os valores são comparados pelo texto canônico, e não pelo tipo em memória:
+o consolidado compacto (categorias, float32, string Arrow) e a planilha
+recém-lida (object, float64) dão a mesma impressão para os mesmos dados.
+Colunas extras (fora de COLUNAS_OBRIGATORIAS) só contam onde estão
+preenchidas, então uma coluna ausente e uma coluna vazia são iguais.
+
+A impressão de uma loja/mês é o hash das impressões ordenadas das suas
+linhas: a mesma loja/mês reenviada com as linhas em outra ordem continua
+igual. Uma loja/mês reenviada sem mudanças não precisa ser regravada, e um
+envio em que nenhuma muda não precisa de gravação alguma.
+"""
+import hashlib
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from bonificacao.esquema import COLUNA_ULTIMO_ENVIO, COLUNAS_OBRIGATORIAS
+from bonificacao.motor import (COLUNAS_CHAVE, chaves_lojas_meses, indice_lojas_meses, mascara_lojas_meses,
+                               unir_chaves)
+from bonificacao.particoes import chave_particao
+
+COLUNAS_IGNORADAS = {COLUNA_ULTIMO_ENVIO, 'MES_ANO'}
+# Linhas com a mesma identidade e conteúdo diferente contam como alteradas na comparação
+COLUNAS_IDENTIDADE = ['NOME', 'FUNÇÃO', 'DATA']
+CASAS_DECIMAIS = 6
+
+
+def _texto_canonico(valor):
+    """Texto que representa o valor independente do tipo em que foi lido"""
+    if valor is None or valor is pd.NaT or (isinstance(valor, float) and np.isnan(valor)):
+        return ''
+    if isinstance(valor, (bool, np.bool_)):
+        return str(bool(valor))
+    if isinstance(valor, (int, float, np.integer, np.floating)):
+        numero = round(float(valor), CASAS_DECIMAIS)
+        return str(int(numero)) if numero.is_integer() else repr(numero)
+    if isinstance(valor, (datetime, date)):
+        return pd.Timestamp(valor).isoformat()
+    return str(valor).strip()
+
+
+def _coluna_canonica(serie):
+    """Texto canônico de cada valor; cada valor distinto é convertido uma vez só"""
+    codigos, unicos = pd.factorize(serie)
+    textos = np.array([_texto_canonico(valor) for valor in unicos] + [''], dtype=object)
+    # Código -1 (vazio) aponta para o '' acrescentado no fim
+    return textos[codigos]
+
+
+def _chave_hash(coluna):
+    return hashlib.md5(coluna.encode('utf-8')).hexdigest()[:16]
+
+
+def impressoes_linhas(df):
+    """Impressão (uint64) de cada linha sobre as colunas de negócio"""
+    if len(df) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    vazia = np.full(len(df), '', dtype=object)
+    obrigatorias = pd.DataFrame({
+        coluna: _coluna_canonica(df[coluna]) if coluna in df.columns else vazia
+        for coluna in COLUNAS_OBRIGATORIAS
+    })
+    impressoes = pd.util.hash_pandas_object(obrigatorias, index=False).to_numpy()
+
+    # Extras entram por XOR só onde preenchidas: a ordem das colunas não importa
+    for coluna in df.columns:
+        if coluna in COLUNAS_IGNORADAS or coluna in obrigatorias.columns:
+            continue
+        textos = _coluna_canonica(df[coluna])
+        hashes = pd.util.hash_array(textos, hash_key=_chave_hash(str(coluna)))
+        impressoes = impressoes ^ np.where(textos == '', np.uint64(0), hashes)
+    return impressoes
+
+
+def _impressoes_por_loja_mes(df):
+    """{(loja, mes_ano): impressão} com a LOJA como está em df (LOJA nula é ignorada)"""
+    if len(df) == 0:
+        return {}
+    indice = indice_lojas_meses(df)
+    validas = np.asarray(pd.notna(indice.get_level_values('LOJA')))
+    indice = indice[validas]
+    linhas = impressoes_linhas(df)[validas]
+    if len(indice) == 0:
+        return {}
+
+    codigos, chaves = indice.factorize()
+    ordem = np.lexsort((linhas, codigos))
+    inicios = np.r_[0, np.flatnonzero(np.diff(codigos[ordem])) + 1]
+    blocos = np.split(linhas[ordem], inicios[1:])
+    return {
+        chaves[codigos[ordem][inicio]]: hashlib.sha1(bloco.tobytes()).hexdigest()[:20]
+        for inicio, bloco in zip(inicios, blocos)
+    }
+
+
+def impressoes_particoes(df):
+    """{chave_particao: impressão} de cada LOJA + MES_ANO de df (LOJA nula é ignorada)"""
+    return {chave_particao(loja, mes): impressao for (loja, mes), impressao in _impressoes_por_loja_mes(df).items()}
+
+
+def remover_inalteradas(frames, atuais):
+    """
+    Tira de cada frame (na ordem) as lojas/meses com a mesma impressão do estado atual
+    atuais: {chave_particao: impressão} antes do primeiro frame; um frame
+    posterior do lote é comparado com o que os anteriores deixaram
+    Retorna (frames, inalterados): frames sem essas linhas e quantas linhas cada um perdeu
+    """
+    atuais = dict(atuais)
+    filtrados = []
+    inalterados = []
+    for df in frames:
+        iguais = []
+        for (loja, mes), impressao in _impressoes_por_loja_mes(df).items():
+            chave = chave_particao(loja, mes)
+            if atuais.get(chave) == impressao:
+                iguais.append((loja, mes))
+            atuais[chave] = impressao
+        if not iguais:
+            filtrados.append(df)
+            inalterados.append(0)
+            continue
+        manter = ~mascara_lojas_meses(df, pd.MultiIndex.from_tuples(iguais, names=COLUNAS_CHAVE))
+        filtrados.append(df[manter])
+        inalterados.append(int((~manter).sum()))
+    return filtrados, inalterados
+
+
+def separar_inalteradas(df_consolidado, frames):
+    """
+    Tira dos frames as lojas/meses idênticas ao consolidado (ou ao frame anterior do lote)
+    Só as linhas do consolidado nas lojas/meses enviadas são comparadas
+    Retorna (frames, inalterados) como remover_inalteradas
+    """
+    if len(df_consolidado) == 0:
+        return remover_inalteradas(frames, {})
+    chaves = unir_chaves([chaves_lojas_meses(df) for df in frames])
+    atuais = df_consolidado[mascara_lojas_meses(df_consolidado, chaves)]
+    return remover_inalteradas(frames, impressoes_particoes(atuais))
+
+
+# ===========================
+# COMPARAÇÃO PARA A PRÉVIA
+# ===========================
+def _linhas_comparacao(df):
+    """Chave da loja/mês, impressão do conteúdo e da identidade de cada linha"""
+    if len(df) == 0:
+        return pd.DataFrame({'LOJA': [], 'MES_ANO': [], 'conteudo': [], 'identidade': []})
+    indice = indice_lojas_meses(df)
+    identidade = pd.DataFrame({
+        coluna: _coluna_canonica(df[coluna]) if coluna in df.columns else np.full(len(df), '', dtype=object)
+        for coluna in COLUNAS_IDENTIDADE
+    })
+    tabela = pd.DataFrame({
+        'LOJA': np.asarray(indice.get_level_values('LOJA'), dtype=object),
+        'MES_ANO': np.asarray(indice.get_level_values('MES_ANO'), dtype=object),
+        'conteudo': impressoes_linhas(df),
+        'identidade': pd.util.hash_pandas_object(identidade, index=False).to_numpy(),
+    })
+    return tabela[pd.notna(tabela['LOJA'])]
+
+
+def _excedentes(de, menos):
+    """Linhas de 'de' sem par de mesmo conteúdo em 'menos', por loja/mês e identidade"""
+    chaves = ['LOJA', 'MES_ANO', 'conteudo', 'identidade']
+    contagem = de.groupby(chaves, sort=False).size()
+    outra = menos.groupby(chaves, sort=False).size()
+    sobra = (contagem - outra.reindex(contagem.index, fill_value=0)).clip(lower=0)
+    return sobra[sobra > 0].groupby(level=['LOJA', 'MES_ANO', 'identidade'], sort=False).sum()
+
+
+def comparar_particoes(df_atual, df_novo):
+    """
+    Diferença linha a linha, por loja/mês de df_novo, em relação a df_atual
+    Alteradas: linhas com a mesma identidade (NOME, FUNÇÃO, DATA) e outro conteúdo
+    Retorna um DataFrame com LOJA, MES_ANO, Antes, Depois, Inseridas,
+    Removidas, Alteradas e Situação
+    """
+    novas = _linhas_comparacao(df_novo)
+    chaves = chaves_lojas_meses(df_novo)
+    anteriores = _linhas_comparacao(df_atual[mascara_lojas_meses(df_atual, chaves)] if len(df_atual) else df_atual)
+
+    removidas = _excedentes(anteriores, novas)
+    inseridas = _excedentes(novas, anteriores)
+    pares = pd.concat([removidas.rename('removidas'), inseridas.rename('inseridas')], axis=1).fillna(0)
+    pares['alteradas'] = pares[['removidas', 'inseridas']].min(axis=1)
+    por_particao = pares.groupby(level=['LOJA', 'MES_ANO'], sort=False).sum()
+
+    resultado = pd.DataFrame({
+        'Antes': anteriores.groupby(['LOJA', 'MES_ANO'], sort=False).size(),
+        'Depois': novas.groupby(['LOJA', 'MES_ANO'], sort=False).size(),
+    }).join(por_particao, how='left').fillna(0)
+    resultado = resultado[resultado['Depois'] > 0].astype(int)
+    resultado['Inseridas'] = resultado['inseridas'] - resultado['alteradas']
+    resultado['Removidas'] = resultado['removidas'] - resultado['alteradas']
+    resultado['Alteradas'] = resultado['alteradas']
+    resultado['Situação'] = np.select(
+        [resultado['Antes'] == 0, resultado[['Inseridas', 'Removidas', 'Alteradas']].sum(axis=1) == 0],
+        ['nova', 'sem alteração'], 'alterada'
+    )
+    colunas = ['Antes', 'Depois', 'Inseridas', 'Removidas', 'Alteradas', 'Situação']
+    return resultado[colunas].rename_axis(['LOJA', 'MES_ANO']).reset_index()
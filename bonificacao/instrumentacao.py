@@ -0,0 +1,388 @@
+"""
+Medição por etapa das consolidações (spans).
+
+Uma execução (iniciar_execucao) agrupa as etapas de uma consolidação:
+lock, download, leitura, merge, backup, serialização, upload e cópia ENVIO.
+Cada etapa medida com etapa(nome) vira um span com início, duração, bytes,
+linhas e a memória do processo ao final: RSS atual e pico (VmHWM, o maior
+RSS do processo até ali). Cada tentativa de chamada ao Graph feita dentro de
+uma etapa vira um span filho dela, com endpoint, status e bytes (ClienteGraph).
+
+A execução atual fica em um ContextVar: as threads do PipelineEtapas
+recebem uma cópia do contexto. Uma execução iniciada dentro de outra
+reaproveita a de fora. Fora de uma execução, etapa() só registra a duração
+no log.
+
+Ao terminar, a execução é:
+- acrescentada como uma linha JSON em execucoes.jsonl;
+- somada às métricas do processo, regravadas em metricas.prom no formato
+  texto do Prometheus (textfile collector do node_exporter);
+- guardada entre as últimas execuções, exibidas na barra lateral.
+Diretório: BONIFICACAO_METRICAS_DIR (padrão: <tmp>/bonificacao_metricas).
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DIRETORIO_METRICAS = os.environ.get(
+    "BONIFICACAO_METRICAS_DIR",
+    os.path.join(tempfile.gettempdir(), "bonificacao_metricas")
+)
+ARQUIVO_EXECUCOES = "execucoes.jsonl"
+ARQUIVO_PROMETHEUS = "metricas.prom"
+TAMANHO_MAXIMO_LOG = 20 * 1024 * 1024
+MAX_EXECUCOES_RECENTES = 20
+
+TIPO_ETAPA = "etapa"
+TIPO_GRAPH = "graph"
+
+_contexto = contextvars.ContextVar("execucao_bonificacao", default=(None, None))
+
+
+def memoria_processo():
+    """(RSS atual, pico do RSS) do processo em MB; (None, None) fora do Linux"""
+    rss = pico = None
+    try:
+        with open('/proc/self/status') as status:
+            for linha in status:
+                if linha.startswith('VmRSS:'):
+                    rss = int(linha.split()[1]) / 1024
+                elif linha.startswith('VmHWM:'):
+                    pico = int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss, pico
+
+
+class Span:
+    """Uma etapa (ou chamada ao Graph) medida dentro de uma execução"""
+
+    def __init__(self, nome, tipo=TIPO_ETAPA, pai=None, atributos=None):
+        self.nome = nome
+        self.tipo = tipo
+        self.pai = pai
+        self.atributos = dict(atributos or {})
+        self.thread = threading.current_thread().name
+        self.inicio = None
+        self.duracao = None
+        self.erro = None
+
+    def registrar(self, **atributos):
+        """Acrescenta atributos (bytes, linhas...) ao span"""
+        self.atributos.update(atributos)
+
+    def como_dict(self):
+        return {
+            'nome': self.nome,
+            'tipo': self.tipo,
+            'pai': self.pai,
+            'inicio_s': self.inicio,
+            'duracao_s': self.duracao,
+            'thread': self.thread,
+            'erro': self.erro,
+            **self.atributos,
+        }
+
+
+class Execucao:
+    """Spans de uma consolidação, de várias threads"""
+
+    def __init__(self, operacao, origem):
+        self.id = uuid.uuid4().hex[:12]
+        self.operacao = operacao
+        self.origem = origem
+        self.inicio = datetime.now()
+        self.duracao = None
+        self.status = "ok"
+        self.erro = None
+        self.pico_rss_mb = None
+        self.spans = []
+        self._inicio_perf = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def adicionar(self, span, fim):
+        span.inicio = fim - span.duracao - self._inicio_perf
+        with self._lock:
+            self.spans.append(span)
+
+    def falhar(self, motivo):
+        """Marca a execução como falha sem exceção (ex.: operação que retornou False)"""
+        self.status = "falha"
+        self.erro = self.erro or motivo
+
+    def finalizar(self):
+        self.duracao = time.perf_counter() - self._inicio_perf
+        self.pico_rss_mb = memoria_processo()[1]
+        with self._lock:
+            self.spans.sort(key=lambda span: span.inicio)
+
+    def etapas(self):
+        """Spans de etapa (sem as chamadas ao Graph), na ordem de início"""
+        return [span for span in self.spans if span.tipo == TIPO_ETAPA]
+
+    def como_dict(self):
+        return {
+            'id': self.id,
+            'operacao': self.operacao,
+            'origem': self.origem,
+            'inicio': self.inicio.isoformat(timespec='milliseconds'),
+            'duracao_s': self.duracao,
+            'status': self.status,
+            'erro': self.erro,
+            'pico_rss_mb': self.pico_rss_mb,
+            'spans': [span.como_dict() for span in self.spans],
+        }
+
+
+# ===========================
+# EXECUÇÕES E ETAPAS
+# ===========================
+def execucao_atual():
+    return _contexto.get()[0]
+
+
+@contextmanager
+def iniciar_execucao(operacao, origem="app", registro=None):
+    """Agrupa as etapas medidas dentro do bloco; registra a execução ao sair"""
+    externa = execucao_atual()
+    if externa is not None:
+        yield externa
+        return
+
+    execucao = Execucao(operacao, origem)
+    token = _contexto.set((execucao, None))
+    try:
+        yield execucao
+    except BaseException as e:
+        execucao.falhar(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _contexto.reset(token)
+        execucao.finalizar()
+        logger.info(f"{operacao} ({origem}): {execucao.duracao:.2f}s, {execucao.status}")
+        (registro or obter_registro()).registrar(execucao)
+
+
+def execucao_medida(operacao, origem="app"):
+    """Decorador: a função roda em uma execução, que conta como falha se ela retornar False"""
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envolvida(*args, **kwargs):
+            with iniciar_execucao(operacao, origem) as execucao:
+                resultado = funcao(*args, **kwargs)
+                if resultado is False:
+                    execucao.falhar(f"{funcao.__name__} não concluída")
+                return resultado
+        return envolvida
+    return decorador
+
+
+@contextmanager
+def etapa(nome, **atributos):
+    """
+    Mede o bloco como uma etapa da execução atual
+    O span devolvido aceita registrar(bytes=..., linhas=...)
+    """
+    execucao, pai = _contexto.get()
+    span = Span(nome, TIPO_ETAPA, pai.nome if pai is not None else None, atributos)
+    token = _contexto.set((execucao, span))
+    inicio = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span.erro = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        fim = time.perf_counter()
+        span.duracao = fim - inicio
+        _contexto.reset(token)
+        rss, pico = memoria_processo()
+        span.registrar(rss_mb=rss, pico_rss_mb=pico)
+        if execucao is not None:
+            execucao.adicionar(span, fim)
+        detalhes = ", ".join(f"{chave}={valor}" for chave, valor in span.atributos.items()
+                             if chave in ('bytes', 'linhas'))
+        logger.info(f"Etapa {nome}: {span.duracao:.2f}s{f' ({detalhes})' if detalhes else ''}")
+
+
+def registrar_chamada(endpoint, duracao, erro=None, **atributos):
+    """
+    Registra uma chamada ao Graph já concluída como filha da etapa atual
+    erro é a exceção de rede, se houve; fora de uma execução não registra nada
+    """
+    execucao, pai = _contexto.get()
+    if execucao is None:
+        return
+    span = Span(endpoint, TIPO_GRAPH, pai.nome if pai is not None else None, atributos)
+    span.duracao = duracao
+    span.erro = f"{type(erro).__name__}: {erro}" if erro is not None else None
+    execucao.adicionar(span, time.perf_counter())
+
+
+def executar_no_contexto(executor, funcao, *args):
+    """executor.submit com uma cópia do contexto atual (a execução segue para a thread)"""
+    return executor.submit(contextvars.copy_context().run, funcao, *args)
+
+
+# ===========================
+# REGISTRO E EXPORTAÇÃO
+# ===========================
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(**rotulos):
+    texto = ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in rotulos.items())
+    return f"{{{texto}}}" if texto else ""
+
+
+class RegistroExecucoes:
+    """Últimas execuções do processo e totais por etapa, gravados em JSON e no formato do Prometheus"""
+
+    def __init__(self, diretorio=DIRETORIO_METRICAS, max_recentes=MAX_EXECUCOES_RECENTES):
+        self.diretorio = diretorio
+        self._recentes = deque(maxlen=max_recentes)
+        self._lock = threading.Lock()
+        self._execucoes = {}
+        self._etapas = {}
+        self._chamadas = {}
+        self._pico_rss_mb = None
+        self._ultima = None
+
+    def registrar(self, execucao):
+        with self._lock:
+            self._recentes.append(execucao)
+            self._somar(execucao)
+            texto = self.texto_prometheus()
+        try:
+            os.makedirs(self.diretorio, exist_ok=True)
+            self._acrescentar_json(execucao)
+            self._gravar_atomico(os.path.join(self.diretorio, ARQUIVO_PROMETHEUS), texto.encode('utf-8'))
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar as métricas em {self.diretorio}: {e}")
+
+    def recentes(self):
+        """Execuções mais recentes primeiro"""
+        with self._lock:
+            return list(reversed(self._recentes))
+
+    def _somar(self, execucao):
+        chave = (execucao.origem, execucao.status)
+        total = self._execucoes.setdefault(chave, {'quantidade': 0, 'segundos': 0.0, 'ultima': 0.0})
+        total['quantidade'] += 1
+        total['segundos'] += execucao.duracao
+        total['ultima'] = execucao.duracao
+        self._ultima = execucao.inicio.timestamp() + execucao.duracao
+        if execucao.pico_rss_mb is not None:
+            self._pico_rss_mb = max(self._pico_rss_mb or 0, execucao.pico_rss_mb)
+
+        for span in execucao.spans:
+            if span.tipo == TIPO_ETAPA:
+                total = self._etapas.setdefault(span.nome, {'quantidade': 0, 'erros': 0, 'segundos': 0.0,
+                                                            'maximo': 0.0, 'bytes': 0, 'linhas': 0})
+                total['bytes'] += span.atributos.get('bytes') or 0
+                total['linhas'] += span.atributos.get('linhas') or 0
+            else:
+                total = self._chamadas.setdefault(span.nome, {'quantidade': 0, 'erros': 0, 'segundos': 0.0,
+                                                              'maximo': 0.0, 'enviados': 0, 'recebidos': 0,
+                                                              'status': {}})
+                status = str(span.atributos.get('status') or 'sem_resposta')
+                total['status'][status] = total['status'].get(status, 0) + 1
+                total['enviados'] += span.atributos.get('bytes_enviados') or 0
+                total['recebidos'] += span.atributos.get('bytes_recebidos') or 0
+            total['quantidade'] += 1
+            total['erros'] += bool(span.erro)
+            total['segundos'] += span.duracao
+            total['maximo'] = max(total['maximo'], span.duracao)
+
+    def texto_prometheus(self):
+        """Métricas acumuladas no formato texto do Prometheus"""
+        linhas = []
+
+        def metrica(nome, tipo, ajuda, valores):
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            linhas.extend(f"{nome}{rotulos} {valor}" for rotulos, valor in valores)
+
+        execucoes = sorted(self._execucoes.items())
+        metrica("bonificacao_execucoes_total", "counter", "Consolidações por origem e status",
+                [(_rotulos(origem=o, status=s), t['quantidade']) for (o, s), t in execucoes])
+        metrica("bonificacao_execucao_segundos_total", "counter", "Tempo total das consolidações",
+                [(_rotulos(origem=o, status=s), f"{t['segundos']:.6f}") for (o, s), t in execucoes])
+        metrica("bonificacao_execucao_ultima_segundos", "gauge", "Duração da última consolidação",
+                [(_rotulos(origem=o, status=s), f"{t['ultima']:.6f}") for (o, s), t in execucoes])
+
+        etapas = sorted(self._etapas.items())
+        metrica("bonificacao_etapa_execucoes_total", "counter", "Execuções de cada etapa",
+                [(_rotulos(etapa=n), t['quantidade']) for n, t in etapas])
+        metrica("bonificacao_etapa_erros_total", "counter", "Etapas que terminaram com exceção",
+                [(_rotulos(etapa=n), t['erros']) for n, t in etapas])
+        metrica("bonificacao_etapa_segundos_total", "counter", "Tempo total em cada etapa",
+                [(_rotulos(etapa=n), f"{t['segundos']:.6f}") for n, t in etapas])
+        metrica("bonificacao_etapa_segundos_max", "gauge", "Maior duração de cada etapa",
+                [(_rotulos(etapa=n), f"{t['maximo']:.6f}") for n, t in etapas])
+        metrica("bonificacao_etapa_bytes_total", "counter", "Bytes lidos ou gravados em cada etapa",
+                [(_rotulos(etapa=n), t['bytes']) for n, t in etapas])
+        metrica("bonificacao_etapa_linhas_total", "counter", "Linhas processadas em cada etapa",
+                [(_rotulos(etapa=n), t['linhas']) for n, t in etapas])
+
+        chamadas = sorted(self._chamadas.items())
+        metrica("bonificacao_graph_requisicoes_total", "counter", "Tentativas de chamada ao Graph por endpoint e status",
+                [(_rotulos(endpoint=n, status=s), q) for n, t in chamadas for s, q in sorted(t['status'].items())])
+        metrica("bonificacao_graph_segundos_max", "gauge", "Maior duração de uma chamada ao Graph",
+                [(_rotulos(endpoint=n), f"{t['maximo']:.6f}") for n, t in chamadas])
+        metrica("bonificacao_graph_segundos_total", "counter", "Tempo total nas chamadas ao Graph",
+                [(_rotulos(endpoint=n), f"{t['segundos']:.6f}") for n, t in chamadas])
+        metrica("bonificacao_graph_bytes_total", "counter", "Bytes enviados e recebidos do Graph",
+                [(_rotulos(endpoint=n, direcao=d), t[d]) for n, t in chamadas for d in ('enviados', 'recebidos')])
+
+        if self._pico_rss_mb is not None:
+            metrica("bonificacao_processo_rss_pico_bytes", "gauge", "Maior RSS do processo nas consolidações",
+                    [("", int(self._pico_rss_mb * 1024 * 1024))])
+        if self._ultima is not None:
+            metrica("bonificacao_ultima_execucao_timestamp_seconds", "gauge", "Fim da última consolidação",
+                    [("", f"{self._ultima:.3f}")])
+        return "\n".join(linhas) + "\n"
+
+    def _acrescentar_json(self, execucao):
+        caminho = os.path.join(self.diretorio, ARQUIVO_EXECUCOES)
+        if os.path.exists(caminho) and os.path.getsize(caminho) > TAMANHO_MAXIMO_LOG:
+            os.replace(caminho, f"{caminho}.1")
+        with open(caminho, "a", encoding="utf-8") as arquivo:
+            arquivo.write(json.dumps(execucao.como_dict(), ensure_ascii=False, default=str) + "\n")
+
+    def _gravar_atomico(self, caminho, conteudo):
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, prefix=".tmp_")
+        try:
+            with os.fdopen(descritor, "wb") as arquivo:
+                arquivo.write(conteudo)
+            os.replace(temporario, caminho)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+
+_registro_padrao = None
+_lock_registro = threading.Lock()
+
+
+def obter_registro():
+    """RegistroExecucoes único do processo (compartilhado entre sessões do Streamlit)"""
+    global _registro_padrao
+    if _registro_padrao is None:
+        with _lock_registro:
+            if _registro_padrao is None:
+                _registro_padrao = RegistroExecucoes()
+    return _registro_padrao
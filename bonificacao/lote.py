@@ -0,0 +1,155 @@
+"""
+Leitura e validação de vários arquivos de uma vez.
+
+Cada arquivo é lido e validado em um processo separado (ler_e_validar),
+já que a leitura do Excel e a validação são CPU e seguram o GIL. O pool
+usa o método spawn, seguro dentro do servidor multi-thread do Streamlit,
+e é criado uma vez e reaproveitado entre lotes para não pagar a
+inicialização dos processos a cada envio.
+
+Arquivos já lidos e validados (mesmo conteúdo) saem do cache de leituras
+do processo principal e não vão para o pool, então as reexecuções da tela
+não leem de novo o lote inteiro.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+from bonificacao.arquivo_envios import hash_conteudo
+from bonificacao.cache_leituras import chave_validacao, obter_cache
+from bonificacao.esquema import ABA_DADOS
+from bonificacao.excel import abrir_planilha, ler_aba
+from bonificacao.validacao import avaliar_planilha
+
+logger = logging.getLogger(__name__)
+
+MAX_PROCESSOS_LEITURA = min(4, os.cpu_count() or 1)
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def ler_e_validar(nome, conteudo):
+    """
+    Lê a aba Dados de um arquivo e aplica a validação completa
+    Retorna um dict com nome, hash, df (None se não pôde ser lido), erros,
+    avisos, info_datas e ocorrencias (linhas por regra violada)
+    """
+    resultado = {
+        'nome': nome,
+        'hash': hash_conteudo(conteudo),
+        'df': None,
+        'erros': [],
+        'avisos': [],
+        'info_datas': {},
+        'ocorrencias': None,
+    }
+    try:
+        with abrir_planilha(BytesIO(conteudo)) as planilha:
+            if ABA_DADOS not in planilha.sheet_names:
+                resultado['erros'].append(f"Aba '{ABA_DADOS}' não encontrada (abas: {', '.join(planilha.sheet_names)})")
+                return resultado
+            df = ler_aba(planilha, ABA_DADOS)
+    except Exception as e:
+        resultado['erros'].append(f"Erro ao ler arquivo: {e}")
+        return resultado
+
+    erros, avisos, info_datas, ocorrencias = avaliar_planilha(df)
+    resultado.update(df=df, erros=erros, avisos=avisos, info_datas=info_datas, ocorrencias=ocorrencias)
+    return resultado
+
+
+def _resultado_em_cache(cache, nome, hash_hex):
+    """Resultado de ler_e_validar montado a partir do cache, ou None"""
+    df = cache.obter(('dados', hash_hex, ABA_DADOS))
+    validacao = cache.obter(chave_validacao(hash_hex, ABA_DADOS)) if df is not None else None
+    if validacao is None:
+        return None
+    erros, avisos, info_datas, ocorrencias = validacao
+    return {
+        'nome': nome,
+        'hash': hash_hex,
+        'df': df,
+        'erros': list(erros),
+        'avisos': list(avisos),
+        'info_datas': dict(info_datas),
+        'ocorrencias': ocorrencias,
+    }
+
+
+def _guardar_resultado(cache, resultado):
+    if resultado['df'] is None:
+        return
+    cache.guardar(('dados', resultado['hash'], ABA_DADOS), resultado['df'])
+    cache.guardar(chave_validacao(resultado['hash'], ABA_DADOS), (
+        resultado['erros'], resultado['avisos'], resultado['info_datas'], resultado['ocorrencias']
+    ))
+
+
+def _pool_leitura(max_processos):
+    """Pool do processo; é criado com max_processos na primeira chamada e depois reaproveitado"""
+    global _pool
+    with _lock_pool:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_processos,
+                                        mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def ler_e_validar_arquivos(arquivos, paralelo=True, cache=None, progresso=None, max_processos=None):
+    """
+    Lê e valida vários arquivos; arquivos é uma lista de (nome, conteudo)
+    Retorna os resultados de ler_e_validar na mesma ordem
+    progresso(nome, lidos, total) é chamado a cada arquivo concluído, na ordem
+    em que terminam; max_processos (padrão MAX_PROCESSOS_LEITURA) só vale
+    para o primeiro pool do processo
+    """
+    cache = obter_cache() if cache is None else cache
+    resultados = [_resultado_em_cache(cache, nome, hash_conteudo(conteudo)) for nome, conteudo in arquivos]
+    pendentes = [posicao for posicao, resultado in enumerate(resultados) if resultado is None]
+
+    total = len(arquivos)
+    lidos = total - len(pendentes)
+
+    def concluido(nome):
+        nonlocal lidos
+        lidos += 1
+        if progresso is not None:
+            progresso(nome, lidos, total)
+
+    novos = _ler_e_validar_varios([arquivos[posicao] for posicao in pendentes], paralelo,
+                                  max_processos or MAX_PROCESSOS_LEITURA, concluido)
+    for posicao, resultado in zip(pendentes, novos):
+        _guardar_resultado(cache, resultado)
+        resultados[posicao] = resultado
+    return resultados
+
+
+def _ler_e_validar_varios(arquivos, paralelo, max_processos, concluido):
+    global _pool
+    lidos = {}
+    if paralelo and len(arquivos) >= 2 and max_processos >= 2:
+        try:
+            pool = _pool_leitura(max_processos)
+            futuros = {pool.submit(ler_e_validar, nome, conteudo): posicao
+                       for posicao, (nome, conteudo) in enumerate(arquivos)}
+            for futuro in as_completed(futuros):
+                posicao = futuros[futuro]
+                lidos[posicao] = futuro.result()
+                concluido(arquivos[posicao][0])
+        except Exception as e:
+            # Pool quebrado (processo encerrado, limite do sistema): descarta e lê o resto em sequência
+            logger.warning(f"Leitura paralela indisponível, lendo em sequência: {e}")
+            with _lock_pool:
+                if _pool is not None:
+                    _pool.shutdown(wait=False, cancel_futures=True)
+                    _pool = None
+
+    for posicao, (nome, conteudo) in enumerate(arquivos):
+        if posicao not in lidos:
+            lidos[posicao] = ler_e_validar(nome, conteudo)
+            concluido(nome)
+    return [lidos[posicao] for posicao in range(len(arquivos))]
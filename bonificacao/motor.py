@@ -0,0 +1,133 @@
+"""
+Motor de consolidação por LOJA + MÊS/ANO.
+
+A substituição é feita como um anti-join por hash: os dados novos geram um
+índice de chaves (LOJA, MES_ANO) e o consolidado é percorrido uma única vez
+contra esse índice, em vez de uma máscara booleana por combinação. O
+resultado é montado direto das linhas mantidas (compactacao.concatenar),
+sem uma cópia filtrada do consolidado.
+"""
+import numpy as np
+import pandas as pd
+
+from bonificacao.compactacao import concatenar
+
+COLUNAS_CHAVE = ['LOJA', 'MES_ANO']
+
+
+def calcular_mes_ano(datas):
+    """Converte uma série de datas para o rótulo de mês 'AAAA-MM'"""
+    return pd.to_datetime(datas).dt.to_period('M').astype(str)
+
+
+def indice_lojas_meses(df):
+    """
+    Monta o índice (LOJA, MES_ANO) linha a linha do DataFrame
+    Usa a coluna MES_ANO se existir, senão calcula a partir de DATA
+    """
+    if 'MES_ANO' in df.columns:
+        mes_ano = df['MES_ANO']
+    else:
+        mes_ano = calcular_mes_ano(df['DATA'])
+    return pd.MultiIndex.from_arrays(
+        [df['LOJA'].to_numpy(), np.asarray(mes_ano)],
+        names=COLUNAS_CHAVE
+    )
+
+
+def chaves_lojas_meses(df):
+    """Retorna as combinações distintas de LOJA + MES_ANO (ignora LOJA nula)"""
+    indice = indice_lojas_meses(df)
+    lojas_validas = pd.notna(indice.get_level_values('LOJA'))
+    return indice[lojas_validas].unique()
+
+
+def mascara_lojas_meses(df, chaves):
+    """Marca as linhas de df cuja combinação LOJA + MES_ANO está em chaves"""
+    if len(df) == 0 or len(chaves) == 0:
+        return np.zeros(len(df), dtype=bool)
+    return indice_lojas_meses(df).isin(chaves)
+
+
+def remover_lojas_meses(df_consolidado, chaves):
+    """
+    Remove do consolidado as linhas das combinações LOJA + MES_ANO em chaves
+    Retorna: (df_filtrado, registros_removidos)
+    """
+    if len(df_consolidado) == 0:
+        return df_consolidado, 0
+
+    substituir = mascara_lojas_meses(df_consolidado, chaves)
+    registros_removidos = int(substituir.sum())
+
+    if registros_removidos == 0:
+        return df_consolidado, 0
+
+    return df_consolidado[~substituir], registros_removidos
+
+
+def consolidar(df_consolidado, df_novo):
+    """
+    Substitui no consolidado as lojas/meses presentes nos dados novos
+    Retorna: (df_final, registros_removidos, registros_preservados)
+    """
+    manter = ~mascara_lojas_meses(df_consolidado, chaves_lojas_meses(df_novo))
+    registros_preservados = int(manter.sum())
+
+    if registros_preservados > 0:
+        df_final = concatenar([df_consolidado, df_novo], [manter, None])
+    else:
+        df_final = df_novo.reset_index(drop=True)
+
+    return df_final, len(df_consolidado) - registros_preservados, registros_preservados
+
+
+def _linhas_por_chave(df):
+    """Quantidade de linhas por combinação LOJA + MES_ANO"""
+    return indice_lojas_meses(df).value_counts().to_dict()
+
+
+def unir_chaves(lista_chaves):
+    """União de vários índices de chaves (vazio se a lista for vazia)"""
+    if not lista_chaves:
+        return pd.MultiIndex.from_arrays([[], []], names=COLUNAS_CHAVE)
+    return lista_chaves[0].append(list(lista_chaves[1:])).unique()
+
+
+def consolidar_lote(df_consolidado, novos):
+    """
+    Aplica vários envios, na ordem da lista, em um único merge
+    Uma combinação LOJA + MES_ANO enviada mais de uma vez fica com o envio
+    mais recente, como se os envios fossem consolidados um a um
+    Retorna: (df_final, contagens) com um dict por envio:
+    {'novos': linhas enviadas, 'removidos': linhas que o envio substituiu,
+     'mantidos': linhas do envio no resultado (menos se um envio posterior
+     do lote substituiu parte delas)}
+    """
+    chaves = [chaves_lojas_meses(df) for df in novos]
+
+    # Linhas por combinação no estado atual (consolidado e envios já aplicados)
+    linhas_por_chave = {}
+    if len(df_consolidado) > 0:
+        linhas_por_chave = _linhas_por_chave(df_consolidado)
+
+    contagens = []
+    for df, chaves_envio in zip(novos, chaves):
+        removidos = sum(linhas_por_chave.get(chave, 0) for chave in chaves_envio)
+        linhas_envio = _linhas_por_chave(df)
+        for chave in chaves_envio:
+            linhas_por_chave[chave] = linhas_envio.get(chave, 0)
+        contagens.append({'novos': len(df), 'removidos': int(removidos)})
+
+    # Cada parte mantém só as combinações que nenhum envio posterior substitui
+    partes = [df_consolidado]
+    manter = [~mascara_lojas_meses(df_consolidado, unir_chaves(chaves))]
+    for posicao, df in enumerate(novos):
+        mascara = ~mascara_lojas_meses(df, unir_chaves(chaves[posicao + 1:]))
+        contagens[posicao]['mantidos'] = int(mascara.sum())
+        partes.append(df)
+        manter.append(mascara)
+
+    if not any(mascara.any() for mascara in manter):
+        return df_consolidado.iloc[0:0], contagens
+    return concatenar(partes, manter), contagens
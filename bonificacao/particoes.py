@@ -0,0 +1,312 @@
+"""
+Armazenamento colunar particionado do consolidado (Parquet por LOJA/MES_ANO).
+
+Layout, relativo à pasta do consolidado:
+    particoes/_manifesto.json
+    particoes/LOJA=<loja>/MES_ANO=<AAAA-MM>/dados-<versao>.parquet
+
+O manifesto diz quais partições existem, em que arquivo está cada uma e
+quantas linhas ela tem. Uma consolidação só lê e grava as partições das
+lojas/meses enviados, sempre em arquivos novos (nunca sobrescreve o de uma
+versão anterior). O manifesto é gravado por último e é o ponto de commit:
+até ele, quem lê continua vendo a versão anterior inteira, e uma gravação
+interrompida deixa só arquivos novos que nenhum manifesto cita. Os arquivos
+substituídos são removidos depois do manifesto.
+"""
+import hashlib
+import json
+import logging
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from bonificacao.compactacao import compactar, concatenar
+from bonificacao.motor import calcular_mes_ano
+
+logger = logging.getLogger(__name__)
+
+PASTA_PARTICOES = "particoes"
+ARQUIVO_MANIFESTO = f"{PASTA_PARTICOES}/_manifesto.json"
+VERSAO_MANIFESTO = 1
+MAX_TRANSFERENCIAS_PARALELAS = 8
+
+
+def normalizar_loja(loja):
+    """Normaliza o valor de LOJA para uso em chaves (1.0 e 1 são a mesma loja)"""
+    if hasattr(loja, 'item'):
+        loja = loja.item()
+    if isinstance(loja, float) and loja.is_integer():
+        return int(loja)
+    return loja
+
+
+def chave_particao(loja, mes_ano):
+    """Chave textual da partição no manifesto"""
+    return f"{normalizar_loja(loja)}|{mes_ano}"
+
+
+def versao_particao():
+    """Identificador novo (e ordenável pelo horário) para um arquivo de partição"""
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+
+def caminho_particao(loja, mes_ano, versao):
+    """Caminho do arquivo Parquet de uma versão da partição, seguro para o SharePoint"""
+    texto = str(normalizar_loja(loja))
+    legivel = re.sub(r'[^0-9A-Za-z_-]+', '_', texto).strip('_')[:40] or 'loja'
+    sufixo = hashlib.sha1(texto.encode('utf-8')).hexdigest()[:8]
+    return f"{PASTA_PARTICOES}/LOJA={legivel}-{sufixo}/MES_ANO={mes_ano}/dados-{versao}.parquet"
+
+
+def serializar_parquet(df):
+    """
+    Serializa um DataFrame em Parquet
+    Colunas texto com tipos mistos (ex.: PIX numérico e texto) são gravadas como texto
+    """
+    buffer = BytesIO()
+    try:
+        df.to_parquet(buffer, index=False)
+    except Exception as e:
+        logger.warning(f"Colunas com tipos mistos convertidas para texto: {e}")
+        df = df.copy()
+        for coluna in df.columns[df.dtypes == object]:
+            df[coluna] = df[coluna].map(lambda v: v if pd.isna(v) else str(v))
+        buffer = BytesIO()
+        df.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
+
+def ler_parquet(conteudo):
+    """Lê um Parquet serializado"""
+    return compactar(pd.read_parquet(BytesIO(conteudo)))
+
+
+class ArmazenamentoParticionado:
+    """
+    Consolidado particionado por LOJA + MES_ANO
+
+    ler_bytes(caminho) deve retornar os bytes, None se o arquivo não existir,
+    ou levantar exceção em caso de erro. gravar_bytes(caminho, conteudo)
+    deve retornar True em caso de sucesso. remover(caminho), opcional, apaga
+    um arquivo; sem ele as versões substituídas ficam no drive.
+    """
+
+    def __init__(self, ler_bytes, gravar_bytes, remover=None, max_paralelo=MAX_TRANSFERENCIAS_PARALELAS):
+        self.ler_bytes = ler_bytes
+        self.gravar_bytes = gravar_bytes
+        self.remover = remover
+        self.max_paralelo = max_paralelo
+        self.manifesto = None
+
+    # ---------------------------
+    # Manifesto
+    # ---------------------------
+    def carregar_manifesto(self):
+        """Carrega o manifesto; retorna None se o armazenamento ainda não existe"""
+        conteudo = self.ler_bytes(ARQUIVO_MANIFESTO)
+        if conteudo is None:
+            self.manifesto = None
+            return None
+
+        manifesto = json.loads(conteudo)
+        if manifesto.get('versao') != VERSAO_MANIFESTO:
+            raise ValueError(f"Versão de manifesto não suportada: {manifesto.get('versao')}")
+
+        self.manifesto = manifesto
+        return manifesto
+
+    def existe(self):
+        return self.manifesto is not None
+
+    def _novo_manifesto(self):
+        return {
+            'versao': VERSAO_MANIFESTO,
+            'atualizado_em': None,
+            'exportado_em': None,
+            'particoes': {}
+        }
+
+    def _gravar_manifesto(self, manifesto=None):
+        conteudo = json.dumps(manifesto or self.manifesto, ensure_ascii=False, indent=1).encode('utf-8')
+        if not self.gravar_bytes(ARQUIVO_MANIFESTO, conteudo):
+            raise RuntimeError("Falha ao gravar o manifesto das partições")
+
+    def total_linhas(self):
+        if not self.existe():
+            return 0
+        return sum(p['linhas'] for p in self.manifesto['particoes'].values())
+
+    def linhas_particoes(self, chaves):
+        """Soma as linhas registradas no manifesto para as chaves (loja, mes_ano)"""
+        if not self.existe():
+            return 0
+        particoes = self.manifesto['particoes']
+        total = 0
+        for loja, mes_ano in chaves:
+            entrada = particoes.get(chave_particao(loja, mes_ano))
+            if entrada:
+                total += entrada['linhas']
+        return total
+
+    def desatualizado(self):
+        """Indica se a planilha xlsx derivada está atrás das partições"""
+        if not self.existe():
+            return False
+        exportado = self.manifesto.get('exportado_em')
+        return exportado is None or exportado < (self.manifesto.get('atualizado_em') or '')
+
+    # ---------------------------
+    # Leitura
+    # ---------------------------
+    def ler_particoes(self, chaves=None):
+        """
+        Lê as partições indicadas (ou todas, se chaves for None)
+        Retorna um único DataFrame na ordem do manifesto
+        """
+        if not self.existe():
+            return pd.DataFrame()
+
+        particoes = self.manifesto['particoes']
+        if chaves is None:
+            entradas = list(particoes.values())
+        else:
+            entradas = [particoes[c] for c in (chave_particao(l, m) for l, m in chaves) if c in particoes]
+
+        if not entradas:
+            return pd.DataFrame()
+
+        def ler(entrada):
+            conteudo = self.ler_bytes(entrada['arquivo'])
+            if conteudo is None:
+                raise RuntimeError(f"Partição ausente: {entrada['arquivo']}")
+            return ler_parquet(conteudo)
+
+        with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+            frames = list(executor.map(ler, entradas))
+
+        return concatenar(frames)
+
+    def conteudo_particoes(self, chaves):
+        """Retorna [(arquivo, bytes)] das partições existentes entre as chaves"""
+        if not self.existe():
+            return []
+
+        particoes = self.manifesto['particoes']
+        arquivos = [particoes[c]['arquivo'] for c in (chave_particao(l, m) for l, m in chaves) if c in particoes]
+
+        with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+            conteudos = list(executor.map(self.ler_bytes, arquivos))
+
+        return [(a, c) for a, c in zip(arquivos, conteudos) if c is not None]
+
+    # ---------------------------
+    # Escrita
+    # ---------------------------
+    def _gravar_grupos(self, df):
+        """
+        Grava um Parquet novo por LOJA + MES_ANO e retorna as entradas do manifesto
+        Se alguma gravação falhar, remove as que foram feitas e levanta a exceção
+        """
+        mes_ano = calcular_mes_ano(df['DATA'])
+        df = df.drop(columns='MES_ANO', errors='ignore')
+        agora = datetime.now().isoformat()
+        versao = versao_particao()
+
+        grupos = [
+            (loja, mes, caminho_particao(loja, mes, versao), grupo)
+            for (loja, mes), grupo in df.groupby([df['LOJA'], mes_ano], sort=False, dropna=False, observed=True)
+        ]
+
+        def gravar(item):
+            loja, mes, caminho, grupo = item
+            if not self.gravar_bytes(caminho, serializar_parquet(grupo)):
+                raise RuntimeError(f"Falha ao gravar partição {caminho}")
+            entrada = {
+                'loja': normalizar_loja(loja),
+                'mes_ano': mes,
+                'arquivo': caminho,
+                'linhas': len(grupo),
+                'atualizado_em': agora
+            }
+            return chave_particao(loja, mes), entrada
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+                return list(executor.map(gravar, grupos))
+        except Exception:
+            self._remover_arquivos([caminho for _, _, caminho, _ in grupos])
+            raise
+
+    def _remover_arquivos(self, arquivos):
+        """Remove arquivos de partição que nenhum manifesto cita (falhas só vão para o log)"""
+        if self.remover is None:
+            return
+
+        def remover(arquivo):
+            try:
+                self.remover(arquivo)
+            except Exception as e:
+                logger.warning(f"Partição não removida ({arquivo}): {e}")
+
+        with ThreadPoolExecutor(max_workers=self.max_paralelo) as executor:
+            list(executor.map(remover, arquivos))
+
+    def _confirmar(self, manifesto, novos):
+        """
+        Grava o manifesto (ponto de commit) e só então o adota
+        Se a gravação falhar, os arquivos novos são removidos e o manifesto anterior continua valendo
+        """
+        try:
+            self._gravar_manifesto(manifesto)
+        except Exception:
+            self._remover_arquivos(novos)
+            raise
+        self.manifesto = manifesto
+
+    def inicializar(self, df_consolidado):
+        """Cria o armazenamento a partir do consolidado completo (migração única)"""
+        manifesto = self._novo_manifesto()
+        entradas = self._gravar_grupos(df_consolidado) if len(df_consolidado) > 0 else []
+        manifesto['particoes'].update(entradas)
+        agora = datetime.now().isoformat()
+        manifesto['atualizado_em'] = agora
+        manifesto['exportado_em'] = agora
+        self._confirmar(manifesto, [entrada['arquivo'] for _, entrada in entradas])
+        logger.info(f"Armazenamento particionado criado: {len(manifesto['particoes'])} partições")
+
+    def substituir(self, df_novo):
+        """
+        Substitui as partições das lojas/meses presentes em df_novo
+        Retorna: (registros_removidos, registros_preservados, particoes_gravadas)
+        """
+        anterior = self.manifesto if self.existe() else self._novo_manifesto()
+        entradas = self._gravar_grupos(df_novo)
+
+        manifesto = dict(anterior, particoes=dict(anterior['particoes']))
+        particoes = manifesto['particoes']
+        registros_removidos = 0
+        substituidos = []
+        for chave, entrada in entradas:
+            antiga = particoes.pop(chave, None)
+            if antiga:
+                registros_removidos += antiga['linhas']
+                substituidos.append(antiga['arquivo'])
+            particoes[chave] = entrada
+        manifesto['atualizado_em'] = datetime.now().isoformat()
+
+        self._confirmar(manifesto, [entrada['arquivo'] for _, entrada in entradas])
+        # Quem carregou o manifesto anterior pode ainda estar lendo estes arquivos
+        self._remover_arquivos(substituidos)
+
+        registros_preservados = self.total_linhas() - len(df_novo)
+        return registros_removidos, registros_preservados, len(entradas)
+
+    def marcar_exportado(self):
+        """Registra que a planilha xlsx derivada foi regerada"""
+        if self.existe():
+            self.manifesto['exportado_em'] = datetime.now().isoformat()
+            self._gravar_manifesto()
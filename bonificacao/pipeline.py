@@ -0,0 +1,99 @@
+"""
+Execução de etapas com dependências em um pool de threads limitado.
+
+Cada etapa recebe o dicionário de resultados das etapas já concluídas e
+começa assim que todas as suas dependências terminam com sucesso, de modo
+que uploads (que liberam o GIL durante a rede) se sobrepõem à serialização.
+Uma etapa falha se levantar exceção ou retornar None/False; as etapas que
+dependem dela não são executadas.
+
+O callback ao_concluir é chamado na thread de quem executa o pipeline, o
+que permite atualizar a interface do Streamlit a cada etapa concluída. As
+etapas rodam com uma cópia do contexto de quem executa, então as etapas
+medidas (bonificacao.instrumentacao) entram na mesma execução.
+"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from bonificacao.instrumentacao import executar_no_contexto
+
+logger = logging.getLogger(__name__)
+
+MAX_THREADS_PIPELINE = 3
+
+
+class EtapaIgnorada(Exception):
+    """A etapa não foi executada porque uma dependência falhou"""
+
+
+class PipelineEtapas:
+    """Pequeno grafo de etapas executado com no máximo max_threads em paralelo"""
+
+    def __init__(self, max_threads=MAX_THREADS_PIPELINE):
+        self.max_threads = max_threads
+        self.etapas = {}
+
+    def adicionar(self, nome, funcao, depende_de=()):
+        """Registra uma etapa; funcao(resultados) recebe os resultados anteriores"""
+        for dependencia in depende_de:
+            if dependencia not in self.etapas:
+                raise ValueError(f"Dependência desconhecida para {nome}: {dependencia}")
+        self.etapas[nome] = (funcao, tuple(depende_de))
+        return self
+
+    def executar(self, ao_concluir=None):
+        """
+        Executa todas as etapas respeitando as dependências
+        ao_concluir(nome, resultado, erro) é chamado a cada etapa concluída,
+        falha ou ignorada
+        Retorna: (resultados, erros)
+        """
+        resultados = {}
+        erros = {}
+        pendentes = dict(self.etapas)
+
+        def notificar(nome, resultado, erro):
+            if ao_concluir is not None:
+                ao_concluir(nome, resultado, erro)
+
+        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
+            em_execucao = {}
+
+            while True:
+                # Dispara as etapas prontas e ignora as que dependem de falhas
+                mudou = True
+                while mudou:
+                    mudou = False
+                    for nome, (funcao, dependencias) in list(pendentes.items()):
+                        falhas = [d for d in dependencias if d in erros]
+                        if falhas:
+                            del pendentes[nome]
+                            erros[nome] = EtapaIgnorada(f"dependência falhou: {', '.join(falhas)}")
+                            notificar(nome, None, erros[nome])
+                            mudou = True
+                        elif all(d in resultados for d in dependencias):
+                            del pendentes[nome]
+                            em_execucao[executar_no_contexto(executor, funcao, dict(resultados))] = nome
+
+                if not em_execucao:
+                    break
+
+                concluidas, _ = wait(list(em_execucao), return_when=FIRST_COMPLETED)
+                for futuro in concluidas:
+                    nome = em_execucao.pop(futuro)
+                    try:
+                        resultado = futuro.result()
+                    except Exception as e:
+                        logger.error(f"Etapa {nome} falhou: {e}")
+                        erros[nome] = e
+                        notificar(nome, None, e)
+                        continue
+
+                    if resultado is None or resultado is False:
+                        erros[nome] = RuntimeError(f"Etapa {nome} não concluída")
+                        notificar(nome, None, erros[nome])
+                    else:
+                        resultados[nome] = resultado
+                        notificar(nome, resultado, None)
+
+        return resultados, erros
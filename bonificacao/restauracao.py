@@ -0,0 +1,122 @@
+"""
+Linha de comando para consultar o histórico de backups do consolidado e
+restaurá-lo como estava em um horário (bonificacao.historico).
+
+A reconstrução parte do último snapshot até o horário e reaplica os deltas
+seguintes; só esses arquivos são baixados. Sem --aplicar nada é gravado no
+drive: o resultado pode ser salvo em um xlsx (--saida) para conferência.
+Com --aplicar o consolidado é substituído pela versão reconstruída, com o
+lock ou If-Match como numa consolidação, e o consolidado substituído fica
+como snapshot no histórico (a restauração também pode ser desfeita).
+
+Credenciais e --local como em bonificacao.cli.
+
+Uso (a partir da raiz do repositório):
+    python -m bonificacao.restauracao --listar
+    python -m bonificacao.restauracao --ate "2026-03-10 18:00" --saida consolidado_10mar.xlsx
+    python -m bonificacao.restauracao --ate "2026-03-10 18:00" --aplicar
+"""
+import argparse
+import logging
+import sys
+from datetime import datetime
+
+from bonificacao.cli import (SAIDA_ERRO, SAIDA_INVALIDOS, SAIDA_OK, SECRETS_PADRAO, carregar_credenciais,
+                             criar_consolidador, criar_consolidador_local, descricao, imprimir_progresso)
+from bonificacao.excel import gerar_xlsx
+from bonificacao.graph import GRAPH_URL
+from bonificacao.historico import fim_do_minuto
+
+logger = logging.getLogger(__name__)
+
+FORMATOS_HORARIO = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def interpretar_horario(texto):
+    """
+    Horário de AAAA-MM-DD [HH:MM[:SS]]; só a data vale até o fim do dia e
+    HH:MM até o fim do minuto, como no histórico do app
+    """
+    for formato in FORMATOS_HORARIO:
+        try:
+            horario = datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+        if formato == "%Y-%m-%d":
+            horario = horario.replace(hour=23, minute=59)
+        if formato != "%Y-%m-%d %H:%M:%S":
+            horario = fim_do_minuto(horario)
+        return horario
+    raise argparse.ArgumentTypeError(f"horário inválido: {texto} (use AAAA-MM-DD HH:MM[:SS])")
+
+
+def imprimir_historico(entradas):
+    for entrada in entradas:
+        tamanho = f"{entrada['tamanho'] / 1024:.0f} KB" if entrada['tamanho'] is not None else "-"
+        print(f"{entrada['horario']:%Y-%m-%d %H:%M:%S}  {entrada['tipo']:<8}  {tamanho:>10}  {entrada['nome']}")
+
+
+def main(argv=None, consolidador=None):
+    parser = argparse.ArgumentParser(description=descricao(__doc__))
+    acao = parser.add_mutually_exclusive_group(required=True)
+    acao.add_argument("--listar", action="store_true", help="lista os snapshots e deltas do histórico")
+    acao.add_argument("--ate", type=interpretar_horario, metavar="'AAAA-MM-DD HH:MM'",
+                      help="reconstrói o consolidado como estava neste horário")
+    parser.add_argument("--saida", help="salva o consolidado reconstruído neste xlsx")
+    parser.add_argument("--aplicar", action="store_true", help="substitui o consolidado pela versão reconstruída")
+    parser.add_argument("--concorrencia", choices=("lock", "otimista"), default="lock")
+    parser.add_argument("--secrets", default=SECRETS_PADRAO, help="secrets.toml com as credenciais")
+    parser.add_argument("--graph-url", default=GRAPH_URL, help="URL base do Graph (ex.: servidor simulado)")
+    parser.add_argument("--local", metavar="DIRETORIO", help="usa um diretório local como drive, sem credenciais")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+
+    if consolidador is None and args.local:
+        consolidador = criar_consolidador_local(args.local, args.concorrencia)
+    elif consolidador is None:
+        try:
+            consolidador = criar_consolidador(carregar_credenciais(args.secrets), args.concorrencia, args.graph_url)
+        except KeyError as e:
+            print(f"Credencial faltando: {e}")
+            return SAIDA_ERRO
+    token = consolidador.obter_token()
+    if not token:
+        print("Erro de autenticação no Microsoft Graph")
+        return SAIDA_ERRO
+
+    if args.listar:
+        entradas = consolidador.historico(token).entradas()
+        if not entradas:
+            print("Histórico vazio")
+            return SAIDA_INVALIDOS
+        imprimir_historico(entradas)
+        return SAIDA_OK
+
+    try:
+        if args.aplicar:
+            print(f"Restaurando o consolidado como estava em {args.ate:%Y-%m-%d %H:%M:%S}...")
+            df, usadas, _ = consolidador.restaurar_consolidado(args.ate, progresso=imprimir_progresso)
+        else:
+            df, usadas = consolidador.historico(token).reconstruir(args.ate)
+    except ValueError as e:
+        print(f"Não é possível restaurar: {e}")
+        return SAIDA_INVALIDOS
+    except Exception as e:
+        print(f"Erro na restauração: {e}")
+        return SAIDA_ERRO
+
+    print(f"Reconstruído a partir de {len(usadas)} backup(s):")
+    imprimir_historico(usadas)
+    print(f"{len(df)} registros")
+    if args.saida:
+        with open(args.saida, "wb") as arquivo:
+            arquivo.write(gerar_xlsx(df))
+        print(f"Salvo em {args.saida}")
+    if args.aplicar:
+        print("Consolidado restaurado")
+    return SAIDA_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Índice de resumo do consolidado por LOJA + MES_ANO.
+
+Um JSON pequeno ao lado do consolidado (resumo_lojas_meses.json) com, para
+cada loja/mês: linhas, somas de R$_TOTAL, das colunas TOTAL_*, de PAGO e
+de A PAGAR, o último DATA_ULTIMO_ENVIO e a impressão do conteúdo
+(bonificacao.impressoes). Responde "quais lojas já enviaram março, quantas
+linhas, qual o total" sem baixar o consolidado, e diz se um reenvio traz
+alguma mudança sem baixá-lo também.
+
+O índice é atualizado a cada consolidação só com as lojas/meses enviados
+(cada envio substitui inteiras as combinações que traz, como no motor). Ele
+guarda a versão do consolidado a que corresponde (o eTag do xlsx, ou a data
+do manifesto das partições): se a versão lida antes do merge não for a do
+índice (gravação manual, falha ao gravar o índice), ele é reconstruído a
+partir do consolidado completo.
+"""
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from bonificacao.esquema import COLUNA_ULTIMO_ENVIO, COLUNAS_OBRIGATORIAS
+from bonificacao.impressoes import impressoes_particoes
+from bonificacao.motor import calcular_mes_ano
+from bonificacao.particoes import chave_particao, normalizar_loja
+
+logger = logging.getLogger(__name__)
+
+ARQUIVO_RESUMO = "resumo_lojas_meses.json"
+VERSAO_RESUMO = 2
+
+COLUNAS_SOMADAS = (['R$_TOTAL'] + [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna.startswith('TOTAL_')]
+                   + ['PAGO', 'A PAGAR'])
+CAMPOS = ['LOJA', 'MES_ANO', 'LINHAS', 'ULTIMO_ENVIO'] + COLUNAS_SOMADAS + ['IMPRESSAO']
+
+
+def resumir(df):
+    """
+    Linhas, somas, último envio e impressão por LOJA + MES_ANO de df
+    Retorna {chave: registro} com registro na ordem de CAMPOS (LOJA nula é ignorada)
+    """
+    if len(df) == 0:
+        return {}
+    mes_ano = df['MES_ANO'] if 'MES_ANO' in df.columns else calcular_mes_ano(df['DATA'])
+    valores = pd.DataFrame({
+        coluna: pd.to_numeric(df[coluna], errors='coerce') if coluna in df.columns else np.nan
+        for coluna in COLUNAS_SOMADAS
+    }, index=df.index)
+    valores['LINHAS'] = 1
+    valores['ULTIMO_ENVIO'] = (pd.to_datetime(df[COLUNA_ULTIMO_ENVIO], errors='coerce')
+                               if COLUNA_ULTIMO_ENVIO in df.columns else pd.NaT)
+
+    agregacoes = dict.fromkeys(COLUNAS_SOMADAS + ['LINHAS'], 'sum')
+    agregacoes['ULTIMO_ENVIO'] = 'max'
+    grupos = valores.groupby([df['LOJA'], np.asarray(mes_ano)], sort=False, observed=True).agg(agregacoes)
+
+    impressoes = impressoes_particoes(df)
+    registros = {}
+    for (loja, mes), linha in zip(grupos.index, grupos.itertuples(index=False)):
+        ultimo = linha.ULTIMO_ENVIO
+        registro = [normalizar_loja(loja), str(mes), int(linha.LINHAS),
+                    None if pd.isna(ultimo) else ultimo.isoformat(timespec='seconds')]
+        registro += [round(float(valor), 2) for valor in linha[:len(COLUNAS_SOMADAS)]]
+        chave = chave_particao(loja, mes)
+        registros[chave] = registro + [impressoes.get(chave)]
+    return registros
+
+
+class ResumoLojasMeses:
+    """
+    Índice de resumo por LOJA + MES_ANO no drive
+    ler_bytes(caminho) retorna os bytes ou None se não existir;
+    gravar_bytes(caminho, conteudo) retorna o item gravado (ou None em falha)
+    """
+
+    def __init__(self, ler_bytes, gravar_bytes):
+        self.ler_bytes = ler_bytes
+        self.gravar_bytes = gravar_bytes
+        self.indice = None
+
+    def carregar(self):
+        """Carrega o índice; retorna None se ainda não existe ou é de outra versão"""
+        conteudo = self.ler_bytes(ARQUIVO_RESUMO)
+        self.indice = None
+        if conteudo is None:
+            return None
+        indice = json.loads(conteudo)
+        if indice.get('versao') != VERSAO_RESUMO or indice.get('campos') != CAMPOS:
+            logger.info("Índice de resumo em formato antigo, será reconstruído")
+            return None
+        indice['registros'] = {chave_particao(r[0], r[1]): r for r in indice['registros']}
+        self.indice = indice
+        return indice
+
+    def corresponde(self, origem):
+        """O índice descreve a versão origem do consolidado"""
+        return self.indice is not None and origem is not None and self.indice.get('origem') == origem
+
+    def reconstruir(self, df, origem):
+        """Índice novo a partir do consolidado completo"""
+        self.indice = {'versao': VERSAO_RESUMO, 'campos': CAMPOS, 'origem': origem, 'atualizado_em': None,
+                       'registros': resumir(df)}
+        logger.info(f"Índice de resumo reconstruído: {len(self.indice['registros'])} lojas/meses")
+
+    def aplicar(self, frames, origem):
+        """Substitui as lojas/meses de cada frame, na ordem (o último envio de uma combinação prevalece)"""
+        for df in frames:
+            self.indice['registros'].update(resumir(df))
+        self.indice['origem'] = origem
+
+    def gravar(self):
+        self.indice['atualizado_em'] = datetime.now().isoformat(timespec='seconds')
+        indice = dict(self.indice, registros=list(self.indice['registros'].values()))
+        conteudo = json.dumps(indice, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        if not self.gravar_bytes(ARQUIVO_RESUMO, conteudo):
+            raise RuntimeError("Falha ao gravar o índice de resumo")
+
+    def tabela(self):
+        """DataFrame do índice, uma linha por loja/mês com as colunas CAMPOS"""
+        tabela = pd.DataFrame(list(self.indice['registros'].values()), columns=CAMPOS)
+        tabela['ULTIMO_ENVIO'] = pd.to_datetime(tabela['ULTIMO_ENVIO'])
+        return tabela
+
+
+def origem_particoes(manifesto):
+    """Versão do armazenamento particionado (última alteração do manifesto), ou None"""
+    return f"particoes:{manifesto['atualizado_em']}" if manifesto else None
@@ -0,0 +1,363 @@
+"""
+Validação das planilhas enviadas (estrutura, datas, lojas e valores).
+
+As regras são declarativas (lista REGRAS_PADRAO): cada uma marca, de forma
+vetorizada, as linhas que a violam. Todas são avaliadas em uma única
+passada sobre o DataFrame, com DATA e as colunas numéricas convertidas uma
+só vez e sem alterar o DataFrame recebido. O resultado é uma tabela com
+as linhas de cada regra violada, além das mensagens de erro e aviso.
+
+Funções puras, sem Streamlit, para que a validação possa rodar fora da
+sessão (processos de leitura em lote, linha de comando).
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from bonificacao.esquema import COLUNAS_OBRIGATORIAS
+
+NIVEL_ERRO = 'erro'
+NIVEL_AVISO = 'aviso'
+
+MESES_FUTURO = 2   # Aceita até 2 meses no futuro
+MESES_PASSADO = 6  # Aceita até 6 meses no passado
+
+VALOR_MINIMO = 0
+# Faixa (mínimo, máximo) aceita por coluna de valor; máximo None = sem limite.
+# Colunas fora daqui só têm valores negativos apontados
+FAIXAS_VALORES = {}
+TOLERANCIA_SOMA = 0.01
+MAX_EXEMPLOS = 5
+
+# Primeira linha de dados no Excel (a linha 1 é o cabeçalho)
+PRIMEIRA_LINHA_EXCEL = 2
+
+
+# ===========================
+# CONTEXTO DA AVALIAÇÃO
+# ===========================
+class ContextoValidacao:
+    """Conversões compartilhadas entre as regras, feitas uma única vez"""
+
+    def __init__(self, df, agora=None):
+        self.df = df
+        agora = agora or datetime.now()
+        self.mes_atual = pd.Timestamp(agora).normalize().replace(day=1)
+        self.mes_anterior = self.mes_atual - relativedelta(months=1)
+        self.limite_futuro = self.mes_atual + relativedelta(months=MESES_FUTURO)
+        self.limite_passado = self.mes_atual - relativedelta(months=MESES_PASSADO)
+        self._datas = None
+        self._numeros = {}
+        self._preenchidos = {}
+
+    @property
+    def datas(self):
+        """DATA como datetime64 (inválidas viram NaT)"""
+        if self._datas is None:
+            coluna = self.df['DATA']
+            if pd.api.types.is_datetime64_any_dtype(coluna):
+                self._datas = coluna
+            else:
+                self._datas = pd.to_datetime(coluna, errors='coerce')
+        return self._datas
+
+    def numero(self, coluna):
+        """Coluna convertida para float (texto não numérico vira NaN)"""
+        if coluna not in self._numeros:
+            serie = self.df[coluna]
+            if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+                valores = serie.to_numpy(dtype='float64', na_value=np.nan)
+            else:
+                try:
+                    # Caminho rápido: texto todo numérico converte direto
+                    valores = serie.astype('float64').to_numpy()
+                except (ValueError, TypeError):
+                    valores = pd.to_numeric(serie, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+            self._numeros[coluna] = valores
+        return self._numeros[coluna]
+
+    def preenchido(self, coluna, candidatas=None):
+        """
+        Células não vazias (texto em branco conta como vazio)
+        candidatas limita a verificação do texto às linhas marcadas
+        """
+        chave = (coluna, candidatas is None)
+        if chave not in self._preenchidos:
+            serie = self.df[coluna]
+            preenchidas = serie.notna().to_numpy()
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                # Só as categorias precisam ser examinadas
+                categorias_em_branco = _em_branco(serie.cat.categories.to_series()).to_numpy(dtype=bool)
+                if categorias_em_branco.any():
+                    codigos = serie.cat.codes.to_numpy()
+                    preenchidas = preenchidas & ~np.isin(codigos, np.flatnonzero(categorias_em_branco))
+            elif serie.dtype == object or pd.api.types.is_string_dtype(serie.dtype):
+                verificar = preenchidas if candidatas is None else preenchidas & candidatas
+                posicoes = np.flatnonzero(verificar)
+                em_branco = _em_branco(serie.iloc[posicoes]).to_numpy(dtype=bool)
+                preenchidas = preenchidas.copy()
+                preenchidas[posicoes[em_branco]] = False
+            if candidatas is not None:
+                return preenchidas
+            self._preenchidos[chave] = preenchidas
+        return self._preenchidos[chave]
+
+
+def _em_branco(serie):
+    """Textos vazios ou só com espaços (valores que não são texto não contam)"""
+    return serie.map(lambda valor: isinstance(valor, str) and not valor.strip())
+
+
+# ===========================
+# REGRAS
+# ===========================
+class Regra:
+    """
+    Regra declarativa de validação
+    condicao(contexto) retorna um array booleano com as linhas que violam a regra
+    mensagem(quantidade, exemplos) monta o texto exibido ao usuário
+    exemplos(contexto, linhas) descreve as primeiras ocorrências (padrão: linhas do Excel)
+    """
+
+    def __init__(self, nome, nivel, colunas, condicao, mensagem, exemplos=None):
+        self.nome = nome
+        self.nivel = nivel
+        self.colunas = tuple(colunas)
+        self.condicao = condicao
+        self.mensagem = mensagem
+        self.exemplos = exemplos or _linhas_excel
+
+
+def _linhas_excel(contexto, linhas):
+    return [str(linha + PRIMEIRA_LINHA_EXCEL) for linha in linhas[:MAX_EXEMPLOS]]
+
+
+def _datas_exemplo(contexto, linhas):
+    return contexto.datas.iloc[linhas[:MAX_EXEMPLOS]].dt.strftime('%d/%m/%Y').tolist()
+
+
+def regra_data_valida():
+    return Regra(
+        'DATA vazia ou inválida', NIVEL_ERRO, ['DATA'],
+        lambda ctx: ctx.datas.isna().to_numpy(),
+        lambda n, ex: f"Encontradas {n} linhas com DATA vazia ou inválida",
+    )
+
+
+def regra_data_futura():
+    return Regra(
+        'DATA muito futura', NIVEL_ERRO, ['DATA'],
+        lambda ctx: (ctx.datas > ctx.limite_futuro).to_numpy(),
+        lambda n, ex: f"⚠️ Encontradas {n} datas muito futuras (mais de {MESES_FUTURO} meses). Exemplos: {', '.join(ex)}",
+        _datas_exemplo,
+    )
+
+
+def regra_data_antiga():
+    return Regra(
+        'DATA antiga', NIVEL_AVISO, ['DATA'],
+        lambda ctx: (ctx.datas < ctx.limite_passado).to_numpy(),
+        lambda n, ex: f"⚠️ Encontradas {n} datas antigas (mais de {MESES_PASSADO} meses atrás). Exemplos: {', '.join(ex)}",
+        _datas_exemplo,
+    )
+
+
+def regra_nao_nula(coluna):
+    return Regra(
+        f'{coluna} vazia', NIVEL_ERRO, [coluna],
+        lambda ctx: ~ctx.preenchido(coluna),
+        lambda n, ex: f"❌ Encontradas {n} linhas sem {coluna} definida",
+    )
+
+
+def regra_numerica(coluna):
+    return Regra(
+        f'{coluna} não numérico', NIVEL_AVISO, [coluna],
+        lambda ctx: _nao_numericos(ctx, coluna),
+        lambda n, ex: f"⚠️ {n} valores não numéricos em {coluna} (linhas {', '.join(ex)})",
+    )
+
+
+def _nao_numericos(ctx, coluna):
+    """Células preenchidas que não viraram número (só as vazias no resultado são examinadas)"""
+    sem_numero = np.isnan(ctx.numero(coluna))
+    if not sem_numero.any():
+        return sem_numero
+    return sem_numero & ctx.preenchido(coluna, candidatas=sem_numero)
+
+
+def regra_faixa(coluna, minimo=VALOR_MINIMO, maximo=None):
+    def condicao(ctx):
+        valores = ctx.numero(coluna)
+        with np.errstate(invalid='ignore'):
+            fora = valores < minimo
+            if maximo is not None:
+                fora |= valores > maximo
+            return fora
+    if maximo is not None:
+        descricao = f"fora da faixa {minimo:,} a {maximo:,}"
+    else:
+        descricao = "negativos" if minimo == 0 else f"abaixo de {minimo:,}"
+    return Regra(
+        f'{coluna} fora da faixa', NIVEL_AVISO, [coluna], condicao,
+        lambda n, ex: f"⚠️ {n} valores de {coluna} {descricao} (linhas {', '.join(ex)})",
+    )
+
+
+def regra_soma(total, parcelas, tolerancia=TOLERANCIA_SOMA):
+    """total = soma das parcelas (células vazias contam como zero)"""
+    def condicao(ctx):
+        colunas = [ctx.numero(total)] + [ctx.numero(parcela) for parcela in parcelas]
+        preenchidas = np.zeros(len(ctx.df), dtype=bool)
+        for valores in colunas:
+            preenchidas |= ~np.isnan(valores)
+        soma = np.zeros(len(ctx.df))
+        for valores in colunas[1:]:
+            soma += np.nan_to_num(valores)
+        return preenchidas & (np.abs(np.nan_to_num(colunas[0]) - soma) > tolerancia)
+    return Regra(
+        f'{total} ≠ {" + ".join(parcelas)}', NIVEL_AVISO, [total, *parcelas], condicao,
+        lambda n, ex: f"⚠️ {n} linhas com {total} diferente de {' + '.join(parcelas)} (linhas {', '.join(ex)})",
+    )
+
+
+def _regras_padrao():
+    regras = [regra_data_valida(), regra_data_futura(), regra_data_antiga(), regra_nao_nula('LOJA')]
+    colunas_valor = [c for c in COLUNAS_OBRIGATORIAS if c.startswith(('R$_', 'TOTAL_'))]
+    regras += [regra_numerica(coluna) for coluna in colunas_valor]
+    regras += [regra_faixa(coluna, *FAIXAS_VALORES.get(coluna, (VALOR_MINIMO, None))) for coluna in colunas_valor]
+    for coluna in COLUNAS_OBRIGATORIAS:
+        if coluna.startswith('TOTAL_'):
+            servico = coluna[len('TOTAL_'):]
+            parcelas = [f'R$_{servico}', f'EXTRA_{servico}']
+            if all(parcela in COLUNAS_OBRIGATORIAS for parcela in parcelas):
+                regras.append(regra_soma(coluna, parcelas))
+    return regras
+
+
+REGRAS_PADRAO = _regras_padrao()
+
+
+def avaliar_regras(df, regras=None, agora=None, contexto=None):
+    """
+    Avalia todas as regras aplicáveis (colunas presentes) em uma passada
+    Retorna um DataFrame com uma linha por regra violada: regra, nivel,
+    quantidade, linhas (posições no DataFrame) e mensagem
+    """
+    regras = REGRAS_PADRAO if regras is None else regras
+    contexto = contexto or ContextoValidacao(df, agora)
+
+    ocorrencias = []
+    for regra in regras:
+        if any(coluna not in df.columns for coluna in regra.colunas):
+            continue
+        linhas = np.flatnonzero(regra.condicao(contexto))
+        if len(linhas) == 0:
+            continue
+        ocorrencias.append({
+            'regra': regra.nome,
+            'nivel': regra.nivel,
+            'quantidade': len(linhas),
+            'linhas': linhas,
+            'mensagem': regra.mensagem(len(linhas), regra.exemplos(contexto, linhas)),
+        })
+
+    return pd.DataFrame(ocorrencias, columns=['regra', 'nivel', 'quantidade', 'linhas', 'mensagem'])
+
+
+def linhas_excel(linhas):
+    """Posições do DataFrame convertidas para números de linha do Excel"""
+    return np.asarray(linhas) + PRIMEIRA_LINHA_EXCEL
+
+
+# ===========================
+# VALIDAÇÃO COMPLETA
+# ===========================
+def validar_estrutura_colunas(df):
+    """Valida a estrutura de colunas do DataFrame"""
+    erros = []
+    avisos = []
+    info = {}
+
+    colunas_usuario = [col for col in df.columns if col != 'DATA_ULTIMO_ENVIO']
+    colunas_faltando = [col for col in COLUNAS_OBRIGATORIAS if col not in df.columns]
+    colunas_novas = [col for col in colunas_usuario if col not in COLUNAS_OBRIGATORIAS]
+
+    info['colunas_usuario'] = colunas_usuario
+    info['colunas_faltando'] = colunas_faltando
+    info['colunas_novas'] = colunas_novas
+
+    if colunas_faltando:
+        erros.append(f"❌ Colunas obrigatórias ausentes: {', '.join(colunas_faltando)}")
+
+    if colunas_novas:
+        avisos.append(f"ℹ️ Novas colunas detectadas: {', '.join(colunas_novas)}")
+
+    return erros, avisos, info
+
+
+def resumir_datas(contexto):
+    """Meses presentes e avisos de mês atual/anterior, a partir das datas já convertidas"""
+    avisos = []
+    datas_validas = contexto.datas.dropna()
+    meses = np.unique(datas_validas.to_numpy().astype('datetime64[M]'))
+    meses_presentes = [str(mes) for mes in np.datetime_as_string(meses, unit='M')]
+
+    info = {
+        'meses_presentes': meses_presentes,
+        'total_meses': len(meses_presentes),
+        'data_minima': datas_validas.min(),
+        'data_maxima': datas_validas.max(),
+        'mes_atual': contexto.mes_atual.strftime('%Y-%m'),
+    }
+
+    if len(meses_presentes) > 1:
+        avisos.append(f"📅 Dados contêm {len(meses_presentes)} meses diferentes: {', '.join(meses_presentes)}")
+    if contexto.mes_atual.strftime('%Y-%m') in meses_presentes:
+        avisos.append(f"✅ Dados contêm informações do mês atual ({contexto.mes_atual.strftime('%m/%Y')})")
+    if contexto.mes_anterior.strftime('%Y-%m') in meses_presentes:
+        avisos.append(f"✅ Dados contêm informações do mês anterior ({contexto.mes_anterior.strftime('%m/%Y')})")
+
+    return avisos, info
+
+
+def avaliar_planilha(df, regras=None, agora=None):
+    """
+    Validação completa dos dados enviados, sem alterar df
+    Retorna: (erros, avisos, info_datas, ocorrencias)
+    """
+    erros, avisos, _ = validar_estrutura_colunas(df)
+    info_datas = {}
+
+    if 'DATA' not in df.columns:
+        erros.append("Coluna DATA não encontrada na planilha")
+    if 'LOJA' not in df.columns:
+        erros.append("❌ Coluna LOJA não encontrada")
+
+    contexto = ContextoValidacao(df, agora)
+    ocorrencias = avaliar_regras(df, regras, contexto=contexto)
+    erros += ocorrencias.loc[ocorrencias['nivel'] == NIVEL_ERRO, 'mensagem'].tolist()
+    avisos += ocorrencias.loc[ocorrencias['nivel'] == NIVEL_AVISO, 'mensagem'].tolist()
+
+    if 'DATA' in df.columns:
+        if contexto.datas.notna().any():
+            avisos_datas, info_datas = resumir_datas(contexto)
+            avisos += avisos_datas
+        else:
+            erros.append("Nenhuma data válida encontrada na planilha")
+
+    if 'LOJA' in df.columns:
+        avisos.append(f"📍 Dados contêm {df['LOJA'].dropna().nunique()} lojas diferentes")
+
+    return erros, avisos, info_datas, ocorrencias
+
+
+def validar_planilha(df):
+    """
+    Validação completa dos dados enviados
+    Retorna: (erros, avisos, info_datas)
+    """
+    erros, avisos, info_datas, _ = avaliar_planilha(df)
+    return erros, avisos, info_datas